@@ -0,0 +1,119 @@
+// Applies the event stream of the dashboard started with --push: the figures are fetched once from
+// /telemetry/<name>/figure.json, then every tick only the new samples are appended with Plotly.extendTraces.
+// Nothing happens when the server doesn't push, the graphs are then updated by the Dash callbacks.
+(function () {
+    const STREAM_URL = "/telemetry/stream";
+    // MET of the last point of every trace, samples already in a freshly fetched figure are not appended again
+    const lastX = {};
+    const loading = {};
+
+    function graphElement(name) {
+        const graph = document.getElementById(name + "-graph");
+        return graph ? graph.querySelector(".js-plotly-plot") : null;
+    }
+
+    function paused() {
+        const button = document.getElementById("start-stop-button");
+        return button !== null && button.textContent === "Resume";
+    }
+
+    function loadFigure(name) {
+        const element = graphElement(name);
+        if (element === null || !window.Plotly || loading[name]) {
+            return;
+        }
+        loading[name] = true;
+        fetch("/telemetry/" + encodeURIComponent(name) + "/figure.json")
+            .then(function (response) { return response.json(); })
+            .then(function (figure) {
+                return Plotly.react(element, figure.data, figure.layout).then(function () {
+                    lastX[name] = figure.data.map(function (trace) {
+                        return trace.x && trace.x.length ? trace.x[trace.x.length - 1] : -Infinity;
+                    });
+                });
+            })
+            .finally(function () { loading[name] = false; });
+    }
+
+    function loadAllFigures() {
+        document.querySelectorAll("[id$='-graph']").forEach(function (graph) {
+            loadFigure(graph.id.slice(0, -"-graph".length));
+        });
+    }
+
+    function extendGraph(name, update) {
+        const element = graphElement(name);
+        if (element === null || lastX[name] === undefined) {
+            loadFigure(name);
+            return;
+        }
+        const x = [];
+        const y = [];
+        const indexes = [];
+        update.y.forEach(function (values, index) {
+            const last = lastX[name][index] === undefined ? -Infinity : lastX[name][index];
+            const start = update.x.findIndex(function (met) { return met > last; });
+            if (start < 0) {
+                return;
+            }
+            x.push(update.x.slice(start));
+            y.push(values.slice(start));
+            indexes.push(index);
+            lastX[name][index] = update.x[update.x.length - 1];
+        });
+        if (!indexes.length) {
+            return;
+        }
+        if (update.max_points) {
+            Plotly.extendTraces(element, {x: x, y: y}, indexes, update.max_points);
+        } else {
+            Plotly.extendTraces(element, {x: x, y: y}, indexes);
+        }
+    }
+
+    function forgetFigures() {
+        // the next update of every graph fetches its figure again
+        Object.keys(lastX).forEach(function (name) { delete lastX[name]; });
+    }
+
+    function connect() {
+        const source = new EventSource(STREAM_URL);
+        source.addEventListener("reset", function () {
+            // the server skipped updates for this client, the figures are fetched again
+            forgetFigures();
+            loadAllFigures();
+        });
+        source.addEventListener("telemetry", function (event) {
+            if (paused()) {
+                // the samples of this update are not drawn, after the pause the figures have a gap to fill
+                forgetFigures();
+                return;
+            }
+            const message = JSON.parse(event.data);
+            Object.keys(message.graphs).forEach(function (name) {
+                const update = message.graphs[name];
+                if (update.reset) {
+                    delete lastX[name];
+                    loadFigure(name);
+                } else {
+                    extendGraph(name, update);
+                }
+            });
+        });
+        source.onerror = function () {
+            // the dashboard without --push has no stream, don't retry forever
+            if (source.readyState === EventSource.CLOSED) {
+                return;
+            }
+            fetch(STREAM_URL, {method: "HEAD"}).then(function (response) {
+                if (response.status === 404) {
+                    source.close();
+                }
+            });
+        };
+    }
+
+    if (window.EventSource) {
+        window.addEventListener("load", connect);
+    }
+})();
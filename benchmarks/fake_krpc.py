@@ -0,0 +1,234 @@
+import math
+from typing import Callable, Any, List
+
+import numpy as np
+
+KERBIN_RADIUS = 600000.0
+KERBIN_ROTATION_SPEED = 174.9
+SCALE_HEIGHT = 5600.0
+ORBIT_ALTITUDE = 80000.0
+ASCENT_SECS = 300.0
+ORBITAL_SPEED = 2279.0
+
+
+# Synthetic launch to a circular 80 km Kerbin orbit: gravity turn ascent for ASCENT_SECS, then coast.
+# Every value is a function of the MET plus some deterministic noise, so benchmark runs are reproducible.
+class FlightProfile:
+    def __init__(self, seed: int = 0):
+        self._random = np.random.default_rng(seed)
+        self.met = 0.0
+
+    def advance(self, secs: float) -> None:
+        self.met += secs
+
+    def noise(self, scale: float) -> float:
+        return float(self._random.normal(0, scale))
+
+    @property
+    def _ascent(self) -> float:
+        return min(self.met / ASCENT_SECS, 1.0)
+
+    @property
+    def altitude(self) -> float:
+        return ORBIT_ALTITUDE * (1 - math.cos(math.pi * self._ascent)) / 2
+
+    @property
+    def mean_altitude(self) -> float:
+        return self.altitude
+
+    @property
+    def mass(self) -> float:
+        # fuel burns at a constant rate during the ascent
+        return 20000.0 - 12000.0 * self._ascent
+
+    @property
+    def thrust(self) -> float:
+        if self.met >= ASCENT_SECS:
+            return 0.0
+        return self.mass * 9.81 * (1.8 if self.met % (ASCENT_SECS / 3) > 2 else 0.2)
+
+    @property
+    def vertical_speed(self) -> float:
+        if self.met >= ASCENT_SECS:
+            return self.noise(0.5)
+        return ORBIT_ALTITUDE * math.pi / (2 * ASCENT_SECS) * math.sin(math.pi * self._ascent)
+
+    @property
+    def horizontal_speed(self) -> float:
+        return (ORBITAL_SPEED - KERBIN_ROTATION_SPEED) * self._ascent ** 2
+
+    @property
+    def surface_speed(self) -> float:
+        return math.hypot(self.horizontal_speed, self.vertical_speed)
+
+    @property
+    def orbital_speed(self) -> float:
+        return self.surface_speed + KERBIN_ROTATION_SPEED
+
+    @property
+    def atmosphere_density(self) -> float:
+        return 1.225 * math.exp(-self.altitude / SCALE_HEIGHT) if self.altitude < 70000 else 0.0
+
+    @property
+    def static_pressure(self) -> float:
+        return 101325 * math.exp(-self.altitude / SCALE_HEIGHT) if self.altitude < 70000 else 0.0
+
+    @property
+    def dynamic_pressure(self) -> float:
+        return 0.5 * self.atmosphere_density * self.surface_speed ** 2
+
+    @property
+    def g_force(self) -> float:
+        if self.met >= ASCENT_SECS:
+            return abs(self.noise(0.001))
+        # staging at one third of the ascent
+        thrust = 1.8 if self.met % (ASCENT_SECS / 3) > 2 else 0.2
+        return thrust + self._ascent + self.noise(0.02)
+
+    @property
+    def apoapsis_altitude(self) -> float:
+        return ORBIT_ALTITUDE * self._ascent ** 0.5 + self.noise(5)
+
+    @property
+    def periapsis_altitude(self) -> float:
+        return -KERBIN_RADIUS + (KERBIN_RADIUS + ORBIT_ALTITUDE) * self._ascent ** 3 + self.noise(5)
+
+    @property
+    def aerodynamic_force(self) -> tuple:
+        drag = self.dynamic_pressure * 0.8
+        return self.noise(drag * 0.01), -drag, self.noise(drag * 0.01)
+
+    @property
+    def center_of_mass(self) -> tuple:
+        return 0.0, -2.0 + 1.5 * self._ascent, 0.0
+
+
+class FakeReferenceFrame:
+    pass
+
+
+class FakeBody:
+    def __init__(self):
+        self.reference_frame = FakeReferenceFrame()
+
+
+# The objects below expose the attributes KrpcTelemetryStreamFactory streams, reading them from the profile
+class FakeOrbit:
+    def __init__(self, profile: FlightProfile):
+        self._profile = profile
+        self.body = FakeBody()
+
+    @property
+    def speed(self) -> float:
+        return self._profile.orbital_speed
+
+    @property
+    def apoapsis_altitude(self) -> float:
+        return self._profile.apoapsis_altitude
+
+    @property
+    def periapsis_altitude(self) -> float:
+        return self._profile.periapsis_altitude
+
+
+class FakeFlight:
+    def __init__(self, profile: FlightProfile):
+        self._profile = profile
+
+    @property
+    def speed(self) -> float:
+        return self._profile.surface_speed
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._profile, name)
+
+
+class FakeVessel:
+    def __init__(self, profile: FlightProfile, name: str = "Fake Vessel"):
+        self._profile = profile
+        self.name = name
+        self.orbit = FakeOrbit(profile)
+        self.reference_frame = FakeReferenceFrame()
+
+    @property
+    def met(self) -> float:
+        return self._profile.met
+
+    @property
+    def mass(self) -> float:
+        return self._profile.mass
+
+    @property
+    def thrust(self) -> float:
+        return self._profile.thrust
+
+    def flight(self, reference_frame: FakeReferenceFrame) -> FakeFlight:
+        return FakeFlight(self._profile)
+
+
+class FakeStream:
+    def __init__(self, function: Callable[[], Any]):
+        self._function = function
+        self._callbacks: List[Callable[[Any], None]] = []
+        self.rate = 0.0
+        self.started = False
+
+    def start(self, wait: bool = True) -> None:
+        self.started = True
+
+    def add_callback(self, callback: Callable[[Any], None]) -> None:
+        self._callbacks.append(callback)
+
+    def remove_callback(self, callback: Callable[[Any], None]) -> None:
+        self._callbacks.remove(callback)
+
+    def notify(self) -> None:
+        if self._callbacks:
+            value = self._function()
+            for callback in self._callbacks:
+                callback(value)
+
+    def __call__(self) -> Any:
+        return self._function()
+
+    def remove(self) -> None:
+        self.started = False
+
+
+class FakeSpaceCenter:
+    def __init__(self, vessels: List[FakeVessel]):
+        self.vessels = vessels
+        self.active_vessel = vessels[0]
+
+
+# Stand-in for a krpc Client: add_stream returns streams evaluated on the synthetic flight profiles, add_vessel puts
+# more vessels in flight like staging does
+class FakeKrpcConnection:
+    def __init__(self, profile: FlightProfile | None = None):
+        self.profile = profile or FlightProfile()
+        self.vessel = FakeVessel(self.profile)
+        self.space_center = FakeSpaceCenter([self.vessel])
+        # every add_stream call, the server would return the same stream for the same call
+        self.stream_calls = 0
+        self._streams: List[FakeStream] = []
+
+    def add_vessel(self, name: str, profile: FlightProfile | None = None) -> FakeVessel:
+        vessel = FakeVessel(profile or FlightProfile(len(self.space_center.vessels)), name)
+        self.space_center.vessels = self.space_center.vessels + [vessel]
+        return vessel
+
+    def add_stream(self, function: Callable, *args: Any) -> FakeStream:
+        stream = FakeStream(lambda: function(*args))
+        self.stream_calls += 1
+        self._streams.append(stream)
+        return stream
+
+    @property
+    def open_streams(self) -> int:
+        return sum(1 for stream in self._streams if stream.started)
+
+    def tick(self, secs: float) -> None:
+        for profile in dict.fromkeys(vessel._profile for vessel in self.space_center.vessels):
+            profile.advance(secs)
+        for stream in self._streams:
+            stream.notify()
@@ -0,0 +1,332 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+from time import perf_counter, sleep
+from typing import Dict, Any, List
+
+from benchmarks.fake_krpc import FakeKrpcConnection
+from krpc_telemetry.dashboard import init_dashboard
+from krpc_telemetry.krpc_streams import KrpcTelemetryStreamFactory, init_streams_from_telemetry_processor
+from krpc_telemetry.processor_builder import TelemetryProcessorBuilder
+from krpc_telemetry.push import BroadcastHub
+from krpc_telemetry.telemetry.processor import TelemetryProcessor
+from krpc_telemetry.telemetry.render_pool import RenderPool
+from krpc_telemetry.telemetry.rollup import TelemetryRollup
+from krpc_telemetry.telemetry.storage import ColumnarStorage
+from krpc_telemetry.vessels import MultiVesselTelemetry, VesselSelector
+
+# What the application does before it can collect the first sample, in a fresh interpreter. Prints the resident
+# memory, read from /proc: the peak of getrusage() would include the benchmark process it was forked from
+STARTUP_SCRIPT = """
+import json, sys
+from krpc_telemetry.processor_builder import TelemetryProcessorBuilder
+from krpc_telemetry.krpc_streams import KrpcTelemetryStreamFactory
+processor = TelemetryProcessorBuilder.build_processor(json.loads(sys.argv[2]))
+if sys.argv[1] == "headless":
+    from krpc_telemetry.http_api import TelemetryHttpApi
+    TelemetryHttpApi(processor)
+else:
+    from krpc_telemetry.dashboard import init_dashboard
+    init_dashboard(processor)
+with open("/proc/self/status") as status:
+    print(next(line.split()[1] for line in status if line.startswith("VmRSS:")))
+"""
+
+ALL_TELEMETRY = ["orbital_velocity", "surface_velocity", "orbit_apo_peri", "gforce", "atm_pressure", "aero_force",
+                 "center_mass"]
+
+
+def build_config(downsampling: Dict[str, Any] | None = None, rollup: Dict[str, Any] | None = None,
+                 compression: Dict[str, Any] | None = None) -> Dict[str, Any]:
+    telemetry = []
+    for name in ALL_TELEMETRY:
+        entry = {"name": name}
+        if downsampling is not None:
+            entry["downsampling"] = downsampling
+        if rollup is not None:
+            entry["rollup"] = rollup
+        if compression is not None:
+            entry["compression"] = compression
+        telemetry.append(entry)
+    return {"telemetry": telemetry}
+
+
+# A processor fed by the real stream factory and collection on top of the fake kRPC connection
+class SyntheticFlight:
+    def __init__(self, config: Dict[str, Any], rate: float = 1):
+        self.connection = FakeKrpcConnection()
+        self.processor = TelemetryProcessorBuilder.build_processor(config)
+        factory = KrpcTelemetryStreamFactory(self.connection.vessel, self.connection, rate)
+        self.collection = init_streams_from_telemetry_processor(self.processor, factory)
+        self._rate = rate
+
+    def collect(self) -> Dict[str, Any]:
+        self.connection.tick(1 / self._rate)
+        return self.collection.collect_data()
+
+    def step(self) -> None:
+        self.processor.process_telemetry_data(self.collect())
+
+    def run(self, samples: int) -> TelemetryProcessor:
+        for _ in range(samples):
+            self.step()
+        return self.processor
+
+
+def result(name: str, value: float, unit: str, **params: Any) -> Dict[str, Any]:
+    return {"name": name, "params": params, "value": value, "unit": unit}
+
+
+def bench_throughput(samples: int) -> List[Dict[str, Any]]:
+    results = []
+    for label, config in (("raw", build_config()), ("lttb", build_config({"algorithm": "lttb"})),
+                          ("rollup", build_config(rollup={})), ("compressed", build_config(compression={})),
+                          ("metrics", dict(build_config(), metrics={}))):
+        flight = SyntheticFlight(config)
+        data = [flight.collect() for _ in range(samples)]
+
+        start = perf_counter()
+        for sample in data:
+            flight.processor.process_telemetry_data(sample)
+        elapsed = perf_counter() - start
+        results.append(result("process_telemetry_data", samples / elapsed, "samples/s",
+                              strategies=len(ALL_TELEMETRY), samples=samples, plot=label))
+    return results
+
+
+def bench_rollup_update(samples: int, columns: int = 6) -> List[Dict[str, Any]]:
+    # the storage of one strategy alone, then with the default rollup tiers updated after every append
+    data = [(float(met), {"c%d" % column: met * (column + 1) % 97 for column in range(columns)})
+            for met in range(samples)]
+    results = []
+    for label in ("raw", "rollup"):
+        storage = ColumnarStorage()
+        rollup = TelemetryRollup() if label == "rollup" else None
+        start = perf_counter()
+        for met, values in data:
+            storage.append(met, values)
+            if rollup is not None:
+                rollup.update(storage)
+        elapsed = perf_counter() - start
+        results.append(result("rollup_update", samples / elapsed, "samples/s", columns=columns, samples=samples,
+                              history=label))
+    return results
+
+
+def bench_memory_per_hour(hours: int = 4) -> List[Dict[str, Any]]:
+    # a few hours, compression and rollup only kick in on the older samples
+    results = []
+    for label, config in (("raw", build_config()), ("rollup", build_config(rollup={})),
+                          ("compressed", build_config(compression={}))):
+        processor = SyntheticFlight(config).run(3600 * hours)
+        history_bytes = 0
+        for strategy in processor.strategies:
+            history_bytes += strategy.storage.nbytes
+            if strategy.rollup is not None:
+                history_bytes += sum(tier.storage.nbytes for tier in strategy.rollup.tiers)
+        results.append(result("history_memory", history_bytes / hours, "bytes/hour", rate_hz=1,
+                              strategies=len(ALL_TELEMETRY), hours=hours, history=label))
+    return results
+
+
+def bench_startup(repeat: int) -> List[Dict[str, Any]]:
+    results = []
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    config = json.dumps(build_config())
+    for mode in ("headless", "dashboard"):
+        timings = []
+        rss = []
+        for _ in range(repeat):
+            start = perf_counter()
+            output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT, mode, config], cwd=root, check=True,
+                                    capture_output=True, text=True).stdout
+            timings.append(perf_counter() - start)
+            # kilobytes on Linux
+            rss.append(int(output.split()[-1]) * 1024)
+        results.append(result("startup_time", median(timings) * 1000, "ms", mode=mode))
+        results.append(result("startup_rss", median(rss), "bytes", mode=mode))
+    return results
+
+
+def bench_plot_latency(lengths: List[int], repeat: int) -> List[Dict[str, Any]]:
+    results = []
+    for label, config in (("raw", build_config()), ("lttb", build_config({"algorithm": "lttb"})),
+                          ("min_max", build_config({"algorithm": "min_max"}))):
+        config["telemetry"] = [entry for entry in config["telemetry"] if entry["name"] == "surface_velocity"]
+        for length in lengths:
+            flight = SyntheticFlight(config)
+            flight.run(length)
+            timings = []
+            cached_timings = []
+            for _ in range(repeat):
+                # every call sees a new sample, as the dashboard does on each tick
+                flight.step()
+                start = perf_counter()
+                flight.processor.get_telemetry_plot_json("surface_velocity")
+                timings.append(perf_counter() - start)
+                # a second client asking before the next sample gets the cached payload
+                start = perf_counter()
+                flight.processor.get_telemetry_plot_json("surface_velocity")
+                cached_timings.append(perf_counter() - start)
+            results.append(result("get_telemetry_plot", median(timings) * 1000, "ms",
+                                  history=length, plot=label))
+            results.append(result("get_telemetry_plot_cached", median(cached_timings) * 1000, "ms",
+                                  history=length, plot=label))
+    return results
+
+
+def bench_dashboard_callback(history: int, repeat: int) -> List[Dict[str, Any]]:
+    results = []
+    for incremental in (False, True):
+        flight = SyntheticFlight(build_config({"algorithm": "lttb"}))
+        app = init_dashboard(flight.run(history), incremental)
+        client = app.server.test_client()
+        output, callback = next((output, callback) for output, callback in app.callback_map.items()
+                                if callback["inputs"][0]["id"] == "interval-component")
+        outputs = [{"id": item.component_id, "property": item.component_property} for item in callback["output"]]
+        # what the browser keeps between ticks: the cursors of the incremental mode, the figure versions otherwise
+        store = "graph-cursors" if incremental else "graph-versions"
+        stored = None
+        timings = []
+        for tick in range(repeat):
+            flight.step()
+            body = {
+                "output": output,
+                "outputs": outputs,
+                "inputs": [{"id": "interval-component", "property": "n_intervals", "value": tick}],
+                "changedPropIds": ["interval-component.n_intervals"],
+                "state": [{"id": store, "property": "data", "value": stored}]
+            }
+            start = perf_counter()
+            response = client.post("/_dash-update-component", json=body)
+            timings.append(perf_counter() - start)
+            if response.status_code == 200:
+                stored = json.loads(response.data)["response"].get(store, {}).get("data", stored)
+        results.append(result("dashboard_tick", median(timings) * 1000, "ms", history=history,
+                              graphs=len(ALL_TELEMETRY), incremental=incremental))
+    return results
+
+
+def bench_push_fanout(history: int, repeat: int) -> List[Dict[str, Any]]:
+    # the delta of a tick is serialized once whatever the number of clients, each client only costs a queue put
+    results = []
+    for clients in (1, 50):
+        flight = SyntheticFlight(build_config({"algorithm": "lttb"}))
+        hub = BroadcastHub(flight.run(history), client_queue_size=repeat + 1)
+        subscribers = [hub.subscribe() for _ in range(clients)]
+        timings = []
+        for _ in range(repeat):
+            flight.step()
+            start = perf_counter()
+            hub.publish(flight.processor.snapshot())
+            timings.append(perf_counter() - start)
+        for subscriber in subscribers:
+            hub.unsubscribe(subscriber)
+        results.append(result("push_tick", median(timings) * 1000, "ms", history=history,
+                              graphs=len(ALL_TELEMETRY), clients=clients))
+    return results
+
+
+def bench_multi_vessel(repeat: int) -> List[Dict[str, Any]]:
+    # one collection pass over every tracked vessel, on the single collection thread
+    results = []
+    for vessels in (1, 10):
+        connection = FakeKrpcConnection()
+        for index in range(1, vessels):
+            connection.add_vessel("Relay %d" % index)
+        tracker = MultiVesselTelemetry(connection, build_config(),
+                                       [VesselSelector(active=True), VesselSelector(name_pattern="*")])
+        tracker.discover()
+        timings = []
+        for _ in range(repeat):
+            connection.tick(1)
+            start = perf_counter()
+            tracker.collect()
+            timings.append(perf_counter() - start)
+        results.append(result("multi_vessel_collect", median(timings) * 1000, "ms", vessels=vessels,
+                              streams=len(tracker.pool), strategies=len(ALL_TELEMETRY)))
+    return results
+
+
+def bench_render_offload(history: int, ticks: int = 100, interval_secs: float = 0.02,
+                         renderers: int = 4) -> List[Dict[str, Any]]:
+    # lateness of the collection ticks while renderer threads rebuild every figure as fast as they can, like
+    # dashboards refreshing on a history that changes every tick
+    results = []
+    for pool in (False, True):
+        flight = SyntheticFlight(build_config())
+        processor = flight.run(history)
+        if pool:
+            processor.set_render_pool(RenderPool())
+            processor.start_outputs()
+        running = True
+
+        def render():
+            while running:
+                for strategy in processor.strategies:
+                    processor.get_telemetry_plot_json(strategy.name)
+
+        threads = [threading.Thread(target=render) for _ in range(renderers)]
+        for thread in threads:
+            thread.start()
+        lateness = []
+        next_tick = perf_counter()
+        for _ in range(ticks):
+            next_tick += interval_secs
+            delay = next_tick - perf_counter()
+            if delay > 0:
+                sleep(delay)
+            lateness.append(perf_counter() - next_tick)
+            flight.step()
+        running = False
+        for thread in threads:
+            thread.join()
+        processor.stop_outputs()
+        lateness.sort()
+        for label, value in (("p50", lateness[len(lateness) // 2]), ("p95", lateness[int(len(lateness) * 0.95)])):
+            results.append(result("collection_tick_lateness", value * 1000, "ms", history=history,
+                                  renderers=renderers, render_pool=pool, percentile=label))
+    return results
+
+
+def median(values: List[float]) -> float:
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='run_benchmarks', description="KRPC telemetry hot path benchmarks")
+    parser.add_argument("--output", type=str, help="Write the JSON results to this file instead of stdout")
+    parser.add_argument("--samples", type=int, default=20000, help="Samples for the throughput benchmark")
+    parser.add_argument("--repeat", type=int, default=10, help="Repetitions of the latency benchmarks")
+    parser.add_argument("--quick", action="store_true", help="Smaller histories, for a fast check")
+    args = parser.parse_args()
+
+    lengths = [1000, 10000] if args.quick else [1000, 10000, 100000]
+    gc.collect()
+    report = {
+        "environment": {"python": sys.version.split()[0], "platform": platform.platform()},
+        "results": [
+            *bench_throughput(args.samples),
+            *bench_rollup_update(args.samples),
+            *bench_memory_per_hour(),
+            *bench_startup(3 if args.quick else args.repeat),
+            *bench_plot_latency(lengths, args.repeat),
+            *bench_dashboard_callback(lengths[-1], args.repeat),
+            *bench_push_fanout(lengths[-1], args.repeat),
+            *bench_multi_vessel(args.repeat),
+            *bench_render_offload(lengths[-1]),
+        ]
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output)
+    else:
+        print(output)
@@ -1,40 +1,136 @@
 import argparse
 import json
+from time import sleep
 
-import pandas as pd
 import krpc
 
-from krpc_telemetry.dashboard import init_dashboard
-from krpc_telemetry.krpc_streams import KrpcTelemetryStreamFactory, init_streams_from_telemetry_processor
+from krpc_telemetry.krpc_streams import KrpcTelemetryStreamFactory, init_streams_from_telemetry_processor, \
+    CollectionMode, create_stream_definitions
 from krpc_telemetry.processor_builder import TelemetryProcessorBuilder
 
-pd.options.plotting.backend = "plotly"
-
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(prog='krpc_telemetry', description="Simple Kerbal Telemetry using KRPC")
     parser.add_argument("config", type=open, help="KRPC telemetry configuration file")
     parser.add_argument("--address", type=str, help="KRPC server address", default="localhost")
     parser.add_argument("--rpc-port", type=int, help="KRPC server port", default=50000)
     parser.add_argument("--streaming-port", type=int, help="KRPC server port", default=50001)
+    parser.add_argument("--incremental", action="store_true",
+                        help="Send only the new samples to the dashboard instead of the whole graphs every second")
+    parser.add_argument("--replay", type=str,
+                        help="Replay a recorded flight (segment file or directory) instead of connecting to KRPC")
+    parser.add_argument("--replay-speed", type=float, default=1,
+                        help="Replay time acceleration, 0 replays as fast as possible")
+    parser.add_argument("--replay-flight", type=str,
+                        help="Flight of the replay directory to play (flight-YYYYMMDD-HHMMSS), the latest by default")
+    parser.add_argument("--push", action="store_true",
+                        help="Stream the new samples to the browsers over Server-Sent Events instead of polling")
+    parser.add_argument("--headless", action="store_true",
+                        help="Record and serve the telemetry HTTP API without the Dash dashboard")
+    parser.add_argument("--http-host", type=str, default="localhost", help="Address of the headless HTTP API")
+    parser.add_argument("--http-port", type=int, default=8050, help="Port of the headless HTTP API")
     args = parser.parse_args()
 
     config = json.load(args.config)
+    collection_config = config.get("collection", dict())
+    interval_secs = collection_config.get("interval_secs", 1)
+    # channels are telemetry types or streams declared in the configuration
+    rates = {
+        name: channel.get("rate")
+        for name, channel in collection_config.get("channels", dict()).items() if channel.get("rate") is not None
+    }
+    adaptive_rates = {
+        name: {
+            key: channel.get(key) for key in ("fast_rate", "fast_change", "hold_secs") if key in channel
+        }
+        for name, channel in collection_config.get("channels", dict()).items()
+        if channel.get("fast_rate") is not None
+    }
+    streams = create_stream_definitions(collection_config.get("streams", dict()))
 
-    conn = krpc.connect(name='KRPC-Telemetry', address=args.address,
-                        rpc_port=args.rpc_port, stream_port=args.streaming_port)
+    if config.get("vessels") is not None:
+        # a processor per vessel, collected by the vessels thread instead of a processor thread each
+        if args.replay or args.push:
+            parser.error("--replay and --push are not available with the vessels configuration")
+        from krpc_telemetry.vessels import MultiVesselTelemetry, create_selectors
 
-    try:
-        vessel = conn.space_center.active_vessel
-    except ValueError:
-        print("No active vessel for telemetry recording, exiting")
-        exit(1)
+        conn = krpc.connect(name='KRPC-Telemetry', address=args.address,
+                            rpc_port=args.rpc_port, stream_port=args.streaming_port)
+        vessels_config = dict(config.get("vessels"))
+        vessels_telemetry = MultiVesselTelemetry(conn, config, create_selectors(vessels_config.pop("track", [])),
+                                                 interval_secs, default_rate=collection_config.get("default_rate"),
+                                                 rates=rates, adaptive_rates=adaptive_rates, streams=streams,
+                                                 **vessels_config)
+        vessels_telemetry.start()
+        try:
+            if args.headless:
+                from krpc_telemetry.http_api import VesselsHttpApi, serve_http_api
+
+                server = serve_http_api(VesselsHttpApi(vessels_telemetry), args.http_host, args.http_port)
+                print("Serving the telemetry API on http://%s:%d/vessels" % server.server_address[:2])
+                try:
+                    while True:
+                        sleep(1)
+                except KeyboardInterrupt:
+                    server.shutdown()
+            else:
+                from krpc_telemetry.dashboard import init_vessels_dashboard
+
+                init_vessels_dashboard(vessels_telemetry).run(debug=True, use_reloader=False)
+        finally:
+            vessels_telemetry.stop()
+            print("exiting")
+        exit(0)
 
-    krpc_telemetry_factory = KrpcTelemetryStreamFactory(vessel, conn)
     telemetry_processor = TelemetryProcessorBuilder.build_processor(config)
-    telemetry_collection = init_streams_from_telemetry_processor(telemetry_processor, krpc_telemetry_factory)
+
+    if args.replay:
+        # pyarrow is only needed to read the recording
+        from krpc_telemetry.replay import init_replay_from_telemetry_processor
+
+        telemetry_collection = init_replay_from_telemetry_processor(telemetry_processor, args.replay,
+                                                                    args.replay_speed, args.replay_flight)
+    else:
+        conn = krpc.connect(name='KRPC-Telemetry', address=args.address,
+                            rpc_port=args.rpc_port, stream_port=args.streaming_port)
+
+        try:
+            vessel = conn.space_center.active_vessel
+        except ValueError:
+            print("No active vessel for telemetry recording, exiting")
+            exit(1)
+
+        krpc_telemetry_factory = KrpcTelemetryStreamFactory(vessel, conn,
+                                                            collection_config.get("default_rate", 1 / interval_secs),
+                                                            rates, adaptive_rates, streams)
+        telemetry_collection = init_streams_from_telemetry_processor(
+            telemetry_processor, krpc_telemetry_factory, interval_secs,
+            CollectionMode(collection_config.get("mode", CollectionMode.POLL)))
+
     telemetry_processor.start_processor_thread(telemetry_collection)
+    hub = None
+    if args.push:
+        from krpc_telemetry.push import BroadcastHub
+
+        hub = BroadcastHub(telemetry_processor)
+        hub.start()
     try:
-        init_dashboard(telemetry_processor).run(debug=True, use_reloader=False)
+        if args.headless:
+            from krpc_telemetry.http_api import TelemetryHttpApi, serve_http_api
+
+            server = serve_http_api(TelemetryHttpApi(telemetry_processor), args.http_host, args.http_port, hub)
+            print("Serving the telemetry API on http://%s:%d/telemetry" % server.server_address[:2])
+            try:
+                while True:
+                    sleep(1)
+            except KeyboardInterrupt:
+                server.shutdown()
+        else:
+            # dash, plotly and pandas are the bulk of the startup time, a headless recorder never loads them
+            from krpc_telemetry.dashboard import init_dashboard
+
+            init_dashboard(telemetry_processor, args.incremental, hub).run(debug=True, use_reloader=False)
     finally:
+        if hub is not None:
+            hub.stop()
         telemetry_processor.stop_processor_thread()
         print("exiting")
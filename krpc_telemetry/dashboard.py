@@ -1,15 +1,109 @@
-from typing import List
+import json
+from time import perf_counter
+from typing import List, Any, Tuple, Callable
 
-from dash import Dash, html, dcc, Output, Input
+from dash import Dash, html, dcc, Output, Input, State, no_update
+from flask import Response, request
 
+from krpc_telemetry.http_api import TelemetryHttpApi, VesselsHttpApi
+from krpc_telemetry.push import BroadcastHub, STREAM_PATH
 from krpc_telemetry.telemetry.processor import TelemetryProcessor
-
-
-def add_update_graph_callback(app: Dash, telemetry_processor: TelemetryProcessor, graph_name: str):
-    @app.callback(Output('%s-graph' % graph_name, 'figure'),
-                  Input('interval-component', 'n_intervals'))
-    def update_graph_live(n):
-        return telemetry_processor.get_telemetry_plot(graph_name)
+from krpc_telemetry.telemetry.strategy import TelemetryStrategy, StrategySnapshot
+from krpc_telemetry.vessels import MultiVesselTelemetry
+
+
+def add_update_graphs_callback(app: Dash, telemetry_processor: TelemetryProcessor):
+    graph_names = [strategy.name for strategy in telemetry_processor.strategies]
+
+    @app.callback([Output('%s-graph' % graph_name, 'figure') for graph_name in graph_names] +
+                  [Output('graph-versions', 'data')],
+                  Input('interval-component', 'n_intervals'),
+                  State('graph-versions', 'data'))
+    def update_graphs_live(n, versions):
+        start = perf_counter()
+        versions = dict(versions or {})
+        versions_changed = False
+        figures = []
+        snapshot = telemetry_processor.snapshot()
+        for graph_name in graph_names:
+            strategy_snapshot = snapshot.strategies[graph_name]
+            if versions.get(graph_name) == strategy_snapshot.version:
+                figures.append(no_update)
+                continue
+            # the JSON cached for this data version, it is built and serialized once however many clients ask
+            figures.append(json.loads(telemetry_processor.render_telemetry_plot_json(
+                telemetry_processor.get_strategy(graph_name), strategy_snapshot)))
+            versions[graph_name] = strategy_snapshot.version
+            versions_changed = True
+        if telemetry_processor.metrics is not None:
+            telemetry_processor.metrics.observe("dashboard_callback_seconds", perf_counter() - start, mode="full")
+        return figures + [versions if versions_changed else no_update]
+
+
+def add_incremental_update_graphs_callback(app: Dash, telemetry_processor: TelemetryProcessor):
+    graph_names = [strategy.name for strategy in telemetry_processor.strategies]
+
+    @app.callback([Output('%s-graph' % graph_name, 'figure') for graph_name in graph_names] +
+                  [Output('%s-graph' % graph_name, 'extendData') for graph_name in graph_names] +
+                  [Output('graph-cursors', 'data')],
+                  Input('interval-component', 'n_intervals'),
+                  State('graph-cursors', 'data'))
+    def update_graphs_incremental(n, cursors):
+        start = perf_counter()
+        cursors = dict(cursors or {})
+        cursors_changed = False
+        figures = []
+        updates = []
+        snapshot = telemetry_processor.snapshot()
+        for graph_name in graph_names:
+            figure, update, cursor = get_incremental_graph_update(
+                telemetry_processor.get_strategy(graph_name), snapshot.strategies[graph_name],
+                cursors.get(graph_name), telemetry_processor)
+            figures.append(figure)
+            updates.append(update)
+            if cursor is not no_update:
+                cursors[graph_name] = cursor
+                cursors_changed = True
+        if telemetry_processor.metrics is not None:
+            telemetry_processor.metrics.observe("dashboard_callback_seconds", perf_counter() - start,
+                                                mode="incremental")
+        return figures + updates + [cursors if cursors_changed else no_update]
+
+
+def get_incremental_graph_update(strategy: TelemetryStrategy, snapshot: StrategySnapshot,
+                                 cursor: dict | None,
+                                 telemetry_processor: TelemetryProcessor | None = None) -> Tuple[Any, Any, Any]:
+    storage = snapshot.view
+    if not len(storage):
+        return no_update, no_update, no_update
+
+    # the client needs the whole figure when it has none yet, when the traces changed, when MET went back, when
+    # the downsampled points or the rollup tier got replaced or when the raw samples sent since the last figure
+    # went over the budget
+    if cursor is None or cursor["columns"] != storage.columns or cursor["met"] > storage.last_met or \
+            cursor["revision"] != snapshot.plot_revision or \
+            (strategy.max_plot_points is not None and cursor["sent"] > strategy.max_plot_points):
+        # the processor builds the figure in its render pool, if it has one
+        figure = strategy.get_telemetry_plot(snapshot) if telemetry_processor is None else \
+            telemetry_processor.render_telemetry_plot(strategy, snapshot)
+        return figure, no_update, {
+            "met": storage.last_met,
+            "columns": storage.columns,
+            "revision": snapshot.plot_revision,
+            "sent": 0
+        }
+
+    met, columns = storage.since(cursor["met"])
+    if not len(met):
+        return no_update, no_update, no_update
+
+    extend_data = dict(x=[met] * len(columns), y=list(columns.values()))
+    trace_indexes = list(range(len(columns)))
+    if storage.max_samples is not None and strategy.max_plot_points is None:
+        update = [extend_data, trace_indexes, storage.max_samples]
+    else:
+        update = [extend_data, trace_indexes]
+    return no_update, update, dict(cursor, met=float(met[-1]), sent=cursor["sent"] + len(met))
 
 
 def add_graph_html_block(graph_name: str, graph_title) -> html.Div:
@@ -21,43 +115,125 @@ def add_graph_html_block(graph_name: str, graph_title) -> html.Div:
     ], className="basis-1/2 w-1/2")
 
 
-def create_graphs_and_interval_callbacks(app: Dash, telemetry_processor: TelemetryProcessor) -> List[html.Div]:
+def create_graphs_and_interval_callbacks(app: Dash, telemetry_processor: TelemetryProcessor,
+                                         incremental: bool = False, push: bool = False) -> List[html.Div]:
     result = []
     for strategy in telemetry_processor.strategies:
         result.append(add_graph_html_block(strategy.name, strategy.title))
-        add_update_graph_callback(app, telemetry_processor, strategy.name)
+
+    # a single callback per tick updates every graph from one consistent read of the processor, with push the
+    # graphs are updated by assets/telemetry_push.js from the event stream instead
+    if not result or push:
+        return result
+    if incremental:
+        # last MET received by this browser for each graph, every client keeps its own cursors
+        result.append(dcc.Store(id='graph-cursors'))
+        add_incremental_update_graphs_callback(app, telemetry_processor)
+    else:
+        # data version of the figure each graph of this browser shows
+        result.append(dcc.Store(id='graph-versions'))
+        add_update_graphs_callback(app, telemetry_processor)
     return result
 
 
-def init_dashboard(telemetry_processor: TelemetryProcessor) -> Dash:
+def init_dashboard(telemetry_processor: TelemetryProcessor, incremental: bool = False,
+                   hub: BroadcastHub | None = None) -> Dash:
+    app = Dash(
+        external_scripts=["https://cdn.tailwindcss.com"]
+    )
+
+    graph_layout = create_graphs_and_interval_callbacks(app, telemetry_processor, incremental, hub is not None)
+
+    # the same endpoints of the headless mode, the figures are serialized once per new sample however many
+    # clients ask
+    api = TelemetryHttpApi(telemetry_processor)
+
+    if hub is not None:
+        @app.server.route(STREAM_PATH)
+        def serve_telemetry_stream():
+            return Response(hub.events(), mimetype="text/event-stream",
+                            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    @app.server.route('/metrics')
+    @app.server.route('/telemetry')
+    @app.server.route('/telemetry/<path:resource>')
+    def serve_telemetry_api(resource=None):
+        response = api.handle(request.path, request.args)
+        return Response(response.body, status=response.status, mimetype=response.content_type)
+
+    app.layout = lambda: create_layout(graph_layout)
+    add_control_callbacks(app, telemetry_processor.stop_processor_thread)
+    return app
+
+
+# One dashboard for every vessel of the multi-vessel mode, the dropdown picks the vessel whose graphs are shown.
+# The graphs are the same for every vessel, they are sent whole every tick.
+def init_vessels_dashboard(vessels_telemetry: MultiVesselTelemetry) -> Dash:
     app = Dash(
         external_scripts=["https://cdn.tailwindcss.com"]
     )
 
-    graph_layout = create_graphs_and_interval_callbacks(app, telemetry_processor)
-
-    def serve_layout():
-        return html.Div([
-            html.Div([
-                html.H1('KRPC Telemetry', className="inline-block text-2xl"),
-                html.Button(id='start-stop-button', children='Pause',
-                            className="inline-block font-bold ml-4 py-2 px-4 rounded bg-blue-500 text-white"),
-                html.Button(id='shutdown-button', children='Shutdown',
-                            className="inline-block font-bold ml-4 py-2 px-4 rounded bg-blue-500 text-white"),
-                ], className="p-4"),
-            html.Div(
-                graph_layout, className="flex flex-wrap"
-            ),
-            dcc.Interval(
-                id='interval-component',
-                interval=1 * 1000,  # in milliseconds
-                n_intervals=0
-            )
+    strategies = vessels_telemetry.strategies
+    graph_layout = [add_graph_html_block(strategy.name, strategy.title) for strategy in strategies]
+    api = VesselsHttpApi(vessels_telemetry)
+
+    @app.server.route('/vessels')
+    @app.server.route('/vessels/<path:resource>')
+    def serve_vessels_api(resource=None):
+        response = api.handle(request.path, request.args)
+        return Response(response.body, status=response.status, mimetype=response.content_type)
+
+    @app.callback([Output('%s-graph' % strategy.name, 'figure') for strategy in strategies] +
+                  [Output('vessel-dropdown', 'options'), Output('vessel-dropdown', 'value')],
+                  Input('interval-component', 'n_intervals'),
+                  Input('vessel-dropdown', 'value'))
+    def update_vessel_graphs(n, key):
+        vessels = vessels_telemetry.vessels
+        options = [
+            {"label": tracked.name if tracked.tracking else "%s (lost)" % tracked.name, "value": tracked.key}
+            for tracked in vessels.values()
         ]
+        if key not in vessels:
+            key = vessels_telemetry.active_key or next(iter(vessels), None)
+        if key is None:
+            return [no_update] * len(strategies) + [options, None]
+        processor = vessels[key].processor
+        start = perf_counter()
+        plots = processor.get_telemetry_plots()
+        if processor.metrics is not None:
+            processor.metrics.observe("dashboard_callback_seconds", perf_counter() - start, mode="full")
+        return [plots[strategy.name] for strategy in strategies] + [options, key]
+
+    app.layout = lambda: create_layout(graph_layout, [
+        dcc.Dropdown(id='vessel-dropdown', clearable=False, className="inline-block w-64 ml-4 align-middle")
+    ])
+    add_control_callbacks(app, vessels_telemetry.stop)
+    return app
+
+
+def create_layout(graph_layout: List[html.Div], controls: List[Any] | None = None) -> html.Div:
+    return html.Div([
+        html.Div([
+            html.H1('KRPC Telemetry', className="inline-block text-2xl"),
+            *(controls or []),
+            html.Button(id='start-stop-button', children='Pause',
+                        className="inline-block font-bold ml-4 py-2 px-4 rounded bg-blue-500 text-white"),
+            html.Button(id='shutdown-button', children='Shutdown',
+                        className="inline-block font-bold ml-4 py-2 px-4 rounded bg-blue-500 text-white"),
+            ], className="p-4"),
+        html.Div(
+            graph_layout, className="flex flex-wrap"
+        ),
+        dcc.Interval(
+            id='interval-component',
+            interval=1 * 1000,  # in milliseconds
+            n_intervals=0
         )
+    ]
+    )
 
-    app.layout = serve_layout
 
+def add_control_callbacks(app: Dash, stop: Callable[[], None]):
     @app.callback(Output('interval-component', 'disabled', allow_duplicate=True),
                   Output('start-stop-button', 'children'),
                   Input('start-stop-button', 'n_clicks'),
@@ -72,7 +248,5 @@ def init_dashboard(telemetry_processor: TelemetryProcessor) -> Dash:
     def callback_func_shutdown(n_clicks):
         if not n_clicks:
             return False, "Pause"
-        telemetry_processor.stop_processor_thread()
+        stop()
         return True
-
-    return app
@@ -0,0 +1,201 @@
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from time import perf_counter
+from typing import Dict, Any, NamedTuple, Mapping, Iterable, TYPE_CHECKING
+from urllib.parse import urlsplit, parse_qsl
+
+import numpy as np
+
+from krpc_telemetry.telemetry import TelemetryType
+from krpc_telemetry.telemetry.export import ExportFormat, EXPORT_CONTENT_TYPES, export_chunks
+from krpc_telemetry.telemetry.processor import TelemetryProcessor
+from krpc_telemetry.push import BroadcastHub, STREAM_PATH
+from krpc_telemetry.telemetry.storage import StorageView
+
+# the multi-vessel mode imports krpc, a recording served alone doesn't need it
+if TYPE_CHECKING:
+    from krpc_telemetry.vessels import MultiVesselTelemetry
+
+JSON_CONTENT_TYPE = "application/json"
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+class ApiResponse(NamedTuple):
+    status: int
+    content_type: str
+    # downloads are streamed, produced while they are sent
+    body: str | Iterable[bytes]
+
+
+# The read only HTTP endpoints of the telemetry, independent of the web framework: the Dash server mounts them
+# on its Flask application, the headless mode serves them with the standard library HTTP server.
+#  - /telemetry: name and title of every strategy
+#  - /telemetry/<name>/data.json: the samples of a strategy, MET and one list per column
+#  - /telemetry/<name>/export.csv, export.arrow (IPC stream), export.parquet: the same samples as a streamed download
+#    The samples accept start_met, end_met, columns (comma separated), max_points and algorithm (lttb, min_max)
+#  - /telemetry/<name>/figure.json: the plotly figure of a strategy, plotly is imported by the first request
+#  - /metrics: the processor metrics in the Prometheus text format, when they are enabled
+class TelemetryHttpApi:
+    def __init__(self, telemetry_processor: TelemetryProcessor):
+        self._telemetry_processor = telemetry_processor
+
+    def handle(self, path: str, query: Mapping[str, str]) -> ApiResponse:
+        metrics = self._telemetry_processor.metrics
+        if metrics is None:
+            return self._handle(path, query)
+        start = perf_counter()
+        response = self._handle(path, query)
+        # unknown paths share a label, whatever clients ask for
+        resource = path.rstrip("/").rsplit("/", 1)[-1] if response.status != 404 else "not_found"
+        metrics.observe("api_request_seconds", perf_counter() - start, resource=resource)
+        return response
+
+    def _handle(self, path: str, query: Mapping[str, str]) -> ApiResponse:
+        parts = [part for part in path.split("/") if part]
+        if parts == ["metrics"]:
+            metrics = self._telemetry_processor.metrics
+            return _not_found() if metrics is None else ApiResponse(200, METRICS_CONTENT_TYPE, metrics.render())
+        if not parts or parts[0] != "telemetry" or len(parts) not in (1, 3):
+            return _not_found()
+        if len(parts) == 1:
+            return _json_response([
+                {"name": strategy.name, "title": strategy.title} for strategy in self._telemetry_processor.strategies
+            ])
+
+        name, resource = parts[1], parts[2]
+        if resource == "figure.json":
+            figure_json = self._telemetry_processor.get_telemetry_plot_json(name)
+            return _not_found() if figure_json is None else ApiResponse(200, JSON_CONTENT_TYPE, figure_json)
+        if resource != "data.json" and not resource.startswith("export."):
+            return _not_found()
+        if self._telemetry_processor.get_strategy(name) is None:
+            return _not_found()
+        try:
+            parameters = _query_parameters(query)
+            if resource == "data.json":
+                return _json_response(view_to_json(self._telemetry_processor.query(name, **parameters)))
+            export_format = ExportFormat(resource[len("export."):])
+            render_pool = self._telemetry_processor.render_pool
+            if render_pool is not None and render_pool.started:
+                # the worker writes the file, only the uncompressed samples of the range go through shared memory
+                body = render_pool.export(self._telemetry_processor.query(name, **parameters), export_format)
+            else:
+                body = export_chunks(self._telemetry_processor.query_chunks(name, **parameters), export_format)
+        except ValueError as error:
+            return ApiResponse(400, JSON_CONTENT_TYPE, json.dumps({"error": str(error)}))
+        return ApiResponse(200, EXPORT_CONTENT_TYPES[export_format], body)
+
+
+# The same endpoints for every vessel of the multi-vessel mode:
+#  - /vessels: key, name, active and tracking state of every vessel tracked so far
+#  - /vessels/<key>/telemetry/..., /vessels/<key>/metrics: the endpoints of TelemetryHttpApi on that vessel
+class VesselsHttpApi:
+    def __init__(self, vessels_telemetry: "MultiVesselTelemetry"):
+        self._vessels_telemetry = vessels_telemetry
+        self._apis: Dict[str, TelemetryHttpApi] = dict()
+
+    def handle(self, path: str, query: Mapping[str, str]) -> ApiResponse:
+        parts = [part for part in path.split("/") if part]
+        if not parts or parts[0] != "vessels":
+            return _not_found()
+        if len(parts) == 1:
+            return _json_response([
+                {"key": tracked.key, "name": tracked.name, "active": tracked.active, "tracking": tracked.tracking}
+                for tracked in self._vessels_telemetry.vessels.values()
+            ])
+
+        processor = self._vessels_telemetry.get_processor(parts[1])
+        if processor is None:
+            return _not_found()
+        api = self._apis.get(parts[1])
+        if api is None:
+            api = self._apis[parts[1]] = TelemetryHttpApi(processor)
+        return api.handle("/" + "/".join(parts[2:]), query)
+
+
+def view_to_json(view: StorageView) -> Dict[str, Any]:
+    # NaN is not valid JSON, missing values become null
+    return {
+        TelemetryType.MET: view.index.tolist(),
+        "columns": {
+            name: np.where(np.isnan(values), None, values).tolist() for name, values in view.values.items()
+        }
+    }
+
+
+def serve_http_api(api: TelemetryHttpApi | VesselsHttpApi, host: str = "localhost", port: int = 8050,
+                   hub: BroadcastHub | None = None) -> ThreadingHTTPServer:
+    # serves the API, and the event stream of the hub if any, on a daemon thread; shutdown() on the returned server
+    # stops it
+    class TelemetryRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if hub is not None and url.path == STREAM_PATH:
+                self._stream_events()
+                return
+            response = api.handle(url.path, dict(parse_qsl(url.query)))
+            self.send_response(response.status)
+            self.send_header("Content-Type", response.content_type)
+            if not isinstance(response.body, str):
+                # no length known in advance, the end of the download is the end of the connection
+                self.end_headers()
+                for part in response.body:
+                    self.wfile.write(part)
+                return
+            body = response.body.encode()
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _stream_events(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            events = hub.events()
+            try:
+                for message in events:
+                    self.wfile.write(message)
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            finally:
+                events.close()
+
+        def log_message(self, format, *args):
+            # one line per request would flood the console of a recorder polled every second
+            pass
+
+    server = ThreadingHTTPServer((host, port), TelemetryRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _query_parameters(query: Mapping[str, str]) -> Dict[str, Any]:
+    columns = query.get("columns")
+    max_points = query.get("max_points")
+    return dict(
+        start_met=_float_parameter(query, "start_met"),
+        end_met=_float_parameter(query, "end_met"),
+        columns=[column for column in columns.split(",") if column] if columns else None,
+        max_points=int(max_points) if max_points else None,
+        algorithm=query.get("algorithm") or None
+    )
+
+
+def _float_parameter(query: Mapping[str, str], name: str) -> float | None:
+    value = query.get(name)
+    try:
+        return float(value) if value not in (None, "") else None
+    except ValueError:
+        raise ValueError("%s must be a number" % name)
+
+
+def _json_response(content: Any) -> ApiResponse:
+    return ApiResponse(200, JSON_CONTENT_TYPE, json.dumps(content))
+
+
+def _not_found() -> ApiResponse:
+    return ApiResponse(404, JSON_CONTENT_TYPE, json.dumps({"error": "Not found"}))
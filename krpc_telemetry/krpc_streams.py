@@ -1,13 +1,54 @@
 import math
-from time import sleep
-from typing import Dict, Any, Callable
+import threading
+from enum import StrEnum, auto
+from time import sleep, monotonic
+from typing import Dict, Any, Callable, Tuple, List
 
 from krpc import Client
 from krpc.services.spacecenter import Vessel
 from krpc.stream import Stream
 
 from krpc_telemetry.telemetry import TelemetryType
+from krpc_telemetry.telemetry.metrics import MetricsRegistry
 from krpc_telemetry.telemetry.processor import TelemetryProcessor
+from krpc_telemetry.telemetry.registry import Registry
+
+
+class CollectionMode(StrEnum):
+    # collect on a fixed wall clock interval
+    POLL = auto()
+    # collect every time the MET stream receives an update
+    EVENT = auto()
+
+
+# Raises the rate of a stream while its value changes faster than fast_change per second of MET, then goes back to
+# the base rate once it stayed below that for hold_secs
+class AdaptiveRate:
+    def __init__(self, base_rate: float, fast_rate: float, fast_change: float, hold_secs: float = 10):
+        if fast_rate < base_rate:
+            raise ValueError("fast_rate must be greater than the base rate")
+
+        self.base_rate = base_rate
+        self.fast_rate = fast_rate
+        self._fast_change = fast_change
+        self._hold_secs = hold_secs
+        self._last = None
+        self._fast_until = -math.inf
+
+    def update(self, met: float, value: Any) -> float:
+        last = self._last
+        self._last = (met, value)
+        if last is not None and met > last[0] and self._change(last[1], value) / (met - last[0]) > self._fast_change:
+            self._fast_until = met + self._hold_secs
+        if last is not None and met < last[0]:
+            self._fast_until = -math.inf
+        return self.fast_rate if met < self._fast_until else self.base_rate
+
+    @staticmethod
+    def _change(last_value: Any, value: Any) -> float:
+        if isinstance(value, tuple):
+            return math.dist(last_value, value)
+        return abs(value - last_value)
 
 
 class KrpcTelemetryStream:
@@ -16,12 +57,33 @@ class KrpcTelemetryStream:
         self._telemetry_type = telemetry_type
         self._stream = stream
         self._transform_function = transform_function
-        # rate is a hertz value, we want one update per second
+        self._adaptive_rate: AdaptiveRate | None = None
+        # rate is a hertz value
+        self._rate = rate
         self._stream.rate = rate
 
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    def set_adaptive_rate(self, adaptive_rate: AdaptiveRate) -> None:
+        self._adaptive_rate = adaptive_rate
+
+    def update_rate(self, met: float, value: Any) -> None:
+        if self._adaptive_rate is None:
+            return
+        rate = self._adaptive_rate.update(met, value)
+        # every change is a call to the server
+        if rate != self._rate:
+            self._rate = rate
+            self._stream.rate = rate
+
     def start(self) -> None:
         self._stream.start(False)
 
+    def add_callback(self, callback: Callable[[Any], None]) -> None:
+        self._stream.add_callback(callback)
+
     @property
     def telemetry_type(self) -> TelemetryType:
         return self._telemetry_type
@@ -37,8 +99,16 @@ class KrpcTelemetryStream:
 
 
 class KrpcTelemetryStreamCollection:
-    def __init__(self):
+    def __init__(self, interval_secs: float = 1, mode: CollectionMode = CollectionMode.POLL):
         self._streams = dict()
+        self._interval_secs = interval_secs
+        self._mode = CollectionMode(mode)
+        self._next_collect = 0.0
+        self._data_event = threading.Event()
+        self._metrics: MetricsRegistry | None = None
+
+    def set_metrics(self, metrics: MetricsRegistry) -> None:
+        self._metrics = metrics
 
     def register_telemetry(self, telemetry: KrpcTelemetryStream) -> None:
         if telemetry.telemetry_type not in self._streams.keys():
@@ -47,11 +117,40 @@ class KrpcTelemetryStreamCollection:
     def has_telemetry(self, telemetry_type: TelemetryType) -> bool:
         return telemetry_type in self._streams.keys()
 
-    def start_telemetries(self) -> None:
+    def start_telemetries(self, wait_secs: float = 2) -> None:
+        if self._mode == CollectionMode.EVENT:
+            self._streams[TelemetryType.MET].add_callback(lambda value: self._data_event.set())
         for telemetry in self._streams.values():
             telemetry.start()
         # wait for first data
-        sleep(2)
+        sleep(wait_secs)
+        self._next_collect = monotonic()
+
+    def wait_for_data(self, timeout: float) -> bool:
+        if self._mode == CollectionMode.EVENT:
+            if not self._data_event.wait(timeout):
+                return False
+            self._data_event.clear()
+            return True
+
+        # the next collection is scheduled from the previous one, so the time spent processing doesn't add drift
+        delay = self._next_collect - monotonic()
+        if delay > timeout:
+            sleep(timeout)
+            return False
+        if delay > 0:
+            sleep(delay)
+        if self._metrics is not None:
+            self._record_drift(monotonic() - self._next_collect)
+        self._next_collect = max(self._next_collect + self._interval_secs, monotonic())
+        return True
+
+    def _record_drift(self, drift: float) -> None:
+        # a tick later than a whole interval is late, the ones it overlapped are skipped, not collected later
+        self._metrics.observe("tick_drift_seconds", drift)
+        if drift >= self._interval_secs:
+            self._metrics.increment("late_ticks")
+            self._metrics.increment("skipped_ticks", int(drift // self._interval_secs))
 
     def destroy_telemetries(self) -> None:
         for telemetry in self._streams.values():
@@ -63,128 +162,236 @@ class KrpcTelemetryStreamCollection:
         for telemetry in self._streams.values():
             results[telemetry.telemetry_type] = telemetry.value
 
+        met = results.get(TelemetryType.MET)
+        if met is not None:
+            for telemetry in self._streams.values():
+                telemetry.update_rate(met, results[telemetry.telemetry_type])
         return results
 
 
+# A stream of the pool, used like a krpc Stream. The pooled stream runs at the fastest rate any of its users asked for
+# and is removed from the server when the last of them removes it.
+class PooledStream:
+    def __init__(self, pool: "KrpcStreamPool", key: Tuple, stream: Stream):
+        self._pool = pool
+        self._key = key
+        self._stream = stream
+        self._rate = 0.0
+        self._callbacks: List[Callable[[Any], None]] = []
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    @rate.setter
+    def rate(self, value: float) -> None:
+        self._rate = value
+        self._pool.update_rate(self._key)
+
+    def start(self, wait: bool = True) -> None:
+        self._stream.start(wait)
+
+    def add_callback(self, callback: Callable[[Any], None]) -> None:
+        self._callbacks.append(callback)
+        self._stream.add_callback(callback)
+
+    def __call__(self) -> Any:
+        return self._stream()
+
+    def remove(self) -> None:
+        for callback in self._callbacks:
+            self._stream.remove_callback(callback)
+        self._callbacks.clear()
+        self._pool.release(self._key, self)
+
+
+# Shares the streams of a connection among several factories, one per vessel in multi-vessel mode. The server already
+# returns the same stream for the same call, but removing it once would remove it for everybody: the pool counts its
+# users. It's used in place of the connection, add_stream has the same signature.
+class KrpcStreamPool:
+    def __init__(self, conn: Client):
+        self._conn = conn
+        # stream and users of every call
+        self._streams: Dict[Tuple, Tuple[Stream, List[PooledStream]]] = dict()
+
+    def __len__(self) -> int:
+        return len(self._streams)
+
+    def add_stream(self, function: Callable, *args: Any) -> PooledStream:
+        key = (function, *args)
+        if key not in self._streams:
+            self._streams[key] = (self._conn.add_stream(function, *args), [])
+        stream, users = self._streams[key]
+        result = PooledStream(self, key, stream)
+        users.append(result)
+        return result
+
+    def update_rate(self, key: Tuple) -> None:
+        stream, users = self._streams[key]
+        rate = max(user.rate for user in users)
+        # every change is a call to the server
+        if rate != stream.rate:
+            stream.rate = rate
+
+    def release(self, key: Tuple, pooled_stream: PooledStream) -> None:
+        if key not in self._streams:
+            return
+        stream, users = self._streams[key]
+        if pooled_stream in users:
+            users.remove(pooled_stream)
+        if users:
+            self.update_rate(key)
+            return
+        del self._streams[key]
+        stream.remove()
+
+
+# How a channel is streamed: the attribute of an object reached from the vessel, a root of VESSEL_OBJECTS followed
+# by attribute names (vessel.control, surface_flight). With args the attribute is a method called with them, like
+# vessel.resources.amount("LiquidFuel"). The transform is compiled once: divided by divisor, then rounded to digits.
+# rate, in hertz, is used unless the collection configuration gives the channel one. Values must be numbers.
+class StreamDefinition:
+    def __init__(self, object: str, attribute: str, args: List[Any] | None = None, digits: int | None = None,
+                 divisor: float | None = None, rate: float | None = None):
+        path = object.split(".")
+        if path[0] not in VESSEL_OBJECTS:
+            raise ValueError("Unknown stream object %s, it must start with one of %s" % (
+                object, ", ".join(VESSEL_OBJECTS.keys())))
+        if divisor == 0:
+            raise ValueError("Stream divisor can't be 0")
+
+        self.object = object
+        self.path = path
+        self.attribute = attribute
+        self.args = tuple(args) if args is not None else None
+        self.rate = rate
+        self.transform = _compile_transform(digits, divisor)
+
+
+def _compile_transform(digits: int | None, divisor: float | None) -> Callable[[Any], Any] | None:
+    if divisor is not None and digits is not None:
+        return lambda value: round(value / divisor, digits)
+    if divisor is not None:
+        return lambda value: value / divisor
+    if digits is not None:
+        return lambda value: round(value, digits)
+    # no call at all for the values stored as they come
+    return None
+
+
+VESSEL_OBJECTS: Dict[str, Callable[[Vessel], Any]] = {
+    "vessel": lambda vessel: vessel,
+    "orbit": lambda vessel: vessel.orbit,
+    # flight in the reference frame of the body orbited
+    "surface_flight": lambda vessel: vessel.flight(vessel.orbit.body.reference_frame),
+    "vessel_flight": lambda vessel: vessel.flight(vessel.reference_frame),
+}
+
+# Streams of the telemetry types, and of other packages through the krpc_telemetry.streams entry points
+STREAMS: Registry[StreamDefinition] = Registry("stream", "krpc_telemetry.streams")
+# MET timestamps every sample, its rate is the fastest of the collection
+STREAMS.register(TelemetryType.MET, StreamDefinition("vessel", "met", digits=3))
+STREAMS.register(TelemetryType.ORBITAL_SPEED, StreamDefinition("orbit", "speed", digits=1))
+STREAMS.register(TelemetryType.SURFACE_SPEED, StreamDefinition("surface_flight", "speed", digits=1))
+STREAMS.register(TelemetryType.SURFACE_HORIZONTAL_SPEED,
+                 StreamDefinition("surface_flight", "horizontal_speed", digits=1))
+STREAMS.register(TelemetryType.SURFACE_VERTICAL_SPEED, StreamDefinition("surface_flight", "vertical_speed", digits=1))
+STREAMS.register(TelemetryType.ORBITAL_APOAPSIS,
+                 StreamDefinition("orbit", "apoapsis_altitude", digits=0, divisor=1000))
+STREAMS.register(TelemetryType.ORBITAL_PERIAPSIS,
+                 StreamDefinition("orbit", "periapsis_altitude", digits=0, divisor=1000))
+STREAMS.register(TelemetryType.G_FORCE, StreamDefinition("surface_flight", "g_force", digits=1))
+STREAMS.register(TelemetryType.MEAN_ALTITUDE, StreamDefinition("surface_flight", "mean_altitude", digits=1))
+STREAMS.register(TelemetryType.THRUST, StreamDefinition("vessel", "thrust"))
+STREAMS.register(TelemetryType.MASS, StreamDefinition("vessel", "mass"))
+STREAMS.register(TelemetryType.CENTER_OF_MASS, StreamDefinition("surface_flight", "center_of_mass"))
+STREAMS.register(TelemetryType.ATMOSPHERE_DENSITY, StreamDefinition("surface_flight", "atmosphere_density"))
+STREAMS.register(TelemetryType.DYNAMIC_PRESSURE, StreamDefinition("surface_flight", "dynamic_pressure"))
+STREAMS.register(TelemetryType.STATIC_PRESSURE, StreamDefinition("surface_flight", "static_pressure"))
+STREAMS.register(TelemetryType.AERODYNAMIC_FORCE, StreamDefinition("surface_flight", "aerodynamic_force"))
+
+
+def create_stream_definitions(streams_config: Dict[str, Dict[str, Any]]) -> Dict[str, StreamDefinition]:
+    result = dict()
+    for name, stream in streams_config.items():
+        if name in TelemetryType.__members__.values():
+            raise ValueError(f"Stream {name} hides a telemetry with the same name")
+        result[name] = StreamDefinition(**stream)
+    return result
+
+
 class KrpcTelemetryStreamFactory:
-    def __init__(self, vessel: Vessel, conn: Client, default_rate: float = 1):
+    def __init__(self, vessel: Vessel, conn: Client | KrpcStreamPool, default_rate: float = 1,
+                 rates: Dict[str, float] | None = None,
+                 adaptive_rates: Dict[str, Dict[str, Any]] | None = None,
+                 streams: Dict[str, StreamDefinition] | None = None):
         self._vessel = vessel
         self._conn = conn
         self._default_rate = default_rate
-
-        self._orbit_reference_fight = None
-        self._vessel_reference_flight = None
-
-    def create(self, telemetry_type: TelemetryType) -> KrpcTelemetryStream:
-        if not self._orbit_reference_fight:
-            self._orbit_reference_fight = self._vessel.flight(self._vessel.orbit.body.reference_frame)
-            self._vessel_reference_flight = self._vessel.flight(self._vessel.reference_frame)
-
+        self._rates = rates or dict()
+        # fast_rate, fast_change and optionally hold_secs of the AdaptiveRate of a telemetry
+        self._adaptive_rates = adaptive_rates or dict()
+        # streams declared in the configuration, before the registered ones
+        self._streams = streams or dict()
+        # the objects the streams are read from, a flight costs calls to the server
+        self._objects: Dict[str, Any] = dict()
+
+    def get_rate(self, telemetry_type: TelemetryType | str) -> float:
+        rate = self._rates.get(telemetry_type)
+        if rate is not None:
+            return rate
+        definition = self._get_definition(telemetry_type)
+        if definition is not None and definition.rate is not None:
+            return definition.rate
+        return self._default_rate
+
+    def create(self, telemetry_type: TelemetryType | str) -> KrpcTelemetryStream:
+        result = self._create(telemetry_type)
+        adaptive_rate = self._adaptive_rates.get(telemetry_type)
+        if adaptive_rate is not None and telemetry_type != TelemetryType.MET:
+            result.set_adaptive_rate(AdaptiveRate(self.get_rate(telemetry_type), **adaptive_rate))
+        return result
+
+    def _get_definition(self, telemetry_type: TelemetryType | str) -> StreamDefinition | None:
+        definition = self._streams.get(telemetry_type)
+        return definition if definition is not None else STREAMS.get(telemetry_type)
+
+    def _create(self, telemetry_type: TelemetryType | str) -> KrpcTelemetryStream:
+        definition = self._get_definition(telemetry_type)
+        if definition is None:
+            raise ValueError("Telemetry %s unknown" % telemetry_type)
+
+        source = self._get_object(definition)
+        if definition.args is not None:
+            stream = self._conn.add_stream(getattr(source, definition.attribute), *definition.args)
+        else:
+            stream = self._conn.add_stream(getattr, source, definition.attribute)
         if telemetry_type == TelemetryType.MET:
-            return KrpcTelemetryStream(
-                telemetry_type,
-                self._conn.add_stream(getattr, self._vessel, 'met'),
-                self._default_rate,
-                lambda value: math.floor(value)
-            )
-
-        if telemetry_type == TelemetryType.ORBITAL_SPEED:
-            return KrpcTelemetryStream(
-                telemetry_type,
-                self._conn.add_stream(getattr, self._vessel.orbit, 'speed'),
-                self._default_rate,
-                lambda value: round(value, 1)
-            )
-
-        if telemetry_type == TelemetryType.SURFACE_SPEED:
-            return KrpcTelemetryStream(
-                telemetry_type,
-                self._conn.add_stream(getattr, self._orbit_reference_fight, 'speed'),
-                self._default_rate,
-                lambda value: round(value, 1)
-            )
-
-        if telemetry_type == TelemetryType.SURFACE_HORIZONTAL_SPEED:
-            return KrpcTelemetryStream(
-                telemetry_type,
-                self._conn.add_stream(getattr, self._orbit_reference_fight, 'horizontal_speed'),
-                self._default_rate,
-                lambda value: round(value, 1)
-            )
-
-        if telemetry_type == TelemetryType.SURFACE_VERTICAL_SPEED:
-            return KrpcTelemetryStream(
-                telemetry_type,
-                self._conn.add_stream(getattr, self._orbit_reference_fight, 'vertical_speed'),
-                self._default_rate,
-                lambda value: round(value, 1)
-            )
-
-        if telemetry_type == TelemetryType.ORBITAL_APOAPSIS:
-            return KrpcTelemetryStream(
-                telemetry_type,
-                self._conn.add_stream(getattr, self._vessel.orbit, 'apoapsis_altitude'),
-                self._default_rate,
-                lambda value: round(value/1000, 0)
-            )
-
-        if telemetry_type == TelemetryType.ORBITAL_PERIAPSIS:
-            return KrpcTelemetryStream(
-                telemetry_type,
-                self._conn.add_stream(getattr, self._vessel.orbit, 'periapsis_altitude'),
-                self._default_rate,
-                lambda value: round(value/1000, 0)
-            )
-
-        if telemetry_type == TelemetryType.G_FORCE:
-            return KrpcTelemetryStream(
-                telemetry_type,
-                self._conn.add_stream(getattr, self._orbit_reference_fight, 'g_force'),
-                self._default_rate,
-                lambda value: round(value, 1)
-            )
-
-        if telemetry_type == TelemetryType.CENTER_OF_MASS:
-            return KrpcTelemetryStream(
-                telemetry_type,
-                self._conn.add_stream(getattr, self._orbit_reference_fight, 'center_of_mass'),
-                self._default_rate
-            )
-
-        if telemetry_type == TelemetryType.ATMOSPHERE_DENSITY:
-            return KrpcTelemetryStream(
-                telemetry_type,
-                self._conn.add_stream(getattr, self._orbit_reference_fight, 'atmosphere_density'),
-                self._default_rate
-            )
-
-        if telemetry_type == TelemetryType.DYNAMIC_PRESSURE:
-            return KrpcTelemetryStream(
-                telemetry_type,
-                self._conn.add_stream(getattr, self._orbit_reference_fight, 'dynamic_pressure'),
-                self._default_rate
-            )
-
-        if telemetry_type == TelemetryType.STATIC_PRESSURE:
-            return KrpcTelemetryStream(
-                telemetry_type,
-                self._conn.add_stream(getattr, self._orbit_reference_fight, 'static_pressure'),
-                self._default_rate
-            )
-
-        if telemetry_type == TelemetryType.AERODYNAMIC_FORCE:
-            return KrpcTelemetryStream(
-                telemetry_type,
-                self._conn.add_stream(getattr, self._orbit_reference_fight, 'aerodynamic_force'),
-                self._default_rate
-            )
-
-        raise ValueError("Telemetry %s unknown" % telemetry_type)
+            # MET timestamps every sample, it must be at least as fast as the fastest telemetry
+            rate = max([self._default_rate, *self._rates.values(),
+                        *(adaptive_rate["fast_rate"] for adaptive_rate in self._adaptive_rates.values()),
+                        *(stream.rate for stream in self._streams.values() if stream.rate is not None)])
+        else:
+            rate = self.get_rate(telemetry_type)
+        return KrpcTelemetryStream(telemetry_type, stream, rate, definition.transform)
+
+    def _get_object(self, definition: StreamDefinition) -> Any:
+        result = self._objects.get(definition.object)
+        if result is None:
+            result = VESSEL_OBJECTS[definition.path[0]](self._vessel)
+            for attribute in definition.path[1:]:
+                result = getattr(result, attribute)
+            self._objects[definition.object] = result
+        return result
 
 
 def init_streams_from_telemetry_processor(processor: TelemetryProcessor,
-                                          factory: KrpcTelemetryStreamFactory) -> KrpcTelemetryStreamCollection:
-    result = KrpcTelemetryStreamCollection()
+                                          factory: KrpcTelemetryStreamFactory,
+                                          interval_secs: float = 1,
+                                          mode: CollectionMode = CollectionMode.POLL) -> KrpcTelemetryStreamCollection:
+    result = KrpcTelemetryStreamCollection(interval_secs, mode)
+    if processor.metrics is not None:
+        result.set_metrics(processor.metrics)
     for telemetry_type in processor.get_telemetry_types():
         result.register_telemetry(
             factory.create(telemetry_type)
@@ -1,32 +1,75 @@
 from typing import Any
 
+from krpc_telemetry.telemetry.burst import BurstCapture, create_trigger
+from krpc_telemetry.telemetry.derived import DerivedChannels, create_derived_channel
+from krpc_telemetry.telemetry.downsampling import SeriesDownsampler
+from krpc_telemetry.telemetry.filters import SampleFilter
+from krpc_telemetry.telemetry.metrics import MetricsRegistry
 from krpc_telemetry.telemetry.processor import TelemetryProcessor
-from krpc_telemetry.telemetry.strategy import OrbitalVelocityStrategy, SurfaceVelocityStrategy, TelemetryStrategy, \
-    OrbitApoEpiStrategy, GForceStrategy, AtmospherePressureStrategy, AerodynamicForceStrategy, CenterOfMassStrategy
+from krpc_telemetry.telemetry.recorder import FlightRecorder
+from krpc_telemetry.telemetry.render_pool import RenderPool
+from krpc_telemetry.telemetry.rollup import TelemetryRollup
+from krpc_telemetry.telemetry.strategy import ChannelsTelemetryStrategy, STRATEGIES
 
 
 class TelemetryProcessorBuilder:
     @staticmethod
     def build_processor(config: Any) -> TelemetryProcessor:
         result = TelemetryProcessor()
+        collection = config.get("collection", dict())
+        deadbands = dict()
+        for name, channel in collection.get("channels", dict()).items():
+            if channel.get("deadband") is not None:
+                deadbands[name] = channel.get("deadband")
+            elif channel.get("on_change"):
+                deadbands[name] = 0
 
         for telemetry in config.get("telemetry"):
-            if telemetry.get("name") == "orbital_velocity":
-                result.add_strategy(OrbitalVelocityStrategy())
-            elif telemetry.get("name") == "surface_velocity":
-                result.add_strategy(SurfaceVelocityStrategy())
-            elif telemetry.get("name") == "orbit_apo_peri":
-                result.add_strategy(OrbitApoEpiStrategy())
-            elif telemetry.get("name") == "gforce":
-                result.add_strategy(GForceStrategy())
-            elif telemetry.get("name") == "atm_pressure":
-                result.add_strategy(AtmospherePressureStrategy())
-            elif telemetry.get("name") == "aero_force":
-                result.add_strategy(AerodynamicForceStrategy())
-            elif telemetry.get("name") == "center_mass":
-                result.add_strategy(CenterOfMassStrategy())
+            options = dict(collect_every_secs=telemetry.get("collect_every_secs", 1),
+                           max_samples=telemetry.get("max_samples"))
+            strategy_factory = STRATEGIES.get(telemetry.get("name"))
+            if strategy_factory is not None:
+                strategy = strategy_factory(**options, **telemetry.get("options", dict()))
+            elif telemetry.get("channels") is not None:
+                strategy = ChannelsTelemetryStrategy(telemetry.get("name"),
+                                                     telemetry.get("title", telemetry.get("name")),
+                                                     telemetry.get("channels"), **options)
             else:
                 raise ValueError(f"Unknown telemetry name: {telemetry.get('name')}")
 
+            if telemetry.get("downsampling") is not None and telemetry.get("rollup") is not None:
+                raise ValueError(f"Telemetry {telemetry.get('name')} can't have both downsampling and rollup")
+            if telemetry.get("downsampling") is not None:
+                strategy.downsampler = SeriesDownsampler(**telemetry.get("downsampling"))
+            if telemetry.get("rollup") is not None:
+                strategy.set_rollup(TelemetryRollup(**telemetry.get("rollup")))
+            if telemetry.get("compression") is not None:
+                strategy.storage.set_compression(**telemetry.get("compression"))
+            strategy_deadbands = {
+                name: deadband for name, deadband in deadbands.items() if name in strategy.get_telemetry_types()
+            }
+            if strategy_deadbands:
+                strategy.sample_filter = SampleFilter(strategy_deadbands, collection.get("heartbeat_secs", 60))
+            result.add_strategy(strategy)
+
+        if config.get("derived") is not None:
+            result.set_derived_channels(DerivedChannels([
+                create_derived_channel(**channel) for channel in config.get("derived")
+            ]))
+
+        if config.get("burst") is not None:
+            burst = dict(config.get("burst"))
+            triggers = [create_trigger(**trigger) for trigger in burst.pop("triggers", [])]
+            result.set_burst_capture(BurstCapture(triggers, **burst))
+
+        if config.get("metrics") is not None:
+            result.set_metrics(MetricsRegistry(**config.get("metrics")))
+
+        if config.get("render_pool") is not None:
+            result.set_render_pool(RenderPool(**config.get("render_pool")))
+
+        if config.get("recorder") is not None:
+            result.set_recorder(FlightRecorder(**config.get("recorder")))
+
         return result
 
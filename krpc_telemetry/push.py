@@ -0,0 +1,173 @@
+import json
+import queue
+import threading
+from time import perf_counter, sleep
+from typing import Dict, Any, List, Iterator
+
+import numpy as np
+
+from krpc_telemetry.telemetry.metrics import GaugeSample
+from krpc_telemetry.telemetry.processor import TelemetryProcessor, TelemetrySnapshot
+
+STREAM_PATH = "/telemetry/stream"
+KEEPALIVE_SECS = 15
+# tells a client to drop what it has and fetch the figures again, it carries no data so it's always the same bytes
+RESET_MESSAGE = b"event: reset\ndata: {}\n\n"
+
+
+# One subscriber of the hub. The queue is bounded: when a slow browser lets it fill up, the pending deltas are
+# replaced by a single reset, the client reloads the figures once instead of the server buffering every tick for it.
+class PushClient:
+    def __init__(self, queue_size: int):
+        self._queue = queue.Queue(maxsize=queue_size)
+        self.coalesced = 0
+
+    def put(self, message: bytes) -> bool:
+        # returns False when the pending messages got coalesced in a reset
+        try:
+            self._queue.put_nowait(message)
+            return True
+        except queue.Full:
+            pass
+        # only the hub thread puts messages, the client thread can only make room meanwhile
+        with self._queue.mutex:
+            self._queue.queue.clear()
+            self._queue.queue.append(RESET_MESSAGE)
+            self._queue.not_empty.notify()
+        self.coalesced += 1
+        return False
+
+    def get(self, timeout: float) -> bytes | None:
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+# Publishes the new samples of every strategy once per tick to all the connected clients as Server-Sent Events.
+# The hub thread reads the processor snapshot, builds and serializes one delta for everybody, and hands the same
+# bytes to every client queue; the work per tick doesn't depend on how many browsers are watching.
+# A graph is marked for reset, instead of extended, when the dashboard polling would resend its whole figure.
+class BroadcastHub:
+    def __init__(self, telemetry_processor: TelemetryProcessor, interval_secs: float = 1,
+                 client_queue_size: int = 16):
+        self._telemetry_processor = telemetry_processor
+        self._interval_secs = interval_secs
+        self._client_queue_size = client_queue_size
+        self._clients: List[PushClient] = []
+        self._clients_lock = threading.Lock()
+        # last MET, columns, plot revision and points sent of every graph
+        self._cursors: Dict[str, Dict[str, Any]] = dict()
+        self._generation = -1
+        self._sequence = 0
+        self._coalesced = 0
+        self._run_thread = False
+        self._hub_thread = None
+        if telemetry_processor.metrics is not None:
+            telemetry_processor.metrics.add_collector(self._collect_metrics)
+
+    @property
+    def clients(self) -> int:
+        return len(self._clients)
+
+    def subscribe(self) -> PushClient:
+        client = PushClient(self._client_queue_size)
+        # a new client starts from the whole figures
+        client.put(RESET_MESSAGE)
+        with self._clients_lock:
+            self._clients.append(client)
+        return client
+
+    def unsubscribe(self, client: PushClient) -> None:
+        with self._clients_lock:
+            if client in self._clients:
+                self._clients.remove(client)
+        self._coalesced += client.coalesced
+
+    def events(self) -> Iterator[bytes]:
+        # the body of an event stream response, ends when the client goes away
+        client = self.subscribe()
+        try:
+            while True:
+                message = client.get(KEEPALIVE_SECS)
+                # a comment line keeps proxies from closing an idle stream and finds closed connections
+                yield message if message is not None else b": keepalive\n\n"
+        finally:
+            self.unsubscribe(client)
+
+    def start(self) -> None:
+        if self._run_thread:
+            return
+        self._run_thread = True
+        self._hub_thread = threading.Thread(target=self._hub_thread_function, daemon=True)
+        self._hub_thread.start()
+
+    def stop(self) -> None:
+        if not self._run_thread:
+            return
+        self._run_thread = False
+        self._hub_thread.join()
+
+    def publish(self, snapshot: TelemetrySnapshot) -> None:
+        if snapshot.generation == self._generation:
+            return
+        self._generation = snapshot.generation
+        with self._clients_lock:
+            clients = list(self._clients)
+        metrics = self._telemetry_processor.metrics
+        start = perf_counter()
+        # the cursors move on even without clients, a new client starts from the whole figures anyway
+        graphs = self._build_graph_updates(snapshot)
+        if not graphs or not clients:
+            return
+        self._sequence += 1
+        message = ("id: %d\nevent: telemetry\ndata: %s\n\n" % (
+            self._sequence, json.dumps({"met": snapshot.met, "graphs": graphs})
+        )).encode()
+        if metrics is not None:
+            metrics.observe("push_serialize_seconds", perf_counter() - start)
+        for client in clients:
+            client.put(message)
+
+    def _build_graph_updates(self, snapshot: TelemetrySnapshot) -> Dict[str, Any]:
+        result = dict()
+        for name, strategy_snapshot in snapshot.strategies.items():
+            view = strategy_snapshot.view
+            if not len(view):
+                continue
+            strategy = self._telemetry_processor.get_strategy(name)
+            max_plot_points = strategy.max_plot_points
+            cursor = self._cursors.get(name)
+            if cursor is None or cursor["columns"] != view.columns or cursor["met"] > view.last_met or \
+                    cursor["revision"] != strategy_snapshot.plot_revision or \
+                    (max_plot_points is not None and cursor["sent"] > max_plot_points):
+                self._cursors[name] = dict(met=view.last_met, columns=view.columns,
+                                           revision=strategy_snapshot.plot_revision, sent=0)
+                result[name] = {"reset": True}
+                continue
+
+            met, columns = view.since(cursor["met"])
+            if not len(met):
+                continue
+            cursor["met"] = float(met[-1])
+            cursor["sent"] += len(met)
+            result[name] = {
+                "x": met.tolist(),
+                # NaN is not valid JSON, missing values become null
+                "y": [np.where(np.isnan(values), None, values).tolist() for values in columns.values()],
+                "max_points": view.max_samples if max_plot_points is None else None
+            }
+        return result
+
+    def _hub_thread_function(self):
+        while self._run_thread:
+            self.publish(self._telemetry_processor.snapshot())
+            sleep(self._interval_secs)
+
+    def _collect_metrics(self) -> List[GaugeSample]:
+        with self._clients_lock:
+            clients = list(self._clients)
+        return [
+            ("push_clients", {}, len(clients)),
+            ("push_coalesced", {}, self._coalesced + sum(client.coalesced for client in clients))
+        ]
@@ -0,0 +1,171 @@
+import os
+import re
+from time import sleep, monotonic
+from typing import Dict, Any, Iterator, List, Set
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from krpc_telemetry.telemetry import TelemetryType
+from krpc_telemetry.telemetry.derived import VECTOR_TELEMETRY, VECTOR_AXES
+from krpc_telemetry.telemetry.processor import TelemetryProcessor
+from krpc_telemetry.telemetry.recorder import RecordingFormat
+
+SEGMENT_NAME = re.compile(r"^(.+)-\d+\.[a-z]+$")
+
+
+# Drop-in replacement of KrpcTelemetryStreamCollection that plays back the segments written by FlightRecorder.
+# Arrow segments are memory mapped and read one record batch at a time, so replaying a long flight doesn't load it
+# in memory. speed is the time acceleration, 0 replays as fast as the processor can go.
+# A directory holds the segments of every flight recorded in it, one flight is replayed: the one named by flight
+# (flight-20240101-120000) or the latest.
+class ReplayTelemetryStreamCollection:
+    def __init__(self, path: str, speed: float = 1, flight: str | None = None):
+        if speed < 0:
+            raise ValueError("Replay speed must be 0 (max speed) or a positive number")
+
+        self._files = list_recorded_segments(path, flight)
+        if not self._files:
+            raise ValueError("No recorded segments found in %s" % path)
+        _check_schemas(self._files)
+        self._speed = speed
+        self._batches: Iterator[Dict[str, np.ndarray]] | None = None
+        self._batch: Dict[str, np.ndarray] = dict()
+        self._position = 0
+        self._start_met = 0.0
+        self._start_time = 0.0
+        self._finished = False
+
+    @property
+    def finished(self) -> bool:
+        return self._finished
+
+    def get_telemetry_types(self) -> Set[TelemetryType]:
+        columns = set(_read_schema(self._files[0]).names)
+        result = set()
+        for telemetry_type in TelemetryType:
+            if telemetry_type in columns or all("%s_%s" % (telemetry_type, axis) in columns for axis in VECTOR_AXES):
+                result.add(telemetry_type)
+        # the other columns are streams declared in the configuration of the recording
+        vector_columns = {"%s_%s" % (telemetry_type, axis) for telemetry_type in result for axis in VECTOR_AXES}
+        return result | {column for column in columns if column not in vector_columns}
+
+    def start_telemetries(self) -> None:
+        self._batches = _iter_batches(self._files)
+        self._finished = not self._next_batch()
+        self._start_met = float(self._batch[TelemetryType.MET][0]) if not self._finished else 0.0
+        self._start_time = monotonic()
+
+    def wait_for_data(self, timeout: float) -> bool:
+        if self._finished:
+            sleep(timeout)
+            return False
+        if self._speed == 0:
+            return True
+
+        met = float(self._batch[TelemetryType.MET][self._position])
+        delay = self._start_time + (met - self._start_met) / self._speed - monotonic()
+        if delay > timeout:
+            sleep(timeout)
+            return False
+        if delay > 0:
+            sleep(delay)
+        return True
+
+    def collect_data(self) -> Dict[TelemetryType, Any]:
+        results = dict()
+        position = self._position
+        for name, column in self._batch.items():
+            results[name] = column[position]
+        for telemetry_type in VECTOR_TELEMETRY:
+            if "%s_%s" % (telemetry_type, VECTOR_AXES[0]) in results:
+                results[telemetry_type] = tuple(results.pop("%s_%s" % (telemetry_type, axis)) for axis in VECTOR_AXES)
+
+        self._position += 1
+        if self._position >= len(self._batch[TelemetryType.MET]) and not self._next_batch():
+            self._finished = True
+            print("Replay finished")
+        return results
+
+    def destroy_telemetries(self) -> None:
+        self._batches = None
+        self._batch = dict()
+        self._finished = True
+
+    def _next_batch(self) -> bool:
+        for batch in self._batches:
+            if len(batch[TelemetryType.MET]):
+                self._batch = batch
+                self._position = 0
+                return True
+        return False
+
+
+def list_recorded_flights(path: str) -> Dict[str, List[str]]:
+    # the segments of every flight in a directory, in recording order; FlightRecorder names them
+    # <flight>-<segment index>.<format>
+    extensions = tuple(".%s" % recording_format for recording_format in RecordingFormat)
+    result = dict()
+    for name in sorted(os.listdir(path)):
+        if not name.endswith(extensions):
+            continue
+        match = SEGMENT_NAME.match(name)
+        flight = match.group(1) if match is not None else os.path.splitext(name)[0]
+        result.setdefault(flight, []).append(os.path.join(path, name))
+    return result
+
+
+def list_recorded_segments(path: str, flight: str | None = None) -> List[str]:
+    if os.path.isfile(path):
+        return [path]
+    flights = list_recorded_flights(path)
+    if flight is None:
+        # the flight names start with the recording time
+        return flights[max(flights)] if flights else []
+    if flight not in flights:
+        raise ValueError("Flight %s not recorded in %s, the recorded flights are: %s" % (
+            flight, path, ", ".join(flights) or "none"))
+    return flights[flight]
+
+
+def init_replay_from_telemetry_processor(processor: TelemetryProcessor, path: str, speed: float = 1,
+                                         flight: str | None = None) -> ReplayTelemetryStreamCollection:
+    result = ReplayTelemetryStreamCollection(path, speed, flight)
+    missing = processor.get_telemetry_types() - result.get_telemetry_types()
+    if missing:
+        raise ValueError("Telemetry %s not recorded in %s" % (", ".join(sorted(missing)), path))
+    return result
+
+
+def _read_schema(file_name: str) -> pa.Schema:
+    if file_name.endswith(".%s" % RecordingFormat.PARQUET):
+        return pq.read_schema(file_name)
+    with pa.memory_map(file_name) as source:
+        return pa.ipc.open_file(source).schema
+
+
+def _check_schemas(files: List[str]) -> None:
+    # every segment of a flight has the columns of the first one, a segment with other columns isn't of this flight
+    columns = set(_read_schema(files[0]).names)
+    for file_name in files[1:]:
+        if set(_read_schema(file_name).names) != columns:
+            raise ValueError("Segment %s doesn't have the columns of %s" % (file_name, files[0]))
+
+
+def _iter_batches(files: List[str]) -> Iterator[Dict[str, np.ndarray]]:
+    # a segment is closed once its batches are read, the arrays of its last batch keep the mapping they point to
+    for file_name in files:
+        if file_name.endswith(".%s" % RecordingFormat.PARQUET):
+            with pq.ParquetFile(file_name, memory_map=True) as parquet_file:
+                yield from _batch_columns(parquet_file.iter_batches())
+        else:
+            with pa.memory_map(file_name) as source:
+                reader = pa.ipc.open_file(source)
+                yield from _batch_columns(reader.get_batch(index) for index in range(reader.num_record_batches))
+
+
+def _batch_columns(batches: Iterator[pa.RecordBatch]) -> Iterator[Dict[str, np.ndarray]]:
+    for batch in batches:
+        # zero copy on the memory mapped file unless the column has missing values
+        yield {name: batch.column(name).to_numpy(zero_copy_only=False) for name in batch.schema.names}
@@ -7,6 +7,8 @@ class TelemetryType(StrEnum):
     CENTER_OF_MASS = auto()
     DYNAMIC_PRESSURE = auto()
     G_FORCE = auto()
+    MASS = auto()
+    MEAN_ALTITUDE = auto()
     MET = auto()
     ORBITAL_APOAPSIS = auto()
     ORBITAL_PERIAPSIS = auto()
@@ -15,3 +17,4 @@ class TelemetryType(StrEnum):
     SURFACE_SPEED = auto()
     SURFACE_HORIZONTAL_SPEED = auto()
     SURFACE_VERTICAL_SPEED = auto()
+    THRUST = auto()
@@ -0,0 +1,177 @@
+import math
+from abc import ABC, abstractmethod
+from collections import deque
+from enum import StrEnum, auto
+from typing import Dict, Any, List, Set, Tuple, Deque
+
+from krpc_telemetry.telemetry import TelemetryType
+from krpc_telemetry.telemetry.derived import source_reader, source_channel
+
+
+class TriggerType(StrEnum):
+    THRESHOLD = auto()
+    JUMP = auto()
+    MET_WINDOW = auto()
+
+
+# Decides from a single sample if a burst capture has to start. Triggers run on every sample the collection delivers,
+# they only read a value or two from the sample dictionary and compare them with the last one.
+class BurstTrigger(ABC):
+    @abstractmethod
+    def fired(self, met: float, data: Dict[str, Any]) -> bool:
+        pass
+
+    def get_telemetry_types(self) -> Set[TelemetryType]:
+        return set()
+
+    def reset(self) -> None:
+        pass
+
+
+class ChannelTrigger(BurstTrigger, ABC):
+    def __init__(self, channel: str):
+        self.channel = channel
+        self._reader = source_reader(channel)
+
+    def get_telemetry_types(self) -> Set[TelemetryType]:
+        return {source_channel(self.channel)}
+
+    def _value(self, data: Dict[str, Any]) -> float | None:
+        # vector telemetries are compared by their magnitude
+        value = self._reader(data)
+        if isinstance(value, (tuple, list)):
+            value = math.hypot(*value)
+        if value is None or math.isnan(value):
+            return None
+        return value
+
+
+# Fires when the channel goes above or below a limit, not again until it came back
+class ThresholdTrigger(ChannelTrigger):
+    def __init__(self, channel: str, above: float | None = None, below: float | None = None):
+        super().__init__(channel)
+        if above is None and below is None:
+            raise ValueError(f"Threshold trigger on {channel} needs an above or a below limit")
+        self.above = above
+        self.below = below
+        self._outside = False
+
+    def fired(self, met: float, data: Dict[str, Any]) -> bool:
+        value = self._value(data)
+        if value is None:
+            return False
+        outside = (self.above is not None and value > self.above) or (self.below is not None and value < self.below)
+        fired = outside and not self._outside
+        self._outside = outside
+        return fired
+
+    def reset(self) -> None:
+        self._outside = False
+
+
+# Fires when the channel changed more than delta since the previous sample
+class JumpTrigger(ChannelTrigger):
+    def __init__(self, channel: str, delta: float):
+        super().__init__(channel)
+        if delta <= 0:
+            raise ValueError(f"Jump trigger on {channel} needs a positive delta")
+        self.delta = delta
+        self._last_value = None
+
+    def fired(self, met: float, data: Dict[str, Any]) -> bool:
+        value = self._value(data)
+        if value is None:
+            return False
+        fired = self._last_value is not None and abs(value - self._last_value) > self.delta
+        self._last_value = value
+        return fired
+
+    def reset(self) -> None:
+        self._last_value = None
+
+
+# Fires on every sample within a MET span, a known maneuver gets captured as a whole
+class MetWindowTrigger(BurstTrigger):
+    def __init__(self, start: float, end: float):
+        if end < start:
+            raise ValueError("The MET window ends before it starts")
+        self.start = start
+        self.end = end
+
+    def fired(self, met: float, data: Dict[str, Any]) -> bool:
+        return self.start <= met <= self.end
+
+
+def create_trigger(type: str, **options: Any) -> BurstTrigger:
+    trigger_type = TriggerType(type)
+    if trigger_type == TriggerType.THRESHOLD:
+        return ThresholdTrigger(**options)
+    if trigger_type == TriggerType.JUMP:
+        return JumpTrigger(**options)
+    return MetWindowTrigger(**options)
+
+
+# Keeps the samples of the last pre_secs of MET at the rate of the collection. When a trigger fires the strategies
+# get those samples and then every sample until post_secs after the last trigger, whatever their collect_every_secs;
+# the rest of the flight keeps the strategy rate.
+class BurstCapture:
+    def __init__(self, triggers: List[BurstTrigger], pre_secs: float = 2, post_secs: float = 5):
+        if not triggers:
+            raise ValueError("At least one burst trigger is needed")
+        if pre_secs < 0 or post_secs < 0:
+            raise ValueError("Burst pre_secs and post_secs can't be negative")
+
+        self._triggers = triggers
+        self.pre_secs = pre_secs
+        self.post_secs = post_secs
+        self._samples: Deque[Tuple[float, Dict[str, Any]]] = deque()
+        self._end_met = -math.inf
+        self._last_met = -math.inf
+        self._active = False
+        self.bursts = 0
+
+    @property
+    def triggers(self) -> List[BurstTrigger]:
+        return self._triggers
+
+    @property
+    def active(self) -> bool:
+        # the last sample given to update belongs to a burst
+        return self._active
+
+    def get_telemetry_types(self) -> Set[TelemetryType]:
+        result = set()
+        for trigger in self._triggers:
+            result |= trigger.get_telemetry_types()
+        return result
+
+    def update(self, met: float, data: Dict[str, Any]) -> List[Tuple[float, Dict[str, Any]]]:
+        # returns the samples before the one that started a burst, empty if none started
+        if met < self._last_met:
+            # MET went back, the buffered samples and the burst are not of this flight anymore
+            self._samples.clear()
+            self._end_met = -math.inf
+            for trigger in self._triggers:
+                trigger.reset()
+        self._last_met = met
+
+        # every trigger sees every sample, a jump trigger needs the previous value
+        fired = False
+        for trigger in self._triggers:
+            fired = trigger.fired(met, data) or fired
+
+        started = fired and met > self._end_met
+        if fired:
+            self._end_met = met + self.post_secs
+        self._active = met <= self._end_met
+
+        result = []
+        if started:
+            result = [sample for sample in self._samples if sample[0] < met]
+            self._samples.clear()
+            self.bursts += 1
+        elif not self._active:
+            self._samples.append((met, data))
+            while self._samples and self._samples[0][0] < met - self.pre_secs:
+                self._samples.popleft()
+        return result
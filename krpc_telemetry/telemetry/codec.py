@@ -0,0 +1,158 @@
+import struct
+
+import numpy as np
+
+# Lossless float64 column codec for sealed blocks of the sample history, in the spirit of Gorilla (delta-of-delta
+# timestamps, XOR of consecutive values) but byte aligned, so that both directions are a handful of NumPy operations
+# over the whole block instead of a bit by bit loop.
+#
+# A block starts with a mode byte and the value count:
+#  - SCALED: the values are decimals with at most MAX_DECIMALS digits (MET and most kRPC channels are rounded), they
+#    are stored as integers, differenced once or twice (whatever is smaller) and written as zigzag varints. A
+#    monotonic MET with a steady period becomes one zero byte per sample. NaN, infinities and -0.0 are patched in.
+#  - XOR: every value is XOR-ed with the previous one, a header byte per value tells how many leading zero bytes
+#    the result has and how many bytes follow. A repeated value costs one byte.
+#  - RAW: the float64 values as they are, for noise that neither of the above can shrink.
+
+MODE_RAW = 0
+MODE_XOR = 1
+MODE_SCALED = 2
+MAX_DECIMALS = 6
+_HEADER = struct.Struct("<BI")
+_SCALED_HEADER = struct.Struct("<BBB")
+# integers above this lose precision in a float64, the scaled mode can't be lossless for them
+_MAX_SCALED = 2 ** 53
+_VARINT_GROUPS = 10
+_GROUP_SHIFTS = np.arange(_VARINT_GROUPS, dtype=np.uint64) * np.uint64(7)
+
+
+def encode_column(values: np.ndarray) -> bytes:
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    scaled = _encode_scaled(values)
+    if scaled is not None:
+        return _HEADER.pack(MODE_SCALED, len(values)) + scaled
+    xor = _encode_xor(values)
+    if len(xor) < values.nbytes:
+        return _HEADER.pack(MODE_XOR, len(values)) + xor
+    return _HEADER.pack(MODE_RAW, len(values)) + values.tobytes()
+
+
+def decode_column(data: bytes) -> np.ndarray:
+    mode, count = _HEADER.unpack_from(data)
+    payload = memoryview(data)[_HEADER.size:]
+    if mode == MODE_SCALED:
+        return _decode_scaled(payload, count)
+    if mode == MODE_XOR:
+        return _decode_xor(payload, count)
+    return np.frombuffer(payload, dtype=np.float64, count=count).copy()
+
+
+def _encode_scaled(values: np.ndarray) -> bytes | None:
+    # NaN, infinities and -0.0 have no integer, they are patched back from a bitmap and their raw bits
+    exceptions = ~np.isfinite(values) | (np.signbit(values) & (values == 0))
+    present = values[~exceptions]
+    if not len(present) or len(present) < len(values) * 7 // 8:
+        return None
+    for decimals in range(MAX_DECIMALS + 1):
+        scale = 10.0 ** decimals
+        integers = np.round(present * scale)
+        if np.abs(integers).max() >= _MAX_SCALED:
+            return None
+        # exactly the operation of the decoder, so what comes back is bit for bit the original
+        if np.array_equal(integers / scale, present):
+            break
+    else:
+        return None
+
+    integers = integers.astype(np.int64)
+    first_order = np.diff(integers, prepend=0)
+    second_order = np.diff(first_order, prepend=0)
+    first_bytes = _encode_varints(_zigzag(first_order))
+    second_bytes = _encode_varints(_zigzag(second_order))
+    order, encoded = (2, second_bytes) if len(second_bytes) < len(first_bytes) else (1, first_bytes)
+    patches = np.packbits(exceptions).tobytes() + values[exceptions].tobytes() if exceptions.any() else b""
+    return _SCALED_HEADER.pack(decimals, order, 1 if patches else 0) + patches + encoded
+
+
+def _decode_scaled(payload: memoryview, count: int) -> np.ndarray:
+    decimals, order, has_exceptions = _SCALED_HEADER.unpack_from(payload)
+    offset = _SCALED_HEADER.size
+    exceptions = None
+    if has_exceptions:
+        bitmap_size = (count + 7) // 8
+        exceptions = np.unpackbits(np.frombuffer(payload, dtype=np.uint8, count=bitmap_size, offset=offset),
+                                   count=count).astype(bool)
+        offset += bitmap_size
+        exception_values = np.frombuffer(payload, dtype=np.float64, count=int(exceptions.sum()), offset=offset)
+        offset += exception_values.nbytes
+
+    present_count = count - len(exception_values) if exceptions is not None else count
+    integers = _unzigzag(_decode_varints(payload[offset:], present_count))
+    for _ in range(order):
+        integers = np.cumsum(integers)
+    present = integers / 10.0 ** decimals
+    if exceptions is None:
+        return present
+    result = np.empty(count)
+    result[~exceptions] = present
+    result[exceptions] = exception_values
+    return result
+
+
+def _encode_xor(values: np.ndarray) -> bytes:
+    bits = values.view(np.uint64)
+    xor = bits ^ np.concatenate((np.zeros(1, dtype=np.uint64), bits[:-1]))
+    matrix = xor.astype(">u8").view(np.uint8).reshape(-1, 8)
+
+    nonzero = matrix != 0
+    empty = ~nonzero.any(axis=1)
+    leading = np.where(empty, 0, nonzero.argmax(axis=1))
+    trailing = np.where(empty, 8, nonzero[:, ::-1].argmax(axis=1))
+    length = 8 - leading - trailing
+    headers = (leading << 4 | length).astype(np.uint8)
+    return headers.tobytes() + matrix[_meaningful_mask(leading, length)].tobytes()
+
+
+def _decode_xor(payload: memoryview, count: int) -> np.ndarray:
+    headers = np.frombuffer(payload, dtype=np.uint8, count=count)
+    leading = (headers >> 4).astype(np.int64)
+    length = (headers & 0x0F).astype(np.int64)
+    matrix = np.zeros((count, 8), dtype=np.uint8)
+    mask = _meaningful_mask(leading, length)
+    matrix[mask] = np.frombuffer(payload, dtype=np.uint8, count=int(length.sum()), offset=count)
+    xor = matrix.view(">u8").ravel().astype(np.uint64)
+    return np.bitwise_xor.accumulate(xor).view(np.float64)
+
+
+def _meaningful_mask(leading: np.ndarray, length: np.ndarray) -> np.ndarray:
+    positions = np.arange(8)
+    return (positions >= leading[:, None]) & (positions < (leading + length)[:, None])
+
+
+def _zigzag(values: np.ndarray) -> np.ndarray:
+    return ((values << 1) ^ (values >> 63)).view(np.uint64)
+
+
+def _unzigzag(values: np.ndarray) -> np.ndarray:
+    return (values >> np.uint64(1)).view(np.int64) ^ -(values & np.uint64(1)).view(np.int64)
+
+
+def _encode_varints(values: np.ndarray) -> bytes:
+    # 7 bits per byte, the high bit is set on every byte but the last one of a value
+    groups = (values[:, None] >> _GROUP_SHIFTS) & np.uint64(0x7F)
+    sizes = 1 + ((values[:, None] >> _GROUP_SHIFTS[1:]) != 0).sum(axis=1)
+    positions = np.arange(_VARINT_GROUPS)
+    groups |= np.where(positions < (sizes - 1)[:, None], np.uint64(0x80), np.uint64(0))
+    return groups.astype(np.uint8)[positions < sizes[:, None]].tobytes()
+
+
+def _decode_varints(payload: memoryview, count: int) -> np.ndarray:
+    data = np.frombuffer(payload, dtype=np.uint8)
+    last_bytes = np.flatnonzero(data < 0x80)[:count]
+    starts = np.concatenate(([0], last_bytes[:-1] + 1))
+    data = data[:last_bytes[-1] + 1] if count else data[:0]
+    positions = np.arange(len(data)) - np.repeat(starts, last_bytes - starts + 1)
+    groups = (data & 0x7F).astype(np.uint64) << (positions.astype(np.uint64) * np.uint64(7))
+    if not count:
+        return groups
+    return np.bitwise_or.reduceat(groups, starts)
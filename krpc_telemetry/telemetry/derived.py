@@ -0,0 +1,191 @@
+import math
+from abc import ABC, abstractmethod
+from enum import StrEnum, auto
+from typing import Dict, Any, List, Set, Callable
+
+import numpy as np
+
+from krpc_telemetry.telemetry import TelemetryType
+
+VECTOR_TELEMETRY = (TelemetryType.AERODYNAMIC_FORCE, TelemetryType.CENTER_OF_MASS)
+VECTOR_AXES = ("x", "y", "z")
+
+
+class DerivedOperation(StrEnum):
+    DERIVATIVE = auto()
+    MOVING_AVERAGE = auto()
+    MAGNITUDE = auto()
+    RATIO = auto()
+
+
+# A value computed from other channels of the same sample, it gets stored and plotted as any other column.
+# Sources are telemetry types, vector components (aerodynamic_force_x), streams declared in the configuration or
+# derived channels declared before it.
+class DerivedChannel(ABC):
+    def __init__(self, name: str, sources: List[str], scale: float = 1):
+        if name in TelemetryType.__members__.values():
+            raise ValueError(f"Derived channel {name} hides a telemetry with the same name")
+        self.name = name
+        self.sources = list(sources)
+        self._scale = scale
+        self._readers: List[Callable[[Dict[str, Any]], Any]] = [source_reader(source) for source in self.sources]
+
+    def _check_scalar_sources(self) -> None:
+        # a vector telemetry is only read whole by a magnitude, the other operations take one of its components
+        for source in self.sources:
+            if source in VECTOR_TELEMETRY:
+                raise ValueError(f"Derived channel {self.name} can't read the vector {source}, use one of "
+                                 f"{', '.join('%s_%s' % (source, axis) for axis in VECTOR_AXES)}")
+
+    def compute(self, met: float, data: Dict[str, Any]) -> float:
+        return self._compute(met, [reader(data) for reader in self._readers]) * self._scale
+
+    @abstractmethod
+    def _compute(self, met: float, values: List[Any]) -> float:
+        pass
+
+
+# Channels working on the last samples keep them in fixed size arrays written round robin: the order doesn't matter
+# for a mean or a least squares slope, so appending never shifts or reallocates anything.
+class WindowDerivedChannel(DerivedChannel, ABC):
+    def __init__(self, name: str, sources: List[str], window: int = 5, scale: float = 1):
+        super().__init__(name, sources, scale)
+        if len(self.sources) != 1:
+            raise ValueError(f"Derived channel {name} needs exactly one source")
+        self._check_scalar_sources()
+        if window < 2:
+            raise ValueError(f"Derived channel {name} needs a window of at least 2 samples")
+        self._mets = np.zeros(window, dtype=np.float64)
+        self._values = np.zeros(window, dtype=np.float64)
+        self._count = 0
+
+    def _compute(self, met: float, values: List[Any]) -> float:
+        value = values[0]
+        if value is None or math.isnan(value):
+            return math.nan
+
+        window = len(self._values)
+        # MET went back (a quickload), the samples in the window are not of this flight anymore
+        if self._count and met < self._mets[(self._count - 1) % window]:
+            self._count = 0
+        self._mets[self._count % window] = met
+        self._values[self._count % window] = value
+        self._count += 1
+        size = min(self._count, window)
+        return self._compute_window(self._mets[:size], self._values[:size])
+
+    @abstractmethod
+    def _compute_window(self, mets: np.ndarray, values: np.ndarray) -> float:
+        pass
+
+
+class DerivativeChannel(WindowDerivedChannel):
+    def _compute_window(self, mets: np.ndarray, values: np.ndarray) -> float:
+        # least squares slope, a single noisy sample can't make a spike as with a plain difference
+        if len(mets) < 2:
+            return math.nan
+        mets = mets - mets.mean()
+        variance = np.dot(mets, mets)
+        if variance == 0:
+            return math.nan
+        return float(np.dot(mets, values - values.mean()) / variance)
+
+
+class MovingAverageChannel(WindowDerivedChannel):
+    def _compute_window(self, mets: np.ndarray, values: np.ndarray) -> float:
+        return float(values.mean())
+
+
+class MagnitudeChannel(DerivedChannel):
+    def _compute(self, met: float, values: List[Any]) -> float:
+        # a vector telemetry source or the components given as separate sources
+        components = values[0] if len(values) == 1 else values
+        if components is None or any(component is None for component in components):
+            return math.nan
+        return math.hypot(*components)
+
+
+class RatioChannel(DerivedChannel):
+    def __init__(self, name: str, sources: List[str], scale: float = 1):
+        super().__init__(name, sources, scale)
+        if len(self.sources) != 2:
+            raise ValueError(f"Derived channel {name} needs a numerator and a denominator source")
+        self._check_scalar_sources()
+
+    def _compute(self, met: float, values: List[Any]) -> float:
+        numerator, denominator = values
+        if numerator is None or not denominator:
+            return math.nan
+        return numerator / denominator
+
+
+# Computes the derived channels of every sample in declaration order, before the strategies collect it
+class DerivedChannels:
+    def __init__(self, channels: List[DerivedChannel]):
+        self._channels = channels
+        names = set()
+        for channel in channels:
+            # a source that is neither a telemetry nor a derived channel is a declared stream, the stream factory
+            # refuses the names it doesn't know
+            if channel.name in names:
+                raise ValueError(f"Duplicated derived channel name: {channel.name}")
+            names.add(channel.name)
+        self._names = names
+
+    @property
+    def channels(self) -> List[DerivedChannel]:
+        return self._channels
+
+    @property
+    def names(self) -> Set[str]:
+        return self._names
+
+    def get_telemetry_types(self) -> Set[TelemetryType]:
+        result = set()
+        for channel in self._channels:
+            for source in channel.sources:
+                if source not in self._names:
+                    result.add(source_channel(source))
+        return result
+
+    def compute(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        # the collected sample is left untouched, the recorder could still be holding it
+        result = dict(data)
+        met = data[TelemetryType.MET]
+        for channel in self._channels:
+            result[channel.name] = channel.compute(met, result)
+        return result
+
+
+def create_derived_channel(name: str, operation: str, sources: List[str], **options: Any) -> DerivedChannel:
+    operation = DerivedOperation(operation)
+    if operation == DerivedOperation.DERIVATIVE:
+        return DerivativeChannel(name, sources, **options)
+    if operation == DerivedOperation.MOVING_AVERAGE:
+        return MovingAverageChannel(name, sources, **options)
+    if operation == DerivedOperation.MAGNITUDE:
+        return MagnitudeChannel(name, sources, **options)
+    return RatioChannel(name, sources, **options)
+
+
+def source_reader(source: str) -> Callable[[Dict[str, Any]], Any]:
+    # resolved once, reading a vector component doesn't need to parse the name at every sample
+    for telemetry_type in VECTOR_TELEMETRY:
+        for axis_index, axis in enumerate(VECTOR_AXES):
+            if source == "%s_%s" % (telemetry_type, axis):
+                return lambda data: _component(data.get(telemetry_type), axis_index)
+    return lambda data: data.get(source)
+
+
+def _component(vector: Any, axis_index: int) -> Any:
+    return vector[axis_index] if vector is not None else None
+
+
+def source_channel(source: str) -> TelemetryType | str:
+    # the channel to collect for a source: its telemetry, the vector of a component, or a declared stream
+    if source in TelemetryType.__members__.values():
+        return TelemetryType(source)
+    for telemetry_type in VECTOR_TELEMETRY:
+        if source in ("%s_%s" % (telemetry_type, axis) for axis in VECTOR_AXES):
+            return telemetry_type
+    return source
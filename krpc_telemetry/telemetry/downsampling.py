@@ -0,0 +1,249 @@
+from enum import StrEnum, auto
+from typing import Dict, Tuple, NamedTuple
+
+import numpy as np
+
+from krpc_telemetry.telemetry.storage import ColumnarStorage, StorageView
+
+
+class DownsamplingAlgorithm(StrEnum):
+    LTTB = auto()
+    MIN_MAX = auto()
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    # Largest-Triangle-Three-Buckets, returns the indexes of the selected points
+    size = len(x)
+    if threshold >= size or threshold < 3:
+        return np.arange(size)
+
+    y = np.nan_to_num(y)
+    every = (size - 2) / (threshold - 2)
+    # bucket boundaries and averages of all the buckets are computed at once, only the selection is sequential
+    edges = (np.arange(threshold - 1) * every).astype(np.int64) + 1
+    edges[-1] = size - 1
+    counts = np.diff(np.append(edges, size))
+    average_x = np.add.reduceat(x, edges) / counts
+    average_y = np.add.reduceat(y, edges) / counts
+
+    result = np.empty(threshold, dtype=np.int64)
+    result[0] = 0
+    selected = 0
+    for bucket in range(threshold - 2):
+        range_start = edges[bucket]
+        range_end = edges[bucket + 1]
+        areas = np.abs((x[selected] - average_x[bucket + 1]) * (y[range_start:range_end] - y[selected]) -
+                       (x[selected] - x[range_start:range_end]) * (average_y[bucket + 1] - y[selected]))
+        selected = range_start + int(np.argmax(areas))
+        result[bucket + 1] = selected
+
+    result[-1] = size - 1
+    return result
+
+
+def min_max(x: np.ndarray, y: np.ndarray, buckets: int) -> np.ndarray:
+    # min and max of every bucket, returns the indexes of the selected points in x order
+    size = len(x)
+    if 2 * buckets >= size or buckets < 1:
+        return np.arange(size)
+
+    edges = np.linspace(0, size, buckets + 1).astype(np.int64)
+    result = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        result.extend(sorted({start + _nan_argmin(y[start:end]), start + _nan_argmax(y[start:end])}))
+    return np.array(result, dtype=np.int64)
+
+
+def decimate(view: StorageView, max_points: int, algorithm: DownsamplingAlgorithm | str | None = None) -> StorageView:
+    # at most about max_points samples of a view. Without an algorithm one sample every few is kept, as zero-copy
+    # strided slices; with one, the samples selected for any column are kept for all of them
+    size = len(view)
+    if max_points < 1:
+        raise ValueError("max_points must be a positive number")
+    if size <= max_points:
+        return view
+
+    index = view.index
+    values = view.values
+    if algorithm is None:
+        step = -(-size // max_points)
+        return StorageView(index[::step], {name: column[::step] for name, column in values.items()}, view.version,
+                           view.max_samples)
+
+    algorithm = DownsamplingAlgorithm(algorithm)
+    per_column = max(max_points // max(len(values), 1), 4)
+    selected = [
+        lttb(index, column, per_column) if algorithm == DownsamplingAlgorithm.LTTB else
+        min_max(index, column, per_column // 2)
+        for column in values.values()
+    ]
+    positions = np.unique(np.concatenate(selected)) if selected else np.arange(size)
+    return StorageView(index[positions], {name: column[positions] for name, column in values.items()},
+                       view.version, view.max_samples)
+
+
+# Folded points of every column up to folded_met, the newer samples are taken at full resolution from a view
+class DownsampledSeries(NamedTuple):
+    folded_met: float
+    x: Dict[str, np.ndarray]
+    y: Dict[str, np.ndarray]
+    revision: int
+
+    def series(self, view: StorageView) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        result = dict()
+        met, columns = view.since(self.folded_met)
+        first_met = view.first_met
+        for name, values in columns.items():
+            if name not in self.x:
+                result[name] = (met, values)
+                continue
+            # in ring mode the oldest folded points may not be in the storage anymore
+            start = int(np.searchsorted(self.x[name], first_met, side="left"))
+            result[name] = (
+                np.concatenate((self.x[name][start:], met)),
+                np.concatenate((self.y[name][start:], values))
+            )
+        return result
+
+
+# Keeps a decimated copy of every column of a storage within a point budget. Samples older than the full resolution
+# window are folded in fixed size buckets as they arrive, when the folded points go over the budget the bucket size
+# doubles and the cached points are decimated again, so each new sample costs O(1) amortized.
+class SeriesDownsampler:
+    def __init__(self, algorithm: DownsamplingAlgorithm | str = DownsamplingAlgorithm.LTTB, max_points: int = 2000,
+                 full_resolution_secs: float = 300):
+        if max_points < 4:
+            raise ValueError("max_points must be at least 4")
+
+        self._algorithm = DownsamplingAlgorithm(algorithm)
+        self._max_points = max_points
+        self._full_resolution_secs = full_resolution_secs
+        self._revision = 0
+        self._reset()
+
+    @property
+    def max_points(self) -> int:
+        return self._max_points
+
+    @property
+    def revision(self) -> int:
+        # changes every time the already folded points get rebuilt
+        return self._revision
+
+    def update(self, storage: ColumnarStorage) -> None:
+        last_met = storage.last_met
+        if last_met is None:
+            return
+        if last_met < self._folded_met or self._columns != storage.columns:
+            self._reset()
+            self._columns = storage.columns
+        # folding copies the cached points, doing it for a few buckets at a time keeps the cost per sample low
+        minimum_buckets = max(self._max_points // 64, 1)
+        if storage.version < self._next_fold_version:
+            return
+        self._next_fold_version = storage.version + minimum_buckets * self._bucket_size
+
+        met, columns = storage.since(self._folded_met)
+        foldable = int(np.searchsorted(met, last_met - self._full_resolution_secs, side="right"))
+        # LTTB needs the bucket after the folded ones to be complete
+        bucket_count = foldable // self._bucket_size
+        if self._algorithm == DownsamplingAlgorithm.LTTB:
+            bucket_count -= 1
+        if bucket_count < minimum_buckets:
+            return
+
+        count = bucket_count * self._bucket_size
+        for name, values in columns.items():
+            self._x.setdefault(name, met[:0])
+            self._y.setdefault(name, values[:0])
+            if self._algorithm == DownsamplingAlgorithm.LTTB:
+                indexes = self._fold_lttb(name, met, values, count)
+            else:
+                indexes = self._fold_min_max(values, count)
+            self._x[name] = np.concatenate((self._x[name], met[indexes]))
+            self._y[name] = np.concatenate((self._y[name], values[indexes]))
+        self._folded_met = float(met[count - 1])
+
+        if any(len(x) > self._max_points for x in self._x.values()):
+            self._coarsen()
+        self._publish()
+
+    def snapshot(self) -> DownsampledSeries:
+        return self._published
+
+    def series(self, view: StorageView) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        return self._published.series(view)
+
+    def _reset(self) -> None:
+        self._bucket_size = 1
+        self._folded_met = -np.inf
+        self._next_fold_version = 0
+        self._columns = []
+        self._x: Dict[str, np.ndarray] = dict()
+        self._y: Dict[str, np.ndarray] = dict()
+        self._revision += 1
+        self._publish()
+
+    def _publish(self) -> None:
+        # readers on other threads only see complete states
+        self._published = DownsampledSeries(self._folded_met, dict(self._x), dict(self._y), self._revision)
+
+    def _coarsen(self) -> None:
+        for name in self._x.keys():
+            x = self._x[name]
+            y = self._y[name]
+            if self._algorithm == DownsamplingAlgorithm.LTTB:
+                indexes = lttb(x, y, self._max_points // 2)
+            else:
+                indexes = min_max(x, y, self._max_points // 4)
+            self._x[name] = x[indexes]
+            self._y[name] = y[indexes]
+        self._bucket_size *= 2
+        self._revision += 1
+
+    def _fold_lttb(self, name: str, met: np.ndarray, values: np.ndarray, count: int) -> np.ndarray:
+        if self._bucket_size == 1:
+            return np.arange(count)
+
+        size = self._bucket_size
+        x = met[:count + size].reshape(-1, size)
+        y = np.nan_to_num(values[:count + size]).reshape(-1, size)
+        average_x = x[1:].mean(axis=1)
+        average_y = y[1:].mean(axis=1)
+        if len(self._x[name]):
+            selected_x = self._x[name][-1]
+            selected_y = np.nan_to_num(self._y[name][-1])
+        else:
+            selected_x = x[0, 0]
+            selected_y = y[0, 0]
+
+        result = np.empty(len(x) - 1, dtype=np.int64)
+        for bucket in range(len(result)):
+            areas = np.abs((selected_x - average_x[bucket]) * (y[bucket] - selected_y) -
+                           (selected_x - x[bucket]) * (average_y[bucket] - selected_y))
+            index = int(np.argmax(areas))
+            result[bucket] = bucket * size + index
+            selected_x = x[bucket, index]
+            selected_y = y[bucket, index]
+        return result
+
+    def _fold_min_max(self, values: np.ndarray, count: int) -> np.ndarray:
+        size = self._bucket_size
+        y = values[:count].reshape(-1, size)
+        offsets = np.arange(0, count, size)
+        minimums = offsets + np.argmin(np.where(np.isnan(y), np.inf, y), axis=1)
+        maximums = offsets + np.argmax(np.where(np.isnan(y), -np.inf, y), axis=1)
+        first = np.minimum(minimums, maximums)
+        second = np.maximum(minimums, maximums)
+        # flat buckets would select the same point twice
+        pairs = np.stack((first, second), axis=1)
+        keep = np.stack((np.ones(len(first), dtype=bool), first != second), axis=1)
+        return pairs[keep]
+
+
+def _nan_argmin(values: np.ndarray) -> int:
+    return int(np.argmin(np.where(np.isnan(values), np.inf, values)))
+
+
+def _nan_argmax(values: np.ndarray) -> int:
+    return int(np.argmax(np.where(np.isnan(values), -np.inf, values)))
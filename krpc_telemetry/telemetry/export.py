@@ -0,0 +1,105 @@
+import io
+from enum import StrEnum, auto
+from typing import Dict, Iterator, Iterable, Tuple, List, TYPE_CHECKING
+
+import numpy as np
+
+from krpc_telemetry.telemetry import TelemetryType
+
+# pyarrow is only imported by an Arrow or Parquet export
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+Chunk = Tuple[np.ndarray, Dict[str, np.ndarray]]
+
+
+class ExportFormat(StrEnum):
+    CSV = auto()
+    ARROW = auto()
+    PARQUET = auto()
+
+
+EXPORT_CONTENT_TYPES = {
+    ExportFormat.CSV: "text/csv",
+    ExportFormat.ARROW: "application/vnd.apache.arrow.stream",
+    ExportFormat.PARQUET: "application/vnd.apache.parquet",
+}
+
+
+# Turns the chunks of a query into the bytes of a download as they are produced, the whole file is never in memory.
+# Every chunk needs the same columns, the first one gives the header or the schema.
+def export_chunks(chunks: Iterable[Chunk], format: ExportFormat | str) -> Iterator[bytes]:
+    format = ExportFormat(format)
+    if format == ExportFormat.CSV:
+        return _export_csv(chunks)
+    return _export_arrow(chunks, format)
+
+
+def chunk_to_arrow(index: np.ndarray, columns: Dict[str, np.ndarray]) -> "pa.RecordBatch":
+    # contiguous float64 slices are wrapped by Arrow without a copy, NaN stays a value instead of becoming null
+    import pyarrow as pa
+
+    names = [str(TelemetryType.MET), *columns.keys()]
+    return pa.record_batch([pa.array(index), *(pa.array(column) for column in columns.values())], names=names)
+
+
+def _export_csv(chunks: Iterable[Chunk]) -> Iterator[bytes]:
+    header_written = False
+    for index, columns in chunks:
+        if not header_written:
+            yield (",".join([str(TelemetryType.MET), *columns.keys()]) + "\n").encode()
+            header_written = True
+        output = io.StringIO()
+        # %s of a float64 is its shortest exact representation
+        np.savetxt(output, np.column_stack([index, *columns.values()]), fmt="%s", delimiter=",")
+        yield output.getvalue().encode()
+
+
+def _export_arrow(chunks: Iterable[Chunk], format: ExportFormat) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = _ChunkSink()
+    writer = None
+    for index, columns in chunks:
+        batch = chunk_to_arrow(index, columns)
+        if writer is None:
+            file = pa.PythonFile(sink, mode="w")
+            if format == ExportFormat.PARQUET:
+                writer = pq.ParquetWriter(file, batch.schema)
+            else:
+                writer = pa.ipc.new_stream(file, batch.schema)
+        if format == ExportFormat.PARQUET:
+            # a row group per chunk, parquet writes it out when the next one starts
+            writer.write_table(pa.Table.from_batches([batch]))
+        else:
+            writer.write_batch(batch)
+        yield from sink.drain()
+    if writer is not None:
+        writer.close()
+        yield from sink.drain()
+
+
+# File object for the pyarrow writers that keeps what they wrote until the response takes it
+class _ChunkSink(io.RawIOBase):
+    def __init__(self):
+        super().__init__()
+        self._parts: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> Iterator[bytes]:
+        parts, self._parts = self._parts, []
+        if parts:
+            yield b"".join(parts)
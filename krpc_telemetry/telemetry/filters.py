@@ -0,0 +1,72 @@
+import math
+from typing import Dict, Any, List, Tuple
+
+from krpc_telemetry.telemetry.derived import VECTOR_TELEMETRY, VECTOR_AXES
+
+
+# Drops the samples of a strategy that bring nothing new: a sample is stored when at least one column with a deadband
+# moved more than it from the last stored value (0 stores any change) or when heartbeat_secs passed since the last
+# stored sample, so a flat line still reaches the present. The columns without a deadband don't decide, they are
+# stored with the samples kept for the others.
+# Before a stored change the last dropped sample is stored too, the plot keeps the plateau instead of a slope.
+class SampleFilter:
+    def __init__(self, deadbands: Dict[str, float], heartbeat_secs: float | None = 60):
+        if any(deadband < 0 for deadband in deadbands.values()):
+            raise ValueError("Deadbands can't be negative")
+
+        self._deadbands = dict(deadbands)
+        # vector components use the deadband of their telemetry
+        for telemetry_type in VECTOR_TELEMETRY:
+            if telemetry_type in self._deadbands:
+                for axis in VECTOR_AXES:
+                    self._deadbands.setdefault("%s_%s" % (telemetry_type, axis), self._deadbands[telemetry_type])
+        self._heartbeat_secs = heartbeat_secs
+        self._last_met = None
+        self._last_values: Dict[str, Any] = dict()
+        self._dropped: Tuple[float, Dict[str, Any]] | None = None
+        self.dropped_samples = 0
+
+    def filter(self, met: float, values: Dict[str, Any]) -> List[Tuple[float, Dict[str, Any]]]:
+        if self._last_met is not None and met < self._last_met:
+            # MET went back, what was stored is not of this flight anymore
+            self._last_met = None
+            self._dropped = None
+
+        changed = self._last_met is None or self._changed(values)
+        if not changed and (self._heartbeat_secs is None or met - self._last_met < self._heartbeat_secs):
+            self._dropped = (met, values)
+            self.dropped_samples += 1
+            return []
+
+        result = []
+        if changed and self._dropped is not None:
+            result.append(self._dropped)
+            self.dropped_samples -= 1
+        self._dropped = None
+        result.append((met, values))
+        self._last_met = met
+        self._last_values = values
+        return result
+
+    def stored(self, met: float, values: Dict[str, Any]) -> None:
+        # a sample stored without filtering it, the dropped one is older and can't follow it anymore
+        if self._last_met is not None and met < self._last_met:
+            return
+        self._last_met = met
+        self._last_values = values
+        self._dropped = None
+
+    def _changed(self, values: Dict[str, Any]) -> bool:
+        if values.keys() != self._last_values.keys():
+            return True
+        for name, deadband in self._deadbands.items():
+            value = values.get(name)
+            if value is None:
+                continue
+            last_value = self._last_values[name]
+            if math.isnan(value) or math.isnan(last_value):
+                if math.isnan(value) != math.isnan(last_value):
+                    return True
+            elif abs(value - last_value) > deadband:
+                return True
+        return False
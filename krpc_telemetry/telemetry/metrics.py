@@ -0,0 +1,134 @@
+import math
+import threading
+from time import monotonic
+from typing import Dict, Tuple, List, Callable, Iterable
+
+PREFIX = "krpc_telemetry_"
+
+# (name, labels) of a metric, labels as a tuple of (label, value) pairs
+MetricKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+# what a collector returns at render time: (name, labels, value)
+GaugeSample = Tuple[str, Dict[str, str], float]
+
+
+# Timings, counters and gauges of the hot path, rendered in the Prometheus text format. Components hold a registry
+# only when metrics are enabled, so with metrics off the whole cost is a None check per measurement.
+# The processor thread, the Dash callbacks, the HTTP threads and the vessel thread all write: measurements and the
+# copies readers render from take a lock, held for a few dictionary operations.
+class MetricsRegistry:
+    def __init__(self, log_secs: float | None = None):
+        self.log_secs = log_secs
+        # count, sum and max of every timing
+        self._timings: Dict[MetricKey, List[float]] = dict()
+        self._counters: Dict[MetricKey, float] = dict()
+        # values that are cheaper to read when asked than to keep up to date, like the history sizes
+        self._collectors: List[Callable[[], Iterable[GaugeSample]]] = []
+        self._logged_timings: Dict[MetricKey, Tuple[float, float]] = dict()
+        self._log_thread = None
+        self._log_stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, seconds: float, **labels: str) -> None:
+        key = (name, tuple(labels.items()))
+        with self._lock:
+            timing = self._timings.get(key)
+            if timing is None:
+                self._timings[key] = [1, seconds, seconds]
+                return
+            timing[0] += 1
+            timing[1] += seconds
+            if seconds > timing[2]:
+                timing[2] = seconds
+
+    def increment(self, name: str, value: float = 1, **labels: str) -> None:
+        key = (name, tuple(labels.items()))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def add_collector(self, collector: Callable[[], Iterable[GaugeSample]]) -> None:
+        with self._lock:
+            self._collectors = [*self._collectors, collector]
+
+    def render(self) -> str:
+        # one TYPE line per metric, then a line per label set
+        lines = []
+        timings, counters = self._copy()
+        timings = sorted(timings.items())
+        for name in _names(timings):
+            lines.append("# TYPE %s%s summary" % (PREFIX, name))
+            for (_, labels), (count, total, _) in (item for item in timings if item[0][0] == name):
+                lines.append(_line(name + "_count", labels, count))
+                lines.append(_line(name + "_sum", labels, total))
+            lines.append("# TYPE %s%s_max gauge" % (PREFIX, name))
+            for (_, labels), (_, _, maximum) in (item for item in timings if item[0][0] == name):
+                lines.append(_line(name + "_max", labels, maximum))
+
+        gauges = dict()
+        for collector in self._collectors:
+            for name, labels, value in collector():
+                gauges[(name, tuple(labels.items()))] = value
+        for metric_type, values in (("counter", sorted(counters.items())),
+                                    ("gauge", sorted(gauges.items()))):
+            for name in _names(values):
+                lines.append("# TYPE %s%s %s" % (PREFIX, name, metric_type))
+                lines.extend(_line(name, labels, value) for (metric_name, labels), value in values
+                             if metric_name == name)
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        # mean and count of every timing since the previous summary, one line for the console
+        parts = []
+        now = dict()
+        timings, counters = self._copy()
+        for key, (count, total, _) in sorted(timings.items()):
+            now[key] = (count, total)
+            last_count, last_total = self._logged_timings.get(key, (0, 0))
+            if count > last_count:
+                parts.append("%s %.2fms x%d" % (_label(key), (total - last_total) / (count - last_count) * 1000,
+                                                count - last_count))
+        self._logged_timings = now
+        for key, value in sorted(counters.items()):
+            parts.append("%s %g" % (_label(key), value))
+        return "Metrics: " + ", ".join(parts)
+
+    def _copy(self) -> Tuple[Dict[MetricKey, Tuple[float, float, float]], Dict[MetricKey, float]]:
+        # timings are changed in place, they are copied too
+        with self._lock:
+            return {key: tuple(timing) for key, timing in self._timings.items()}, dict(self._counters)
+
+    def start_log(self) -> None:
+        if self.log_secs is None or self._log_thread is not None:
+            return
+        self._log_stop.clear()
+        self._log_thread = threading.Thread(target=self._log_thread_function, daemon=True)
+        self._log_thread.start()
+
+    def stop_log(self) -> None:
+        if self._log_thread is None:
+            return
+        self._log_stop.set()
+        self._log_thread.join()
+        self._log_thread = None
+
+    def _log_thread_function(self):
+        next_log = monotonic() + self.log_secs
+        while not self._log_stop.wait(max(next_log - monotonic(), 0)):
+            print(self.summary())
+            next_log += self.log_secs
+
+
+def _names(items: List[Tuple[MetricKey, object]]) -> List[str]:
+    return list(dict.fromkeys(name for (name, _), _ in items))
+
+
+def _line(name: str, labels: Tuple[Tuple[str, str], ...], value: float) -> str:
+    if isinstance(value, float) and math.isnan(value):
+        value = "NaN"
+    if not labels:
+        return "%s%s %s" % (PREFIX, name, value)
+    return "%s%s{%s} %s" % (PREFIX, name, ",".join('%s="%s"' % label for label in labels), value)
+
+
+def _label(key: MetricKey) -> str:
+    name, labels = key
+    return name if not labels else "%s[%s]" % (name, ",".join(value for _, value in labels))
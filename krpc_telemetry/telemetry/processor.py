@@ -1,11 +1,30 @@
+import json
 import threading
-from time import sleep
-from typing import List, Set, Dict, Any
+from time import perf_counter
+from typing import List, Set, Dict, Any, NamedTuple, Iterator, Tuple, TYPE_CHECKING
 
-from pandas.core.interchange.dataframe_protocol import DataFrame
+import numpy as np
 
 from krpc_telemetry.telemetry import TelemetryType
-from krpc_telemetry.telemetry.strategy import TelemetryStrategy
+from krpc_telemetry.telemetry.burst import BurstCapture
+from krpc_telemetry.telemetry.derived import DerivedChannels
+from krpc_telemetry.telemetry.downsampling import DownsamplingAlgorithm, decimate
+from krpc_telemetry.telemetry.metrics import MetricsRegistry, GaugeSample
+from krpc_telemetry.telemetry.recorder import FlightRecorder
+from krpc_telemetry.telemetry.render_pool import RenderPool
+from krpc_telemetry.telemetry.storage import StorageView
+from krpc_telemetry.telemetry.strategy import TelemetryStrategy, StrategySnapshot
+
+if TYPE_CHECKING:
+    from pandas.core.interchange.dataframe_protocol import DataFrame
+
+
+# All the strategies as they were after the sample of one generation. The processor thread publishes a new snapshot
+# with a single reference assignment after every sample, readers never wait for it and it never waits for them.
+class TelemetrySnapshot(NamedTuple):
+    generation: int
+    met: float | None
+    strategies: Dict[str, StrategySnapshot]
 
 
 class TelemetryProcessor:
@@ -13,14 +32,91 @@ class TelemetryProcessor:
         self._processor_loop_thread = None
         self._telemetry_collection = None
         self._strategies: List[TelemetryStrategy] = []
+        self._strategies_by_name: Dict[str, TelemetryStrategy] = dict()
+        self._recorder: FlightRecorder | None = None
+        self._derived_channels: DerivedChannels | None = None
+        self._burst_capture: BurstCapture | None = None
+        self._metrics: MetricsRegistry | None = None
+        self._render_pool: RenderPool | None = None
+        self._owns_render_pool = False
         self._run_thread = False
+        self._snapshot = TelemetrySnapshot(0, None, dict())
 
     @property
     def strategies(self):
         return self._strategies
 
     def add_strategy(self, strategy: TelemetryStrategy):
+        if strategy.name in self._strategies_by_name:
+            raise ValueError(f"Duplicated telemetry name: {strategy.name}")
         self._strategies.append(strategy)
+        self._strategies_by_name[strategy.name] = strategy
+        self._publish_snapshot(self._snapshot.met)
+
+    def snapshot(self) -> TelemetrySnapshot:
+        return self._snapshot
+
+    def _publish_snapshot(self, met: float | None):
+        self._snapshot = TelemetrySnapshot(
+            self._snapshot.generation + 1,
+            met,
+            {strategy.name: strategy.snapshot() for strategy in self._strategies}
+        )
+
+    @property
+    def recorder(self) -> FlightRecorder | None:
+        return self._recorder
+
+    def set_recorder(self, recorder: FlightRecorder):
+        self._recorder = recorder
+
+    @property
+    def derived_channels(self) -> DerivedChannels | None:
+        return self._derived_channels
+
+    def set_derived_channels(self, derived_channels: DerivedChannels):
+        self._derived_channels = derived_channels
+
+    @property
+    def burst_capture(self) -> BurstCapture | None:
+        return self._burst_capture
+
+    def set_burst_capture(self, burst_capture: BurstCapture):
+        self._burst_capture = burst_capture
+
+    @property
+    def metrics(self) -> MetricsRegistry | None:
+        return self._metrics
+
+    def set_metrics(self, metrics: MetricsRegistry):
+        self._metrics = metrics
+        metrics.add_collector(self._collect_metrics)
+
+    @property
+    def render_pool(self) -> RenderPool | None:
+        return self._render_pool
+
+    def set_render_pool(self, render_pool: RenderPool, owned: bool = True):
+        # a pool shared with other processors is not owned, whoever shares it starts and stops it
+        self._render_pool = render_pool
+        self._owns_render_pool = owned
+
+    def _collect_metrics(self) -> List[GaugeSample]:
+        result = [("snapshot_generation", {}, self._snapshot.generation)]
+        for strategy in self._strategies:
+            labels = {"strategy": strategy.name}
+            result.append(("history_samples", labels, len(strategy.storage)))
+            result.append(("history_bytes", labels, strategy.storage.nbytes))
+            if strategy.rollup is not None:
+                result.append(("rollup_bytes", labels,
+                               sum(tier.storage.nbytes for tier in strategy.rollup.tiers)))
+            if strategy.sample_filter is not None:
+                result.append(("filtered_samples", labels, strategy.sample_filter.dropped_samples))
+        if self._recorder is not None:
+            result.append(("recorder_dropped_samples", {}, self._recorder.dropped_samples))
+        if self._burst_capture is not None:
+            result.append(("bursts", {}, self._burst_capture.bursts))
+        return result
 
     def get_telemetry_types(self) -> Set[TelemetryType]:
         result = set()
@@ -29,39 +125,144 @@ class TelemetryProcessor:
                 if telemetry_type not in result:
                     result.add(telemetry_type)
 
+        if self._burst_capture is not None:
+            result |= self._burst_capture.get_telemetry_types()
+        # derived channels are not collected, their sources are
+        if self._derived_channels is not None:
+            result -= self._derived_channels.names
+            result |= self._derived_channels.get_telemetry_types()
         return result
 
     def process_telemetry_data(self, data: Dict[TelemetryType, Any]):
         met = data[TelemetryType.MET]
+        if self._recorder is not None:
+            self._recorder.record(data)
+        if self._derived_channels is not None:
+            data = self._derived_channels.compute(data)
+        burst = False
+        if self._burst_capture is not None:
+            pre_trigger_samples = self._burst_capture.update(met, data)
+            burst = self._burst_capture.active
+            if pre_trigger_samples:
+                for strategy in self._strategies:
+                    strategy.collect_burst(pre_trigger_samples)
+        metrics = self._metrics
         for strategy in self._strategies:
-            strategy.collect_data(met, data)
+            if metrics is None:
+                strategy.collect_data(met, data, force=burst)
+                continue
+            start = perf_counter()
+            strategy.collect_data(met, data, force=burst)
+            metrics.observe("strategy_collect_seconds", perf_counter() - start, strategy=strategy.name)
+        self._publish_snapshot(met)
 
-    def get_telemetry_data(self) -> Dict[str, DataFrame]:
+    def get_telemetry_data(self) -> Dict[str, "DataFrame"]:
+        snapshot = self._snapshot
         result = dict()
         for strategy in self._strategies:
-            result[strategy.name] = strategy.dataframe
+            result[strategy.name] = strategy.get_dataframe(snapshot.strategies[strategy.name].view)
 
         return result
 
-    def get_telemetry_data_single(self, name: str) -> DataFrame | None:
-        for strategy in self._strategies:
-            if strategy.name == name:
-                return strategy.dataframe
+    def get_telemetry_data_single(self, name: str, start_met: float | None = None,
+                                  end_met: float | None = None) -> "DataFrame | None":
+        snapshot = self._snapshot
+        strategy = self._strategies_by_name.get(name)
+        if strategy is None:
+            return None
+        return strategy.get_span_dataframe(snapshot.strategies[name], start_met, end_met)
+
+    def get_telemetry_view(self, name: str, start_met: float | None = None,
+                           end_met: float | None = None) -> StorageView | None:
+        snapshot = self._snapshot
+        strategy = self._strategies_by_name.get(name)
+        if strategy is None:
+            return None
+        return strategy.get_span_view(snapshot.strategies[name], start_met, end_met)
 
-        return None
+    def query(self, name: str, start_met: float | None = None, end_met: float | None = None,
+              columns: List[str] | None = None, max_points: int | None = None,
+              algorithm: DownsamplingAlgorithm | str | None = None) -> StorageView | None:
+        # MET range found by binary search over the sorted index, columns and decimation applied on the slices;
+        # nothing is copied unless compressed blocks had to be decoded or an algorithm picked the samples
+        view = self.get_telemetry_view(name, start_met, end_met)
+        if view is None:
+            return None
+        view = view.select(columns)
+        if max_points is not None:
+            view = decimate(view, max_points, algorithm)
+        return view
+
+    def query_chunks(self, name: str, start_met: float | None = None, end_met: float | None = None,
+                     columns: List[str] | None = None, max_points: int | None = None,
+                     algorithm: DownsamplingAlgorithm | str | None = None,
+                     rows: int = 8192) -> Iterator[Tuple[np.ndarray, Dict[str, np.ndarray]]] | None:
+        # the samples of query() at most rows at a time, for exports: without decimation the compressed blocks of
+        # the range are decoded one at a time instead of all at once
+        snapshot = self._snapshot
+        strategy = self._strategies_by_name.get(name)
+        if strategy is None:
+            return None
+        if max_points is not None:
+            return self.query(name, start_met, end_met, columns, max_points, algorithm).chunks(rows=rows)
+        strategy_snapshot = snapshot.strategies[name]
+        view = strategy_snapshot.view
+        if strategy_snapshot.rollup is not None:
+            view = strategy.get_span_view(strategy_snapshot, start_met, end_met)
+        return view.select(columns).chunks(start_met, end_met, rows)
+
+    def get_strategy(self, name: str) -> TelemetryStrategy | None:
+        return self._strategies_by_name.get(name)
+
+    def get_telemetry_plots(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            strategy.name: self.render_telemetry_plot(strategy, snapshot.strategies[strategy.name])
+            for strategy in self._strategies
+        }
 
     def get_telemetry_plot(self, name: str):
-        for strategy in self._strategies:
-            if strategy.name == name:
-                return strategy.get_telemetry_plot()
+        snapshot = self._snapshot
+        strategy = self._strategies_by_name.get(name)
+        if strategy is None:
+            return None
+        return self.render_telemetry_plot(strategy, snapshot.strategies[name])
 
-        return None
+    def render_telemetry_plot(self, strategy: TelemetryStrategy, snapshot: StrategySnapshot) -> Any:
+        # with a render pool the figure is the dictionary of its JSON, built by a worker: the C JSON decoder holds
+        # the GIL far less than plotly building the figure
+        if self._render_pool is None:
+            return strategy.get_telemetry_plot(snapshot)
+        return json.loads(self._render_pool.render_json(strategy, snapshot))
+
+    def get_telemetry_plot_json(self, name: str) -> str | None:
+        snapshot = self._snapshot
+        strategy = self._strategies_by_name.get(name)
+        if strategy is None:
+            return None
+        return self.render_telemetry_plot_json(strategy, snapshot.strategies[name])
+
+    def render_telemetry_plot_json(self, strategy: TelemetryStrategy, snapshot: StrategySnapshot) -> str:
+        # the JSON is cached per data version, by the strategy or the render pool
+        if self._render_pool is not None:
+            return self._render_pool.render_json(strategy, snapshot)
+        return strategy.get_telemetry_plot_json(snapshot)
 
     def _processor_loop_thread_function(self):
         while self._run_thread:
-            sleep(1)
+            # the collection decides when new data is available, the timeout keeps the stop request responsive
+            if not self._telemetry_collection.wait_for_data(timeout=1):
+                continue
+            metrics = self._metrics
+            if metrics is None:
+                self.process_telemetry_data(self._telemetry_collection.collect_data())
+                continue
+            start = perf_counter()
             collected_data = self._telemetry_collection.collect_data()
+            collected = perf_counter()
             self.process_telemetry_data(collected_data)
+            metrics.observe("collect_seconds", collected - start)
+            metrics.observe("process_seconds", perf_counter() - collected)
 
         print("Processor thread stopped")
 
@@ -72,6 +273,7 @@ class TelemetryProcessor:
 
         self._telemetry_collection = telemetry_collection
         self._telemetry_collection.start_telemetries()
+        self.start_outputs()
 
         self._processor_loop_thread = threading.Thread(target=self._processor_loop_thread_function)
         self._processor_loop_thread.start()
@@ -82,3 +284,22 @@ class TelemetryProcessor:
         self._run_thread = False
         self._processor_loop_thread.join()
         self._telemetry_collection.destroy_telemetries()
+        self.stop_outputs()
+
+    def start_outputs(self):
+        # what runs beside the processing: the recorder and the metrics log. Called by start_processor_thread, or
+        # directly when somebody else feeds process_telemetry_data, like the multi-vessel collection
+        if self._recorder is not None:
+            self._recorder.start()
+        if self._metrics is not None:
+            self._metrics.start_log()
+        if self._render_pool is not None and self._owns_render_pool:
+            self._render_pool.start()
+
+    def stop_outputs(self):
+        if self._recorder is not None:
+            self._recorder.stop()
+        if self._metrics is not None:
+            self._metrics.stop_log()
+        if self._render_pool is not None and self._owns_render_pool:
+            self._render_pool.stop()
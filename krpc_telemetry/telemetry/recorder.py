@@ -0,0 +1,139 @@
+import os
+import queue
+import threading
+from enum import StrEnum, auto
+from time import monotonic, strftime
+from typing import Dict, Any, List, TYPE_CHECKING
+
+from krpc_telemetry.telemetry import TelemetryType
+from krpc_telemetry.telemetry.strategy import transform_data
+
+# pyarrow is imported by the writer thread with the first batch, not when the application starts
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+
+class RecordingFormat(StrEnum):
+    ARROW = auto()
+    PARQUET = auto()
+
+
+# Streams every collected sample to rolling columnar segment files. The collection thread only enqueues the sample,
+# a writer thread groups the samples in record batches and starts a new segment when the current one is over
+# segment_max_bytes. The queue is bounded, samples are dropped instead of growing memory if the disk can't keep up.
+class FlightRecorder:
+    def __init__(self, path: str, format: RecordingFormat | str = RecordingFormat.ARROW,
+                 segment_max_bytes: int = 64 * 1024 * 1024, batch_size: int = 256, flush_secs: float = 5,
+                 max_queue_size: int = 65536):
+        self._path = path
+        self._format = RecordingFormat(format)
+        self._segment_max_bytes = segment_max_bytes
+        self._batch_size = batch_size
+        self._flush_secs = flush_secs
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._writer_thread = None
+        self._flight_name = None
+        self._segment_index = 0
+        self._sink = None
+        self._writer = None
+        self._schema = None
+        self._dropped_samples = 0
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def dropped_samples(self) -> int:
+        return self._dropped_samples
+
+    def record(self, data: Dict[TelemetryType, Any]) -> None:
+        try:
+            self._queue.put_nowait(data)
+        except queue.Full:
+            self._dropped_samples += 1
+
+    def start(self) -> None:
+        if self._writer_thread is not None:
+            return
+        os.makedirs(self._path, exist_ok=True)
+        self._flight_name = "flight-%s" % strftime("%Y%m%d-%H%M%S")
+        self._segment_index = 0
+        self._writer_thread = threading.Thread(target=self._writer_thread_function)
+        self._writer_thread.start()
+
+    def stop(self) -> None:
+        if self._writer_thread is None:
+            return
+        self._queue.put(None)
+        self._writer_thread.join()
+        self._writer_thread = None
+        if self._dropped_samples:
+            print("Recorder dropped %d samples" % self._dropped_samples)
+
+    def _writer_thread_function(self):
+        rows = []
+        flush_at = monotonic() + self._flush_secs
+        while True:
+            try:
+                data = self._queue.get(timeout=max(flush_at - monotonic(), 0))
+            except queue.Empty:
+                data = dict()
+
+            if data is None:
+                break
+            if data:
+                row = dict()
+                for telemetry_type, value in data.items():
+                    transform_data(telemetry_type, value, row)
+                rows.append(row)
+
+            # a batch is written when full or, at low rates, when it has been waiting for flush_secs
+            if len(rows) >= self._batch_size or monotonic() >= flush_at:
+                if rows:
+                    self._write_batch(rows)
+                    rows = []
+                flush_at = monotonic() + self._flush_secs
+
+        if rows:
+            self._write_batch(rows)
+        self._close_segment()
+        print("Recorder thread stopped")
+
+    def _write_batch(self, rows: List[Dict[str, Any]]) -> None:
+        import pyarrow as pa
+
+        names = [TelemetryType.MET, *sorted(name for name in rows[0].keys() if name != TelemetryType.MET)]
+        batch = pa.record_batch(
+            [pa.array([row.get(name) for row in rows], type=pa.float64()) for name in names],
+            names=[str(name) for name in names]
+        )
+
+        if self._writer is not None and (not batch.schema.equals(self._schema) or
+                                         self._sink.tell() >= self._segment_max_bytes):
+            self._close_segment()
+        if self._writer is None:
+            self._open_segment(batch.schema)
+
+        self._writer.write_batch(batch)
+
+    def _open_segment(self, schema: "pa.Schema") -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        file_name = os.path.join(self._path, "%s-%05d.%s" % (self._flight_name, self._segment_index, self._format))
+        self._segment_index += 1
+        self._schema = schema
+        self._sink = pa.OSFile(file_name, "wb")
+        if self._format == RecordingFormat.PARQUET:
+            self._writer = pq.ParquetWriter(self._sink, schema)
+        else:
+            self._writer = pa.ipc.new_file(self._sink, schema)
+
+    def _close_segment(self) -> None:
+        if self._writer is None:
+            return
+        self._writer.close()
+        self._sink.close()
+        self._writer = None
+        self._sink = None
@@ -0,0 +1,45 @@
+from importlib.metadata import entry_points
+from typing import Dict, Generic, TypeVar, List
+
+T = TypeVar("T")
+
+
+# Named implementations of an extension point. The built-in ones are registered when their module is imported, the
+# ones of other packages are found through the entry point group the first time a name is not known; a lookup is
+# a dictionary access either way. A package adds a strategy with, in its pyproject.toml:
+#   [project.entry-points."krpc_telemetry.strategies"]
+#   fuel_graph = "my_package.strategies:FuelStrategy"
+class Registry(Generic[T]):
+    def __init__(self, kind: str, entry_point_group: str):
+        self._kind = kind
+        self._entry_point_group = entry_point_group
+        self._items: Dict[str, T] = dict()
+        self._entry_points_loaded = False
+
+    @property
+    def entry_point_group(self) -> str:
+        return self._entry_point_group
+
+    def register(self, name: str, item: T) -> None:
+        if name in self._items:
+            raise ValueError(f"Duplicated {self._kind} name: {name}")
+        self._items[name] = item
+
+    def get(self, name: str) -> T | None:
+        item = self._items.get(name)
+        if item is None and not self._entry_points_loaded:
+            self._load_entry_points()
+            item = self._items.get(name)
+        return item
+
+    def names(self) -> List[str]:
+        if not self._entry_points_loaded:
+            self._load_entry_points()
+        return list(self._items.keys())
+
+    def _load_entry_points(self) -> None:
+        self._entry_points_loaded = True
+        for entry_point in entry_points(group=self._entry_point_group):
+            # the built-in names can't be replaced by an installed package
+            if entry_point.name not in self._items:
+                self._items[entry_point.name] = entry_point.load()
@@ -0,0 +1,303 @@
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, Any, List, Tuple, Callable, Iterator
+
+import numpy as np
+
+from krpc_telemetry.telemetry.export import ExportFormat, export_chunks
+from krpc_telemetry.telemetry.storage import StorageView, CompressedBlock
+from krpc_telemetry.telemetry.strategy import TelemetryStrategy, StrategySnapshot, PlotInput, build_plot
+
+# offset, length and dtype of every array in a segment, with the segment name it's all a worker needs to map them
+SharedLayout = Tuple[str, List[Tuple[int, int, str]]]
+# how the arrays of a layout make a plot input: the column names of a view, or name, x and y array of every trace
+PlotShape = Tuple[str, List[Any]]
+
+EXPORT_READ_BYTES = 1024 * 1024
+
+
+# Arrays copied in a shared memory segment of the main process. The segment is kept while the arrays fit, the
+# workers map it instead of receiving the arrays pickled through a pipe.
+class SharedArrays:
+    def __init__(self):
+        self._memory: SharedMemory | None = None
+
+    def write(self, arrays: List[np.ndarray]) -> SharedLayout:
+        size = sum(array.nbytes for array in arrays)
+        if self._memory is None or self._memory.size < size:
+            self.close()
+            # room to grow, a history gains samples every tick
+            self._memory = SharedMemory(create=True, size=max(size * 2, 4096))
+        layout = []
+        offset = 0
+        for array in arrays:
+            np.ndarray(array.shape, array.dtype, buffer=self._memory.buf, offset=offset)[...] = array
+            layout.append((offset, len(array), array.dtype.str))
+            offset += array.nbytes
+        return self._memory.name, layout
+
+    def close(self) -> None:
+        if self._memory is None:
+            return
+        self._memory.close()
+        self._memory.unlink()
+        self._memory = None
+
+
+# The history of a strategy kept in a shared memory segment from one figure to the next, a region of capacity
+# samples per column: only the samples stored since the previous figure are copied in, the samples retention dropped
+# are skipped until the segment is full. A merge (its rewrites), new columns or MET going back copy it all again.
+class SharedHistory:
+    def __init__(self):
+        self._memory: SharedMemory | None = None
+        self._arrays: List[np.ndarray] = []
+        self._capacity = 0
+        self._columns: List[str] = []
+        self._rewrites = -1
+        self._start = 0
+        self._end = 0
+
+    def update(self, view: StorageView, rewrites: int) -> SharedLayout:
+        if self._end == self._start or view.columns != self._columns or rewrites != self._rewrites or \
+                not len(view) or view.last_met < self._arrays[0][self._end - 1] or \
+                view.first_met < self._arrays[0][self._start]:
+            self._columns = view.columns
+            self._rewrites = rewrites
+            self._start = self._end = 0
+            met, values = view.index, view.values
+        else:
+            # the compressed blocks older than the last mirrored sample are not decoded
+            index = self._arrays[0]
+            met, values = view.since(float(index[self._end - 1]))
+            self._start += int(np.searchsorted(index[self._start:self._end], view.first_met, side="left"))
+        self._append([met, *(values[name] for name in self._columns)])
+        size = self._end - self._start
+        return self._memory.name, [
+            ((position * self._capacity + self._start) * 8, size, array.dtype.str)
+            for position, array in enumerate(self._arrays)
+        ]
+
+    def close(self) -> None:
+        # the arrays map the segment, it can't be closed while they exist
+        self._arrays = []
+        self._capacity = self._start = self._end = 0
+        if self._memory is None:
+            return
+        self._memory.close()
+        self._memory.unlink()
+        self._memory = None
+
+    def _append(self, arrays: List[np.ndarray]) -> None:
+        size = self._end - self._start
+        count = len(arrays[0])
+        if len(self._arrays) != len(arrays) or 2 * (size + count) > self._capacity:
+            # a bigger segment, with room to grow: a history gains samples every tick
+            live = [array[self._start:self._end].copy() for array in self._arrays] if size else []
+            self.close()
+            self._capacity = max(2 * (size + count), 512)
+            self._memory = SharedMemory(create=True, size=self._capacity * 8 * len(arrays))
+            self._arrays = [
+                np.ndarray((self._capacity,), np.float64, buffer=self._memory.buf, offset=position * self._capacity * 8)
+                for position in range(len(arrays))
+            ]
+            for array, samples in zip(self._arrays, live):
+                array[:size] = samples
+            self._start, self._end = 0, size
+        elif self._end + count > self._capacity:
+            # the samples retention dropped make room, no worker reads the segment while it's written
+            for array in self._arrays:
+                array[:size] = array[self._start:self._end]
+            self._start, self._end = 0, size
+        for array, samples in zip(self._arrays, arrays):
+            array[self._end:self._end + count] = samples
+        self._end += count
+
+
+# Figure of a strategy in the shared memory: a figure request waits for the one being built, then finds it cached
+class _StrategyMirror:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.arrays = SharedArrays()
+        self.history = SharedHistory()
+        self.version = -1
+        self.plot_json = None
+
+
+# Builds figures and runs exports in worker processes, the processor and Flask threads only copy arrays in shared
+# memory and wait: the GIL of the process collecting the telemetry is never held by plotly, pandas or the CSV
+# writer. Workers are spawned, not forked, a fork of a process running threads may inherit a held lock.
+class RenderPool:
+    def __init__(self, workers: int = 2, timeout_secs: float = 30):
+        self._workers = workers
+        self._timeout_secs = timeout_secs
+        self._executor: ProcessPoolExecutor | None = None
+        self._mirrors: Dict[TelemetryStrategy, _StrategyMirror] = dict()
+        self._mirrors_lock = threading.Lock()
+
+    @property
+    def started(self) -> bool:
+        return self._executor is not None
+
+    def start(self) -> None:
+        if self._executor is not None:
+            return
+        self._executor = ProcessPoolExecutor(self._workers, mp_context=get_context("spawn"),
+                                             initializer=_import_plotting)
+        # the workers import plotly and pandas now, not with the first figure somebody is waiting for
+        for future in [self._executor.submit(_ready) for _ in range(self._workers)]:
+            future.result()
+
+    def stop(self) -> None:
+        if self._executor is None:
+            return
+        self._executor.shutdown()
+        self._executor = None
+        with self._mirrors_lock:
+            mirrors, self._mirrors = self._mirrors, dict()
+        for mirror in mirrors.values():
+            with mirror.lock:
+                mirror.arrays.close()
+                mirror.history.close()
+
+    def render_json(self, strategy: TelemetryStrategy, snapshot: StrategySnapshot) -> str:
+        plot_input = strategy.get_plot_input(snapshot)
+        if self._executor is None or plot_input is None:
+            return strategy.get_telemetry_plot_json(snapshot)
+        with self._mirrors_lock:
+            mirror = self._mirrors.get(strategy)
+            if mirror is None:
+                mirror = self._mirrors[strategy] = _StrategyMirror()
+        with mirror.lock:
+            if mirror.version == snapshot.version:
+                return mirror.plot_json
+            if isinstance(plot_input, StorageView):
+                # the raw history, the segment only receives the new samples
+                layout, shape = mirror.history.update(plot_input, snapshot.rewrites), ("view", plot_input.columns)
+            else:
+                # a bounded number of points, a downsampled or rollup series is replaced as a whole
+                arrays, shape = _plot_arrays(plot_input)
+                layout = mirror.arrays.write(arrays)
+            # the segment is not written again until the worker returned
+            plot_json = self._executor.submit(_render_plot_json, layout, shape).result(self._timeout_secs)
+            if snapshot.version > mirror.version:
+                mirror.version, mirror.plot_json = snapshot.version, plot_json
+        return plot_json
+
+    def run(self, function: Callable[..., Any], view: StorageView, *args: Any) -> Any:
+        # function(view, *args) in a worker, over a copy of the uncompressed samples of the view in a segment of its
+        # own; the compressed blocks are pickled as they are and decoded by the worker. function must be importable by
+        # the workers, a module level function
+        if self._executor is None:
+            return function(view, *args)
+        blocks, samples = view.split()
+        arrays = SharedArrays()
+        try:
+            layout = arrays.write([samples.index, *samples.values.values()])
+            return self._executor.submit(_run_on_view, function, layout, view.columns, view.version, blocks,
+                                         args).result(self._timeout_secs)
+        finally:
+            arrays.close()
+
+    def export(self, view: StorageView, format: ExportFormat | str, rows: int = 8192) -> Iterator[bytes]:
+        # the worker writes the download to a temporary file that is streamed and removed, an error is raised here
+        # and not once the response started
+        format = ExportFormat(format)
+        file, path = tempfile.mkstemp(prefix="krpc-telemetry-", suffix="." + format)
+        os.close(file)
+        try:
+            self.run(_export_view, view, format, path, rows)
+        except BaseException:
+            os.remove(path)
+            raise
+        return _read_and_remove(path)
+
+
+def _plot_arrays(plot_input: PlotInput) -> Tuple[List[np.ndarray], PlotShape]:
+    if isinstance(plot_input, StorageView):
+        return [plot_input.index, *plot_input.values.values()], ("view", plot_input.columns)
+    # the traces of a downsampled strategy often share the x array, it's copied once
+    arrays = []
+    positions = dict()
+    traces = []
+    for name, (x, y) in plot_input.items():
+        if id(x) not in positions:
+            positions[id(x)] = len(arrays)
+            arrays.append(x)
+        traces.append((name, positions[id(x)], len(arrays)))
+        arrays.append(y)
+    return arrays, ("series", traces)
+
+
+def _map_arrays(memory: SharedMemory, layout: SharedLayout) -> List[np.ndarray]:
+    return [
+        np.ndarray((length,), np.dtype(dtype), buffer=memory.buf, offset=offset) for offset, length, dtype in layout[1]
+    ]
+
+
+def _close(memory: SharedMemory) -> None:
+    try:
+        memory.close()
+    except BufferError:
+        # an array of the segment still referenced, the mapping goes away with it
+        pass
+
+
+def _render_plot_json(layout: SharedLayout, shape: PlotShape) -> str:
+    import plotly.io
+
+    memory = SharedMemory(name=layout[0])
+    try:
+        arrays = _map_arrays(memory, layout)
+        kind, names = shape
+        if kind == "view":
+            plot_input = StorageView(arrays[0], dict(zip(names, arrays[1:])), 0)
+        else:
+            plot_input = {name: (arrays[x], arrays[y]) for name, x, y in names}
+        plot_json = plotly.io.to_json(build_plot(plot_input), validate=False)
+        del arrays, plot_input
+        return plot_json
+    finally:
+        _close(memory)
+
+
+def _run_on_view(function: Callable[..., Any], layout: SharedLayout, columns: List[str], version: int,
+                 blocks: Tuple[CompressedBlock, ...], args: Tuple) -> Any:
+    memory = SharedMemory(name=layout[0])
+    try:
+        arrays = _map_arrays(memory, layout)
+        view = StorageView(arrays[0], dict(zip(columns, arrays[1:])), version, blocks=blocks)
+        result = function(view, *args)
+        del arrays, view
+        return result
+    finally:
+        _close(memory)
+
+
+def _export_view(view: StorageView, format: ExportFormat, path: str, rows: int) -> None:
+    with open(path, "wb") as file:
+        for part in export_chunks(view.chunks(rows=rows), format):
+            file.write(part)
+
+
+def _read_and_remove(path: str) -> Iterator[bytes]:
+    try:
+        with open(path, "rb") as file:
+            while part := file.read(EXPORT_READ_BYTES):
+                yield part
+    finally:
+        os.remove(path)
+
+
+def _import_plotting() -> None:
+    # once per worker, when it starts
+    import pandas
+    import plotly.graph_objs
+    import plotly.io
+
+
+def _ready() -> bool:
+    return True
@@ -0,0 +1,399 @@
+import math
+from collections import deque
+from enum import StrEnum, auto
+from typing import Dict, Any, List, Tuple, NamedTuple, Deque
+
+import numpy as np
+
+from krpc_telemetry.telemetry.storage import ColumnarStorage, StorageView
+
+
+class RollupStatistic(StrEnum):
+    MIN = auto()
+    MAX = auto()
+    MEAN = auto()
+    LAST = auto()
+
+
+# Accumulators of one bucket of a tier, what a coarser tier merges. last_met is the MET of the newest sample in it.
+class RollupBucket(NamedTuple):
+    start: float
+    columns: List[str]
+    minimum: np.ndarray
+    maximum: np.ndarray
+    total: np.ndarray
+    count: np.ndarray
+    last: np.ndarray
+    last_met: float
+
+
+# Fixed length MET buckets of one storage: min, max, mean and last value of every column. The open bucket is
+# accumulated in one array per statistic over all the columns and only stored when the next bucket starts.
+# In the tier storage the mean keeps the name of the column, so a tier plots like the raw samples, the other
+# statistics get a suffix (speed_min, speed_max, speed_last). Buckets are indexed by their starting MET.
+# The accumulators of the buckets closed in the last recent_secs are kept, a sample merged late into the history
+# (a pre-trigger window) still changes them.
+class RollupTier:
+    def __init__(self, bucket_secs: float, retention_secs: float | None = None, recent_secs: float = 0):
+        if bucket_secs <= 0:
+            raise ValueError("bucket_secs must be a positive number")
+
+        self.bucket_secs = bucket_secs
+        self.retention_secs = retention_secs
+        self.recent_secs = recent_secs
+        self._reset()
+
+    @property
+    def storage(self) -> ColumnarStorage:
+        return self._storage
+
+    @property
+    def closed_bucket(self) -> RollupBucket | None:
+        # the last stored bucket
+        return self._recent[-1] if self._recent else None
+
+    @property
+    def bucket_end(self) -> float:
+        # MET of the first sample that closes the open bucket
+        return self._bucket_end
+
+    def merge(self, met: float, columns: List[str], minimum: np.ndarray, maximum: np.ndarray, total: np.ndarray,
+              count: np.ndarray, last: np.ndarray, last_met: float) -> bool:
+        # returns True when the sample, or the finer bucket, closed the open bucket
+        closed = False
+        if not self._bucket_start <= met < self._bucket_end or columns != self._columns:
+            closed = self._close_bucket()
+            self._open_bucket(math.floor(met / self.bucket_secs) * self.bucket_secs, columns)
+
+        np.fmin(self._min, minimum, out=self._min)
+        np.fmax(self._max, maximum, out=self._max)
+        self._sum += total
+        self._count += count
+        self._last = np.where(np.isnan(last), self._last, last)
+        self._last_met = last_met
+        return closed
+
+    def add_older(self, met: float, values: Dict[str, Any]) -> bool:
+        # a sample older than the newest one added, into the bucket it belongs to. Returns False when that is the
+        # open bucket, True when it's a closed one (stored again) or one closed too long ago to be changed.
+        if self._bucket_start <= met < self._bucket_end:
+            self._open_bucket_fold(met, values)
+            return False
+        for position in range(len(self._recent) - 1, -1, -1):
+            bucket = self._recent[position]
+            if bucket.start <= met < bucket.start + self.bucket_secs:
+                bucket = _fold(bucket, met, values)
+                self._recent[position] = bucket
+                self._storage.merge([(bucket.start, _bucket_values(bucket))], replace=True)
+                break
+        return True
+
+    def reset(self) -> None:
+        self._reset()
+
+    def _reset(self) -> None:
+        # buckets are few, the storage starts small and doubles as needed
+        self._storage = ColumnarStorage(initial_capacity=64, max_age_secs=self.retention_secs)
+        self._bucket_start = math.inf
+        self._bucket_end = -math.inf
+        self._columns: List[str] = []
+        self._recent: Deque[RollupBucket] = deque(maxlen=math.ceil(self.recent_secs / self.bucket_secs) + 1)
+
+    def _open_bucket(self, bucket_start: float, columns: List[str]) -> None:
+        self._bucket_start = bucket_start
+        self._bucket_end = bucket_start + self.bucket_secs
+        self._columns = columns
+        self._min = np.full(len(columns), np.nan)
+        self._max = np.full(len(columns), np.nan)
+        self._sum = np.zeros(len(columns))
+        self._count = np.zeros(len(columns), dtype=np.int64)
+        self._last = np.full(len(columns), np.nan)
+        self._last_met = -math.inf
+
+    def _open_bucket_fold(self, met: float, values: Dict[str, Any]) -> None:
+        bucket = _fold(RollupBucket(self._bucket_start, self._columns, self._min, self._max, self._sum, self._count,
+                                    self._last, self._last_met), met, values)
+        _, _, self._min, self._max, self._sum, self._count, self._last, self._last_met = bucket
+
+    def _close_bucket(self) -> bool:
+        if self._bucket_start == math.inf:
+            return False
+
+        bucket = RollupBucket(self._bucket_start, self._columns, self._min, self._max, self._sum, self._count,
+                              self._last, self._last_met)
+        self._storage.append(self._bucket_start, _bucket_values(bucket))
+        self._recent.append(bucket)
+        return True
+
+
+def _bucket_statistics(met: np.ndarray, rows: np.ndarray, bucket_secs: float) -> Tuple[np.ndarray, ...]:
+    # sorted samples (a row of columns each) reduced per bucket in one pass: first index, minimum, maximum, total,
+    # count and last value of every bucket, and the position of the last sample in it
+    buckets = np.floor(met / bucket_secs)
+    starts = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+    valid = ~np.isnan(rows)
+    # the newest valid value of every column: the highest position of a valid value in the bucket
+    last_positions = np.maximum.reduceat(np.where(valid, np.arange(len(met))[:, None], -1), starts, axis=0)
+    last = np.where(last_positions >= 0, rows[last_positions, np.arange(rows.shape[1])], np.nan)
+    return (
+        starts,
+        np.fmin.reduceat(rows, starts, axis=0),
+        np.fmax.reduceat(rows, starts, axis=0),
+        np.add.reduceat(np.where(valid, rows, 0), starts, axis=0),
+        np.add.reduceat(valid.astype(np.int64), starts, axis=0),
+        last,
+        np.append(starts[1:], len(met)) - 1
+    )
+
+
+def _fold(bucket: RollupBucket, met: float, values: Dict[str, Any]) -> RollupBucket:
+    # the bucket with one more sample, in new arrays
+    sample = np.fromiter((values.get(name, np.nan) for name in bucket.columns), dtype=np.float64,
+                         count=len(bucket.columns))
+    valid = ~np.isnan(sample)
+    if met > bucket.last_met:
+        last, last_met = np.where(valid, sample, bucket.last), met
+    else:
+        # older than the last sample, it's the last value only of the columns that had none
+        last, last_met = np.where(np.isnan(bucket.last), sample, bucket.last), bucket.last_met
+    return bucket._replace(
+        minimum=np.fmin(bucket.minimum, sample),
+        maximum=np.fmax(bucket.maximum, sample),
+        total=bucket.total + np.where(valid, sample, 0),
+        count=bucket.count + valid,
+        last=last,
+        last_met=last_met
+    )
+
+
+def _bucket_values(bucket: RollupBucket) -> Dict[str, float]:
+    # what the tier storage keeps of a bucket
+    mean = np.divide(bucket.total, bucket.count, out=np.full(len(bucket.columns), np.nan), where=bucket.count > 0)
+    values = dict()
+    for position, name in enumerate(bucket.columns):
+        values[name] = mean[position]
+        values["%s_%s" % (name, RollupStatistic.MIN)] = bucket.minimum[position]
+        values["%s_%s" % (name, RollupStatistic.MAX)] = bucket.maximum[position]
+        values["%s_%s" % (name, RollupStatistic.LAST)] = bucket.last[position]
+    return values
+
+
+# What readers need of the tiers at one moment, replaced as a whole when a bucket gets stored
+class RollupSnapshot(NamedTuple):
+    tiers: Tuple[Tuple[float, StorageView], ...]
+    plot_tier: int | None
+    revision: int
+    # MET of the first sample of the flight, the raw samples may not reach it anymore
+    first_met: float | None
+
+    def series(self, view: StorageView) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        # buckets of the plot tier before the first raw sample, then the raw samples
+        if self.plot_tier is None or not len(view):
+            return {name: (view.index, values) for name, values in view.values.items()}
+
+        _, tier = self.tiers[self.plot_tier]
+        older = tier.between(end_met=np.nextafter(view.first_met, -np.inf))
+        result = dict()
+        for name, values in view.values.items():
+            if name not in older.values:
+                result[name] = (view.index, values)
+                continue
+            result[name] = (
+                np.concatenate((older.index, view.index)),
+                np.concatenate((older.values[name], values))
+            )
+        return result
+
+    def select(self, view: StorageView, start_met: float | None, end_met: float | None,
+               max_points: int) -> StorageView:
+        # the raw samples when they cover the span, otherwise the finest tier covering it within max_points
+        if start_met is None:
+            start_met = self.first_met
+        if start_met is None or not len(view) or start_met >= view.first_met:
+            return view.between(start_met, end_met)
+
+        end = end_met if end_met is not None else view.last_met
+        candidates = [(bucket_secs, tier) for bucket_secs, tier in self.tiers if len(tier)]
+        for bucket_secs, tier in candidates:
+            if tier.first_met <= start_met and (end - start_met) / bucket_secs <= max_points:
+                return tier.between(start_met, end_met)
+        if not candidates:
+            return view.between(start_met, end_met)
+        return candidates[-1][1].between(start_met, end_met)
+
+
+# Raw samples for the last raw_secs of MET, older history only in the coarser tiers. The samples appended to the
+# storage are only collected until one reaches the end of the open bucket of the finest tier, then they are folded
+# together, a few vector operations per bucket; every other tier merges the buckets closed by the one before, so its
+# bucket length must be a multiple of that one.
+# Samples merged into the storage before the last folded one are added to the bucket of every tier they belong to.
+class TelemetryRollup:
+    def __init__(self, raw_secs: float = 600, tiers: List[Dict[str, Any]] | None = None, max_points: int = 2000):
+        if tiers is None:
+            tiers = [dict(bucket_secs=10, retention_secs=6 * 3600), dict(bucket_secs=60)]
+        if not tiers:
+            raise ValueError("At least one rollup tier is needed")
+
+        self.raw_secs = raw_secs
+        self._max_points = max_points
+        # a sample merged late is at most as old as the raw samples
+        self._tiers = sorted((RollupTier(**tier, recent_secs=raw_secs) for tier in tiers),
+                             key=lambda tier: tier.bucket_secs)
+        for finer, coarser in zip(self._tiers, self._tiers[1:]):
+            if coarser.bucket_secs % finer.bucket_secs != 0:
+                raise ValueError("Rollup bucket of %s secs is not a multiple of the %s secs one" %
+                                 (coarser.bucket_secs, finer.bucket_secs))
+        self._first_met = None
+        self._last_met = -np.inf
+        self._version = 0
+        # samples not folded yet: their MET and a row of values over the columns
+        self._pending_columns: List[str] = []
+        self._storage_columns = None
+        self._pending_met: List[float] = []
+        self._pending: List[List[float]] = []
+        self._pending_sorted = True
+        self._folded_met = -np.inf
+        self._revision = 0
+        self._plot_tier = None
+        self._published = RollupSnapshot((), None, 0, None)
+        self._publish()
+
+    @property
+    def max_points(self) -> int:
+        return self._max_points
+
+    @property
+    def tiers(self) -> List[RollupTier]:
+        return self._tiers
+
+    def update(self, storage: ColumnarStorage) -> None:
+        # collects the samples appended since the last update, every append is a new version of the storage: a
+        # sample filter can store none or two samples at a time
+        index, columns, start, end, version, _ = storage.state
+        first = max(end - (version - self._version), start)
+        self._version = version
+        if first == end:
+            return
+        reset = index[first] < self._last_met or (end - first > 1 and bool(np.any(np.diff(index[first:end]) < 0)))
+        if reset:
+            # MET went back (a quickload), the old buckets are not of this flight anymore
+            descents = np.flatnonzero(np.diff(np.concatenate(([self._last_met], index[first:end]))) < 0)
+            for tier in self._tiers:
+                tier.reset()
+            self._pending_met.clear()
+            self._pending.clear()
+            self._pending_sorted = True
+            self._folded_met = -np.inf
+            self._first_met = None
+            self._revision += 1
+            first += int(descents[-1])
+        if self._first_met is None:
+            self._first_met = float(index[first])
+        self._last_met = float(index[end - 1])
+
+        # the storage replaces its dictionary of columns when one is added
+        if columns is not self._storage_columns:
+            self._storage_columns = columns
+            self._set_columns(list(columns.keys()))
+        arrays = list(columns.values())
+        for position in range(first, end):
+            self._pending_met.append(float(index[position]))
+            self._pending.append([column[position] for column in arrays])
+        if (self._last_met >= self._tiers[0].bucket_end and self._fold()) or reset:
+            self._select_plot_tier(storage.first_met)
+            self._publish()
+
+    def merge(self, storage: ColumnarStorage, samples: List[Tuple[float, Dict[str, Any]]]) -> None:
+        # samples just merged into the storage (the ones it stored): the ones older than the last folded sample change
+        # buckets already added to, the others are collected like appended ones
+        older = [(met, values) for met, values in samples if met <= self._folded_met]
+        newer = [(met, values) for met, values in samples if met > self._folded_met]
+        changed = False
+        for met, values in older:
+            # a coarser tier has the sample's bucket only once the finer one closed it
+            for tier in self._tiers:
+                if not tier.add_older(met, values):
+                    break
+                changed = True
+        if older and older[0][0] < self._first_met:
+            self._first_met = older[0][0]
+            changed = True
+        self._version = storage.version
+        if newer:
+            if self._first_met is None:
+                self._first_met = newer[0][0]
+            self._pending_sorted = self._pending_sorted and newer[0][0] > self._last_met
+            self._last_met = max(self._last_met, newer[-1][0])
+            names = storage.columns
+            self._set_columns(names)
+            for met, values in newer:
+                self._pending_met.append(met)
+                self._pending.append([values.get(name, np.nan) for name in names])
+            changed |= self._last_met >= self._tiers[0].bucket_end and self._fold()
+        if changed:
+            # buckets in the middle of the plot changed, clients need it all again
+            self._revision += 1
+            self._select_plot_tier(storage.first_met)
+            self._publish()
+
+    def snapshot(self) -> RollupSnapshot:
+        return self._published
+
+    def _set_columns(self, columns: List[str]) -> None:
+        # the rows collected before a column was added have one value less, they are folded first
+        if columns != self._pending_columns:
+            self._fold()
+            self._pending_columns = columns
+
+    def _fold(self) -> bool:
+        # folds the collected samples, called once the newest one closes the open bucket of the finest tier. Returns
+        # True when a bucket got stored
+        if not self._pending_met:
+            return False
+        met = np.array(self._pending_met)
+        rows = np.array(self._pending, dtype=np.float64).reshape(len(met), len(self._pending_columns))
+        if not self._pending_sorted:
+            order = np.argsort(met, kind="stable")
+            met, rows = met[order], rows[order]
+        self._pending_met.clear()
+        self._pending.clear()
+        self._pending_sorted = True
+        self._folded_met = float(met[-1])
+
+        stored = False
+        finest = self._tiers[0]
+        starts, minimum, maximum, total, count, last, ends = _bucket_statistics(met, rows, finest.bucket_secs)
+        for bucket, start in enumerate(starts):
+            closed = finest.merge(met[start], self._pending_columns, minimum[bucket], maximum[bucket], total[bucket],
+                                  count[bucket], last[bucket], met[ends[bucket]])
+            stored |= closed
+            for finer, coarser in zip(self._tiers, self._tiers[1:]):
+                if not closed:
+                    break
+                closed = coarser.merge(*finer.closed_bucket)
+        return stored
+
+    def _select_plot_tier(self, first_raw_met: float) -> None:
+        # the finest tier that reaches the beginning of the mission with less than max_points buckets, none while
+        # the raw samples still do
+        first_met = self._first_met
+        plot_tier = None
+        if first_met < first_raw_met:
+            plot_tier = len(self._tiers) - 1
+            for position, tier in enumerate(self._tiers):
+                tier_first_met = tier.storage.first_met
+                if tier_first_met is not None and tier_first_met <= first_met and \
+                        (first_raw_met - first_met) / tier.bucket_secs <= self._max_points:
+                    plot_tier = position
+                    break
+        if plot_tier != self._plot_tier:
+            self._plot_tier = plot_tier
+            self._revision += 1
+
+    def _publish(self) -> None:
+        self._published = RollupSnapshot(
+            tuple((tier.bucket_secs, tier.storage.view()) for tier in self._tiers),
+            self._plot_tier,
+            self._revision,
+            self._first_met
+        )
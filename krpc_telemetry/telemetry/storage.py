@@ -0,0 +1,494 @@
+import itertools
+from typing import Dict, Any, List, Tuple, NamedTuple, Iterator, TYPE_CHECKING
+
+import numpy as np
+
+from krpc_telemetry.telemetry import TelemetryType
+from krpc_telemetry.telemetry.codec import encode_column, decode_column
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+# Samples sealed by a compressing ColumnarStorage, every column encoded on its own with the codec module
+class CompressedBlock(NamedTuple):
+    count: int
+    first_met: float
+    last_met: float
+    index: bytes
+    columns: Dict[str, bytes]
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.index) + sum(len(column) for column in self.columns.values())
+
+
+# Read-only, zero-copy window over the arrays of a ColumnarStorage. The storage never writes inside a window it
+# already published, so a view stays consistent while the processor thread keeps appending.
+# With compression the older samples are in sealed blocks, decoded only for the part of the history a read needs:
+# since() near the end touches the uncompressed samples only, index and values decode everything once per view.
+class StorageView:
+    def __init__(self, index: np.ndarray, columns: Dict[str, np.ndarray], version: int,
+                 max_samples: int | None = None, blocks: Tuple[CompressedBlock, ...] = ()):
+        self._index = _read_only(index)
+        self._columns = {name: _read_only(column) for name, column in columns.items()}
+        self._version = version
+        self._max_samples = max_samples
+        self._blocks = blocks
+        self._decoded = None
+
+    def __len__(self) -> int:
+        return sum(block.count for block in self._blocks) + len(self._index)
+
+    @property
+    def index(self) -> np.ndarray:
+        return self._decode()[0]
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self._columns.keys())
+
+    @property
+    def values(self) -> Dict[str, np.ndarray]:
+        return self._decode()[1]
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def max_samples(self) -> int | None:
+        return self._max_samples
+
+    @property
+    def first_met(self) -> float | None:
+        if self._blocks:
+            return self._blocks[0].first_met
+        return float(self._index[0]) if len(self._index) else None
+
+    @property
+    def last_met(self) -> float | None:
+        if len(self._index):
+            return float(self._index[-1])
+        return self._blocks[-1].last_met if self._blocks else None
+
+    def since(self, met: float) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        index, columns = self._decode_range(met, None)
+        # MET only grows, so the first sample after the given one can be found with a binary search
+        start = int(np.searchsorted(index, met, side="right"))
+        return index[start:], {name: column[start:] for name, column in columns.items()}
+
+    def between(self, start_met: float | None = None, end_met: float | None = None) -> "StorageView":
+        # samples with start_met <= MET <= end_met, zero-copy unless compressed blocks had to be decoded
+        index, columns = self._decode_range(start_met, end_met)
+        start = int(np.searchsorted(index, start_met, side="left")) if start_met is not None else 0
+        end = int(np.searchsorted(index, end_met, side="right")) if end_met is not None else len(index)
+        return StorageView(
+            index[start:end],
+            {name: column[start:end] for name, column in columns.items()},
+            self._version,
+            self._max_samples
+        )
+
+    def select(self, columns: List[str] | None) -> "StorageView":
+        # only the given columns, in that order, without decoding or copying anything
+        if columns is None:
+            return self
+        missing = [name for name in columns if name not in self._columns]
+        if missing:
+            raise ValueError("Unknown columns: %s" % ", ".join(missing))
+        return StorageView(
+            self._index,
+            {name: self._columns[name] for name in columns},
+            self._version,
+            self._max_samples,
+            tuple(block._replace(columns={name: block.columns[name] for name in columns if name in block.columns})
+                  for block in self._blocks)
+        )
+
+    def split(self) -> Tuple[Tuple[CompressedBlock, ...], "StorageView"]:
+        # the compressed blocks and a view of the uncompressed samples, StorageView(..., blocks=blocks) puts them
+        # back together somewhere else without anything decoded here
+        return self._blocks, StorageView(self._index, self._columns, self._version, self._max_samples)
+
+    def chunks(self, start_met: float | None = None, end_met: float | None = None,
+               rows: int = 8192) -> Iterator[Tuple[np.ndarray, Dict[str, np.ndarray]]]:
+        # the samples with start_met <= MET <= end_met at most rows at a time, compressed blocks are decoded one by
+        # one so that an export never holds the decoded history as a whole
+        empty_columns = {name: column[:0] for name, column in self._columns.items()}
+        if self._decoded is not None:
+            sources = [self._decoded]
+        else:
+            # a generator, the next block is decoded once the chunks of the previous one are consumed
+            sources = itertools.chain((
+                _decode_blocks((block,), self._index[:0], empty_columns) for block in self._blocks
+                if (start_met is None or block.last_met >= start_met) and
+                (end_met is None or block.first_met <= end_met)
+            ), [(self._index, self._columns)])
+        empty = True
+        for index, columns in sources:
+            for chunk in _range_chunks(index, columns, start_met, end_met, rows):
+                empty = False
+                yield chunk
+        if empty:
+            # still tells the columns
+            yield self._index[:0], empty_columns
+
+    def to_dataframe(self) -> "pd.DataFrame":
+        # pandas takes a good part of the startup time, a headless recorder may never need it
+        import pandas as pd
+
+        index, columns = self._decode()
+        index = pd.Index(index, name=TelemetryType.MET, copy=True)
+        return pd.DataFrame({name: column.copy() for name, column in columns.items()}, index=index)
+
+    def _decode(self) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        if not self._blocks:
+            return self._index, self._columns
+        if self._decoded is None:
+            self._decoded = _decode_blocks(self._blocks, self._index, self._columns)
+        return self._decoded
+
+    def _decode_range(self, start_met: float | None,
+                      end_met: float | None) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        # only the blocks overlapping the range, plus the uncompressed samples: a superset of the samples in it
+        if not self._blocks or self._decoded is not None:
+            return self._decode()
+        blocks = tuple(block for block in self._blocks
+                       if (start_met is None or block.last_met >= start_met) and
+                       (end_met is None or block.first_met <= end_met))
+        if len(blocks) == len(self._blocks):
+            return self._decode()
+        return _decode_blocks(blocks, self._index, self._columns)
+
+
+# Append-only columnar history: one preallocated NumPy array per column plus the MET index. Growable mode doubles
+# the buffers when full (amortized O(1) appends); with max_samples only the newest samples are kept, ring style, in
+# buffers twice that size that get compacted into fresh arrays when the end is reached. max_age_secs drops the samples
+# older than that many seconds of MET from the newest one in the same way.
+# With compression, as soon as the arrays hold block_size samples they get encoded into an immutable CompressedBlock,
+# so the arrays only need room for one block; retention then drops the old samples a whole block at a time, keeping
+# less than one block more than max_samples (or than max_age_secs at the sampling rate).
+# Only the processor thread appends; readers go through view(), built from a state tuple replaced at every append.
+class ColumnarStorage:
+    def __init__(self, initial_capacity: int = 1024, max_samples: int | None = None,
+                 max_age_secs: float | None = None, block_size: int | None = None):
+        if max_samples is not None and max_samples <= 0:
+            raise ValueError("max_samples must be a positive number")
+
+        self._max_samples = max_samples
+        self._max_age_secs = None
+        self.set_max_age_secs(max_age_secs)
+        self._block_size = None
+        self._blocks: Tuple[CompressedBlock, ...] = ()
+        self._blocks_count = 0
+        self._capacity = 2 * max_samples if max_samples else initial_capacity
+        self._start = 0
+        self._end = 0
+        self._version = 0
+        self._rewrites = 0
+        self._index = np.empty(self._capacity, dtype=np.float64)
+        self._columns: Dict[str, np.ndarray] = dict()
+        self._published = (self._index, self._columns, 0, 0, 0, self._blocks)
+        self.set_compression(block_size)
+
+    def __len__(self) -> int:
+        return self._blocks_count + self._end - self._start
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self._columns.keys())
+
+    @property
+    def max_samples(self) -> int | None:
+        return self._max_samples
+
+    @property
+    def max_age_secs(self) -> float | None:
+        return self._max_age_secs
+
+    def set_max_age_secs(self, max_age_secs: float | None) -> None:
+        if max_age_secs is not None and max_age_secs <= 0:
+            raise ValueError("max_age_secs must be a positive number")
+        self._max_age_secs = max_age_secs
+
+    @property
+    def block_size(self) -> int | None:
+        return self._block_size
+
+    def set_compression(self, block_size: int | None = 1024) -> None:
+        # samples already in the arrays get sealed with the next appends
+        if block_size is not None and block_size <= 0:
+            raise ValueError("block_size must be a positive number")
+        self._block_size = block_size
+        if block_size is not None and self._end == 0:
+            self._capacity = self._block_capacity()
+            self._index = np.empty(self._capacity, dtype=np.float64)
+            self._published = (self._index, self._columns, 0, 0, 0, self._blocks)
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @property
+    def rewrites(self) -> int:
+        # how many times merge() changed samples already published, appending never does
+        return self._rewrites
+
+    @property
+    def nbytes(self) -> int:
+        return self._index.nbytes + sum(column.nbytes for column in self._columns.values()) + \
+            sum(block.nbytes for block in self._blocks)
+
+    @property
+    def first_met(self) -> float | None:
+        if self._blocks:
+            return self._blocks[0].first_met
+        return float(self._index[self._start]) if self._end > self._start else None
+
+    @property
+    def last_met(self) -> float | None:
+        if self._end > self._start:
+            return float(self._index[self._end - 1])
+        return self._blocks[-1].last_met if self._blocks else None
+
+    @property
+    def state(self) -> Tuple:
+        # opaque marker of the last published append, view(state) builds the view of that moment later
+        return self._published
+
+    def view(self, state: Tuple | None = None) -> StorageView:
+        index, columns, start, end, version, blocks = state if state is not None else self._published
+        return StorageView(
+            index[start:end],
+            {name: column[start:end] for name, column in columns.items()},
+            version,
+            self._max_samples,
+            blocks
+        )
+
+    def append(self, met: float, values: Dict[str, Any]) -> None:
+        if self._end == self._capacity:
+            self._make_room()
+
+        position = self._end
+        self._index[position] = met
+        for name, value in values.items():
+            column = self._columns.get(name)
+            if column is None:
+                column = self._add_column(name)
+            column[position] = value
+
+        if len(values) != len(self._columns):
+            for name, column in self._columns.items():
+                if name not in values:
+                    column[position] = np.nan
+
+        self._end += 1
+        # once there are blocks the oldest samples are in them, retention drops them a block at a time
+        if self._blocks:
+            self._drop_blocks()
+        else:
+            self._drop_samples()
+        if self._block_size is not None and self._end - self._start >= self._block_size:
+            self._seal_block()
+        self._version += 1
+        self._published = (self._index, self._columns, self._start, self._end, self._version, self._blocks)
+
+    def merge(self, samples: List[Tuple[float, Dict[str, Any]]],
+              replace: bool = False) -> List[Tuple[float, Dict[str, Any]]]:
+        # samples, sorted by MET, that can be older than the newest stored one (a pre-trigger window). The tail of the
+        # history from the oldest of them is rewritten into fresh arrays, views handed out keep the old ones.
+        # Samples as old as a compressed block are skipped, and so are the ones with a MET already stored unless
+        # replace is set: then they take the place of the stored sample. The retention applies to the merged history,
+        # with max_samples the oldest samples go, merged or not.
+        # Returns the samples that were stored.
+        last_met = self.view().last_met
+        if last_met is None or samples[0][0] > last_met:
+            for met, values in samples:
+                self.append(met, values)
+            return self._kept(samples)
+
+        stored = self._index[self._start:self._end]
+        sealed_met = self._blocks[-1].last_met if self._blocks else None
+        samples = [(met, values) for met, values in samples
+                   if (sealed_met is None or met > sealed_met) and (replace or not _contains(stored, met))]
+        if not samples:
+            return samples
+        position = self._start + int(np.searchsorted(stored, samples[0][0], side="left"))
+
+        names = list(self._columns.keys())
+        for _, values in samples:
+            names.extend(name for name in values.keys() if name not in self._columns and name not in names)
+        tail_index = self._index[position:self._end]
+        merged_index = np.concatenate((tail_index, [met for met, _ in samples]))
+        order = np.argsort(merged_index, kind="stable")
+        if replace:
+            # a stored sample comes before the new one with its MET, only the last of a MET is kept
+            sorted_index = merged_index[order]
+            order = order[np.append(sorted_index[1:] != sorted_index[:-1], True)]
+
+        head_size = position - self._start
+        size = head_size + len(order)
+        if self._max_samples is not None and size > self._max_samples:
+            # samples the retention would drop right away, the stored ones first, then the oldest merged ones
+            head_size = max(head_size - (size - self._max_samples), 0)
+            size = self._max_samples
+        while 2 * size > self._capacity:
+            self._capacity *= 2
+        index = np.empty(self._capacity, dtype=np.float64)
+        index[:head_size] = self._index[position - head_size:position]
+        index[head_size:size] = merged_index[order][-(size - head_size):]
+        columns = dict()
+        for name in names:
+            column = self._columns.get(name)
+            merged = np.concatenate((
+                column[position:self._end] if column is not None else np.full(len(tail_index), np.nan),
+                [values.get(name, np.nan) for _, values in samples]
+            ))
+            columns[name] = np.full(self._capacity, np.nan, dtype=np.float64)
+            if column is not None:
+                columns[name][:head_size] = column[position - head_size:position]
+            columns[name][head_size:size] = merged[order][-(size - head_size):]
+
+        self._index = index
+        self._columns = columns
+        self._start = 0
+        self._end = size
+        self._drop_blocks()
+        if not self._blocks:
+            self._drop_samples()
+        self._version += 1
+        self._rewrites += 1
+        self._published = (self._index, self._columns, self._start, self._end, self._version, self._blocks)
+        return self._kept(samples)
+
+    def to_dataframe(self) -> "pd.DataFrame":
+        return self.view().to_dataframe()
+
+    def since(self, met: float) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        return self.view().since(met)
+
+    def _add_column(self, name: str) -> np.ndarray:
+        # samples stored before the column existed have no value for it
+        column = np.full(self._capacity, np.nan, dtype=np.float64)
+        # the published dict is never modified, a view could be iterating it
+        self._columns = {**self._columns, name: column}
+        return column
+
+    def _seal_block(self) -> None:
+        start = self._start
+        end = start + self._block_size
+        block = CompressedBlock(
+            self._block_size,
+            float(self._index[start]),
+            float(self._index[end - 1]),
+            encode_column(self._index[start:end]),
+            {name: encode_column(column[start:end]) for name, column in self._columns.items()}
+        )
+        self._start = end
+        # a new tuple, views keep the blocks they were built with
+        self._blocks = (*self._blocks, block)
+        self._blocks_count += block.count
+        self._drop_blocks()
+
+    def _drop_blocks(self) -> None:
+        # the retention of the compressed samples, a whole block at a time
+        blocks = self._blocks
+        if not blocks:
+            return
+        last_met = float(self._index[self._end - 1]) if self._end > self._start else blocks[-1].last_met
+        total = self._blocks_count + self._end - self._start
+        dropped = 0
+        while dropped < len(blocks) and (
+                (self._max_samples is not None and total - blocks[dropped].count >= self._max_samples) or
+                (self._max_age_secs is not None and blocks[dropped].last_met < last_met - self._max_age_secs)):
+            total -= blocks[dropped].count
+            dropped += 1
+        if dropped:
+            # a new tuple, views keep the blocks they were built with
+            self._blocks = blocks[dropped:]
+            self._blocks_count = sum(block.count for block in self._blocks)
+
+    def _drop_samples(self) -> None:
+        # the retention of the uncompressed samples, when no block is left
+        if self._max_samples is not None and self._end - self._start > self._max_samples:
+            self._start = self._end - self._max_samples
+        if self._max_age_secs is not None:
+            oldest_met = self._index[self._end - 1] - self._max_age_secs
+            # at a steady rate every append drops one sample at most, a binary search only after a gap
+            if self._index[self._start] < oldest_met:
+                if self._index[self._start + 1] >= oldest_met:
+                    self._start += 1
+                else:
+                    self._start += int(np.searchsorted(self._index[self._start:self._end], oldest_met, side="left"))
+
+    def _kept(self, samples: List[Tuple[float, Dict[str, Any]]]) -> List[Tuple[float, Dict[str, Any]]]:
+        # the samples retention did not drop yet
+        first_met = self.view().first_met
+        return [sample for sample in samples if sample[0] >= first_met]
+
+    def _make_room(self) -> None:
+        size = self._end - self._start
+        if self._block_size is not None:
+            # the arrays hold more than a block only for a while after a merge, until it is sealed
+            self._capacity = max(self._block_capacity(), 2 * size)
+        elif self._max_samples is not None:
+            self._capacity = 2 * self._max_samples
+        # with an age limit the buffers may be mostly free already
+        elif 2 * size > self._capacity:
+            self._capacity *= 2
+
+        # always copy into new arrays, views handed out before the compaction keep pointing to valid data
+        self._index = _compact(self._index, self._start, self._end, self._capacity)
+        self._columns = {
+            name: _compact(column, self._start, self._end, self._capacity) for name, column in self._columns.items()
+        }
+
+        self._start = 0
+        self._end = size
+
+    def _block_capacity(self) -> int:
+        # the samples of the block being filled, a ring smaller than a block never seals any
+        if self._max_samples is not None and self._max_samples < self._block_size:
+            return 2 * self._max_samples
+        return self._block_size
+
+
+def _decode_blocks(blocks: Tuple[CompressedBlock, ...], index: np.ndarray,
+                   columns: Dict[str, np.ndarray]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    # blocks sealed before a column existed have no values for it
+    decoded_index = _read_only(np.concatenate([*(decode_column(block.index) for block in blocks), index]))
+    decoded_columns = dict()
+    for name, column in columns.items():
+        decoded_columns[name] = _read_only(np.concatenate([
+            *(decode_column(block.columns[name]) if name in block.columns else np.full(block.count, np.nan)
+              for block in blocks),
+            column
+        ]))
+    return decoded_index, decoded_columns
+
+
+def _range_chunks(index: np.ndarray, columns: Dict[str, np.ndarray], start_met: float | None, end_met: float | None,
+                  rows: int) -> Iterator[Tuple[np.ndarray, Dict[str, np.ndarray]]]:
+    start = int(np.searchsorted(index, start_met, side="left")) if start_met is not None else 0
+    end = int(np.searchsorted(index, end_met, side="right")) if end_met is not None else len(index)
+    for chunk_start in range(start, end, rows):
+        chunk_end = min(chunk_start + rows, end)
+        yield index[chunk_start:chunk_end], {name: column[chunk_start:chunk_end] for name, column in columns.items()}
+
+
+def _contains(index: np.ndarray, met: float) -> bool:
+    position = int(np.searchsorted(index, met, side="left"))
+    return position < len(index) and index[position] == met
+
+
+def _compact(array: np.ndarray, start: int, end: int, capacity: int) -> np.ndarray:
+    result = np.empty(capacity, dtype=array.dtype)
+    result[:end - start] = array[start:end]
+    return result
+
+
+def _read_only(array: np.ndarray) -> np.ndarray:
+    array.flags.writeable = False
+    return array
@@ -1,124 +1,373 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Set, cast
+from functools import cached_property
+from typing import Dict, Any, Set, Tuple, List, Callable, TYPE_CHECKING
 
-import pandas as pd
-from pandas.core.interchange.dataframe_protocol import DataFrame
-from plotly.graph_objs import Figure, Scatter
+import numpy as np
 
 from krpc_telemetry.telemetry import TelemetryType
+from krpc_telemetry.telemetry.downsampling import SeriesDownsampler, DownsampledSeries
+from krpc_telemetry.telemetry.filters import SampleFilter
+from krpc_telemetry.telemetry.registry import Registry
+from krpc_telemetry.telemetry.rollup import TelemetryRollup, RollupSnapshot
+from krpc_telemetry.telemetry.storage import ColumnarStorage, StorageView
+
+# pandas and plotly are imported by the first plot or dataframe, a headless recorder starts without them
+if TYPE_CHECKING:
+    from pandas.core.interchange.dataframe_protocol import DataFrame
+    from plotly.graph_objs import Figure
+
+# what a figure is built from: the samples of the strategy, or x and y of every trace once downsampled
+PlotInput = StorageView | Dict[str, Tuple[np.ndarray, np.ndarray]]
+
+
+# Immutable state of a strategy at one moment, safe to read from any thread. The storage view is only built when
+# a reader needs it, taking the snapshot costs nothing on the processor thread.
+class StrategySnapshot:
+    def __init__(self, storage: ColumnarStorage, storage_state: Tuple, version: int,
+                 downsampled: DownsampledSeries | None, rollup: RollupSnapshot | None = None, rewrites: int = 0):
+        self._storage = storage
+        self._storage_state = storage_state
+        self.version = version
+        self.downsampled = downsampled
+        self.rollup = rollup
+        self.rewrites = rewrites
+
+    @cached_property
+    def view(self) -> StorageView:
+        return self._storage.view(self._storage_state)
+
+    @property
+    def plot_revision(self) -> int:
+        # a client holding a figure with a different revision needs the whole figure again, samples merged into the
+        # history (a burst capture) are not at the end of the traces
+        if self.downsampled is not None:
+            return self.rewrites + self.downsampled.revision
+        return self.rewrites + (self.rollup.revision if self.rollup is not None else 0)
 
 
 class TelemetryStrategy(ABC):
-    def __init__(self, name: str, title: str, collect_every_secs: int = 1):
+    def __init__(self, name: str, title: str, collect_every_secs: float = 1, max_samples: int | None = None):
         self._collect_every_secs = collect_every_secs
         self._lastMet = -1
-        self._dataframe = pd.DataFrame()
+        self._nextMet = 0.0
+        self._storage = ColumnarStorage(max_samples=max_samples)
+        self._dataframe = (None, -1)
+        # (data version, figure, JSON) of the last built plot, the JSON is serialized on first request
+        self._plot_cache = (-1, None, None)
         self.name = name
         self.title = title
-        self.plot: Figure | None = None
-
-    def collect_data(self, met: int, data: Dict[TelemetryType, Any]) -> None:
-        if self._lastMet != -1 and self._collect_every_secs + self._lastMet > met:
+        self.plot: "Figure | None" = None
+        self.downsampler: SeriesDownsampler | None = None
+        self.sample_filter: SampleFilter | None = None
+        self._rollup: TelemetryRollup | None = None
+
+    def collect_data(self, met: float, data: Dict[TelemetryType, Any], force: bool = False) -> None:
+        # a sample slightly ahead of its slot is accepted, updates never arrive exactly on time
+        if self._lastMet != -1 and met < self._nextMet - 0.1 * self._collect_every_secs:
+            # during a burst capture every sample is stored, the slots keep their cadence
+            if force and met > self._lastMet:
+                self._lastMet = met
+                merged = self._merge_data([(met, data)])
+                if merged:
+                    self._update_history(merged)
             return
 
+        # the next slot is computed from the previous one so the sampling period doesn't drift,
+        # unless the samples fell behind by more than a period
+        if self._lastMet != -1 and met < self._nextMet + self._collect_every_secs:
+            self._nextMet += self._collect_every_secs
+        else:
+            self._nextMet = met + self._collect_every_secs
         self._lastMet = met
-        self._collect_data(met, data)
+        # a sample filter may store nothing, the history is only updated with new samples
+        version = self._storage.version
+        merged = None
+        if force:
+            merged = self._merge_data([(met, data)])
+        else:
+            self._collect_data(met, data)
+        if self._storage.version != version:
+            self._update_history(merged)
+
+    def collect_burst(self, samples: List[Tuple[float, Dict[TelemetryType, Any]]]) -> None:
+        # samples taken before a burst capture started, older than the ones already stored
+        if not samples:
+            return
+        merged = self._merge_data(samples)
+        self._lastMet = max(self._lastMet, samples[-1][0])
+        if merged:
+            self._update_history(merged)
+
+    def _update_history(self, merged: List[Tuple[float, Dict[str, Any]]] | None = None) -> None:
+        # merged: the samples stored by _merge_data, the rollup adds the older ones to the buckets they belong to
+        if self.downsampler is not None:
+            self.downsampler.update(self._storage)
+        if self._rollup is not None:
+            if merged is not None:
+                self._rollup.merge(self._storage, merged)
+            else:
+                self._rollup.update(self._storage)
+
+    @property
+    def storage(self) -> ColumnarStorage:
+        return self._storage
 
     @property
-    def dataframe(self) -> DataFrame:
-        return self._dataframe
+    def rollup(self) -> TelemetryRollup | None:
+        return self._rollup
+
+    def set_rollup(self, rollup: TelemetryRollup) -> None:
+        # the tiers keep the history, the raw samples are only needed for the most recent part
+        self._rollup = rollup
+        self._storage.set_max_age_secs(rollup.raw_secs)
+
+    @property
+    def max_plot_points(self) -> int | None:
+        # how many points a plot can reach before it's worth rebuilding it from scratch
+        if self.downsampler is not None:
+            return self.downsampler.max_points
+        return self._rollup.max_points if self._rollup is not None else None
+
+    def snapshot(self) -> StrategySnapshot:
+        return StrategySnapshot(
+            self._storage,
+            self._storage.state,
+            self._storage.version,
+            self.downsampler.snapshot() if self.downsampler is not None else None,
+            self._rollup.snapshot() if self._rollup is not None else None,
+            self._storage.rewrites
+        )
+
+    @property
+    def dataframe(self) -> "DataFrame":
+        return self.get_dataframe(self._storage.view())
+
+    def get_dataframe(self, view: StorageView) -> "DataFrame":
+        # built from the column arrays only when somebody asks and only if new samples arrived since the last build
+        dataframe, version = self._dataframe
+        if version != view.version:
+            dataframe = view.to_dataframe()
+            self._dataframe = (dataframe, view.version)
+        return dataframe
+
+    def get_span_dataframe(self, snapshot: StrategySnapshot, start_met: float | None = None,
+                           end_met: float | None = None) -> "DataFrame":
+        if snapshot.rollup is None and start_met is None and end_met is None:
+            return self.get_dataframe(snapshot.view)
+        return self.get_span_view(snapshot, start_met, end_met).to_dataframe()
+
+    def get_span_view(self, snapshot: StrategySnapshot, start_met: float | None = None,
+                      end_met: float | None = None) -> StorageView:
+        # with rollup tiers a span older than the raw samples is read from the finest tier that covers it
+        if snapshot.rollup is not None:
+            return snapshot.rollup.select(snapshot.view, start_met, end_met, self._rollup.max_points)
+        if start_met is None and end_met is None:
+            return snapshot.view
+        return snapshot.view.between(start_met, end_met)
 
     @abstractmethod
-    def _collect_data(self, met: int, data: Dict[TelemetryType, Any]) -> None:
+    def _collect_data(self, met: float, data: Dict[TelemetryType, Any]) -> None:
+        pass
+
+    @abstractmethod
+    def _merge_data(self, samples: List[Tuple[float, Dict[TelemetryType, Any]]]) -> List[Tuple[float, Dict[str, Any]]]:
+        # stores every sample as it is, even the ones older than the last stored sample; returns the samples stored,
+        # as the storage got them
         pass
 
     @abstractmethod
     def get_telemetry_types(self) -> Set[TelemetryType]:
         pass
 
+    def get_telemetry_plot(self, snapshot: StrategySnapshot | None = None) -> "Figure":
+        if snapshot is None:
+            snapshot = self.snapshot()
+        # the figure only changes when the strategy stores a new sample
+        version, plot, _ = self._plot_cache
+        if version == snapshot.version:
+            return plot
+
+        plot = self._get_telemetry_plot(snapshot)
+        if snapshot.version > self._plot_cache[0]:
+            self._plot_cache = (snapshot.version, plot, None)
+        return plot
+
+    def get_telemetry_plot_json(self, snapshot: StrategySnapshot | None = None) -> str:
+        if snapshot is None:
+            snapshot = self.snapshot()
+        plot = self.get_telemetry_plot(snapshot)
+        version, cached_plot, plot_json = self._plot_cache
+        if cached_plot is plot and plot_json is not None:
+            return plot_json
+
+        import plotly.io
+
+        plot_json = plotly.io.to_json(plot, validate=False)
+        if cached_plot is plot:
+            self._plot_cache = (version, plot, plot_json)
+        return plot_json
+
+    def get_plot_input(self, snapshot: StrategySnapshot) -> "PlotInput | None":
+        # the arrays the figure is built from, for build_plot in another process; None when the strategy can only
+        # build its figure itself
+        return None
+
     @abstractmethod
-    def get_telemetry_plot(self) -> Figure:
+    def _get_telemetry_plot(self, snapshot: StrategySnapshot) -> "Figure":
         pass
 
 
 class GenericTelemetryStrategy(TelemetryStrategy, ABC):
-    def __init__(self, name: str, title: str, telemetry_types: list[TelemetryType], collect_every_secs: int = 1):
-        super().__init__(name, title, collect_every_secs)
+    def __init__(self, name: str, title: str, telemetry_types: list[TelemetryType], collect_every_secs: float = 1,
+                 max_samples: int | None = None):
+        super().__init__(name, title, collect_every_secs, max_samples)
         self._telemetry_types = telemetry_types
 
     def get_telemetry_types(self) -> Set[TelemetryType]:
         return {TelemetryType.MET, *self._telemetry_types}
 
-    def _collect_data(self, met: int, data: Dict[TelemetryType, Any]):
+    def _collect_data(self, met: float, data: Dict[TelemetryType, Any]):
+        collected_data = self._transform_data(data)
+        if self.sample_filter is None:
+            self._storage.append(met, collected_data)
+            return
+        for sample_met, sample_data in self.sample_filter.filter(met, collected_data):
+            self._storage.append(sample_met, sample_data)
+
+    def _merge_data(self, samples: List[Tuple[float, Dict[TelemetryType, Any]]]):
+        # burst samples skip the sample filter, they are there for their resolution
+        collected_samples = [(met, self._transform_data(data)) for met, data in samples]
+        merged = self._storage.merge(collected_samples)
+        if self.sample_filter is not None:
+            self.sample_filter.stored(*collected_samples[-1])
+        return merged
+
+    def _transform_data(self, data: Dict[TelemetryType, Any]) -> Dict[str, Any]:
         collected_data = dict()
-
-        collected_data[TelemetryType.MET] = met
-
         for telemetry_type in self._telemetry_types:
             transform_data(telemetry_type, data[telemetry_type], collected_data)
+        return collected_data
 
-        collected_data_dataframe = pd.DataFrame(collected_data, index=[0])
-        collected_data_dataframe.set_index(TelemetryType.MET, inplace=True)
-        self._dataframe = pd.concat(
-            [
-                self._dataframe,
-                collected_data_dataframe
-            ]) if len(self._dataframe) else collected_data_dataframe
-
-    def get_telemetry_plot(self):
-        plot: Figure = self._dataframe.plot()
-        for index in range(0, len(plot.data)):
-            set_spline_line(plot.data[index])
-        return plot
+    def get_plot_input(self, snapshot: StrategySnapshot) -> "PlotInput":
+        if snapshot.downsampled is not None:
+            return snapshot.downsampled.series(snapshot.view)
+        if snapshot.rollup is not None:
+            return snapshot.rollup.series(snapshot.view)
+        return snapshot.view
+
+    def _get_telemetry_plot(self, snapshot: StrategySnapshot):
+        plot_input = self.get_plot_input(snapshot)
+        if isinstance(plot_input, StorageView):
+            # the dataframe is cached by the strategy, build_plot would convert the view again
+            return build_dataframe_plot(self.get_dataframe(plot_input))
+        return build_telemetry_plot(plot_input)
 
 
 class OrbitalVelocityStrategy(GenericTelemetryStrategy, ABC):
-    def __init__(self, collect_every_secs: int = 1):
-        super().__init__("orbital_velocity", "Orbital Velocity", [TelemetryType.ORBITAL_SPEED], collect_every_secs)
+    def __init__(self, collect_every_secs: float = 1, max_samples: int | None = None):
+        super().__init__("orbital_velocity", "Orbital Velocity", [TelemetryType.ORBITAL_SPEED],
+                         collect_every_secs, max_samples)
 
 
 class SurfaceVelocityStrategy(GenericTelemetryStrategy, ABC):
-    def __init__(self, collect_every_secs: int = 1):
+    def __init__(self, collect_every_secs: float = 1, max_samples: int | None = None):
         super().__init__("surface_velocity", "Surface Velocity",
                          [TelemetryType.SURFACE_SPEED,
                           TelemetryType.SURFACE_HORIZONTAL_SPEED,
                           TelemetryType.SURFACE_VERTICAL_SPEED]
-                         , collect_every_secs)
+                         , collect_every_secs, max_samples)
 
 
 class OrbitApoEpiStrategy(GenericTelemetryStrategy, ABC):
-    def __init__(self, collect_every_secs: int = 1):
+    def __init__(self, collect_every_secs: float = 1, max_samples: int | None = None):
         super().__init__("orbit_apo_peri", "Orbital Apoapsis and Periapsis",
-                         [TelemetryType.ORBITAL_APOAPSIS, TelemetryType.ORBITAL_PERIAPSIS], collect_every_secs)
+                         [TelemetryType.ORBITAL_APOAPSIS, TelemetryType.ORBITAL_PERIAPSIS],
+                         collect_every_secs, max_samples)
 
 
 class AtmospherePressureStrategy(GenericTelemetryStrategy, ABC):
-    def __init__(self, collect_every_secs: int = 1):
+    def __init__(self, collect_every_secs: float = 1, max_samples: int | None = None):
         super().__init__("atm_pressure", "Atmosphere pressure and forces",
                          [TelemetryType.ATMOSPHERE_DENSITY,
                           TelemetryType.DYNAMIC_PRESSURE,
                           TelemetryType.STATIC_PRESSURE]
-                         , collect_every_secs)
+                         , collect_every_secs, max_samples)
 
 
 class GForceStrategy(GenericTelemetryStrategy, ABC):
-    def __init__(self, collect_every_secs: int = 1):
-        super().__init__("gforce", "G-Force", [TelemetryType.G_FORCE], collect_every_secs)
+    def __init__(self, collect_every_secs: float = 1, max_samples: int | None = None):
+        super().__init__("gforce", "G-Force", [TelemetryType.G_FORCE], collect_every_secs, max_samples)
 
 
 class AerodynamicForceStrategy(GenericTelemetryStrategy, ABC):
-    def __init__(self, collect_every_secs: int = 1):
-        super().__init__("aero_force", "Aerodynamic Force", [TelemetryType.AERODYNAMIC_FORCE], collect_every_secs)
+    def __init__(self, collect_every_secs: float = 1, max_samples: int | None = None):
+        super().__init__("aero_force", "Aerodynamic Force", [TelemetryType.AERODYNAMIC_FORCE],
+                         collect_every_secs, max_samples)
 
 
 class CenterOfMassStrategy(GenericTelemetryStrategy, ABC):
-    def __init__(self, collect_every_secs: int = 1):
-        super().__init__("center_mass", "Center of Mass", [TelemetryType.CENTER_OF_MASS], collect_every_secs)
+    def __init__(self, collect_every_secs: float = 1, max_samples: int | None = None):
+        super().__init__("center_mass", "Center of Mass", [TelemetryType.CENTER_OF_MASS],
+                         collect_every_secs, max_samples)
+
+
+# Plots any list of channels, telemetry types or derived channels, declared in the configuration
+class ChannelsTelemetryStrategy(GenericTelemetryStrategy):
+    def __init__(self, name: str, title: str, channels: list[str], collect_every_secs: float = 1,
+                 max_samples: int | None = None):
+        super().__init__(name, title, [
+            TelemetryType(channel) if channel in TelemetryType.__members__.values() else channel
+            for channel in channels
+        ], collect_every_secs, max_samples)
+
+
+# The strategies a telemetry of the configuration can name, built with collect_every_secs, max_samples and the
+# "options" of the telemetry. Other packages add theirs through the krpc_telemetry.strategies entry points.
+STRATEGIES: Registry[Callable[..., TelemetryStrategy]] = Registry("strategy", "krpc_telemetry.strategies")
+STRATEGIES.register("orbital_velocity", OrbitalVelocityStrategy)
+STRATEGIES.register("surface_velocity", SurfaceVelocityStrategy)
+STRATEGIES.register("orbit_apo_peri", OrbitApoEpiStrategy)
+STRATEGIES.register("gforce", GForceStrategy)
+STRATEGIES.register("atm_pressure", AtmospherePressureStrategy)
+STRATEGIES.register("aero_force", AerodynamicForceStrategy)
+STRATEGIES.register("center_mass", CenterOfMassStrategy)
+
+
+def build_plot(plot_input: "PlotInput") -> "Figure":
+    if isinstance(plot_input, StorageView):
+        return build_dataframe_plot(plot_input.to_dataframe())
+    return build_telemetry_plot(plot_input)
+
+
+def build_dataframe_plot(dataframe: "DataFrame") -> "Figure":
+    plot: "Figure" = dataframe.plot(backend="plotly")
+    for index in range(0, len(plot.data)):
+        set_spline_line(plot.data[index])
+    return plot
+
+
+def build_telemetry_plot(series: Dict[str, Tuple[np.ndarray, np.ndarray]]) -> "Figure":
+    from plotly.graph_objs import Figure, Scatter
+
+    # same look of the pandas plotly backend, but every trace can have its own x values
+    plot = Figure([
+        Scatter(x=x, y=y, name=name, mode="lines", legendgroup=name,
+                hovertemplate="variable=%s<br>%s=%%{x}<br>value=%%{y}<extra></extra>" % (name, TelemetryType.MET))
+        for name, (x, y) in series.items()
+    ])
+    plot.update_layout(xaxis_title=TelemetryType.MET, yaxis_title="value", legend_title_text="variable")
+    for index in range(0, len(plot.data)):
+        set_spline_line(plot.data[index])
+    return plot
 
 
 def set_spline_line(data: Any) -> None:
-    scatter_0: Scatter = cast(Scatter, data)
-    scatter_0.line.shape = "spline"
+    from plotly.graph_objs import Scatter
+
+    # plotly switches long series to WebGL traces, which can't draw splines
+    if not isinstance(data, Scatter):
+        return
+    data.line.shape = "spline"
 
 
 def transform_data(telemetry_type: TelemetryType, data: Any, collected_data: dict) -> Any:
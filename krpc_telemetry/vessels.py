@@ -0,0 +1,240 @@
+import copy
+import os
+import re
+import threading
+from fnmatch import fnmatchcase
+from time import sleep, monotonic
+from typing import Dict, Any, List, NamedTuple
+
+from krpc import Client
+from krpc.error import RPCError, StreamError
+from krpc.services.spacecenter import Vessel
+
+from krpc_telemetry.krpc_streams import KrpcStreamPool, KrpcTelemetryStreamFactory, KrpcTelemetryStreamCollection, \
+    init_streams_from_telemetry_processor, StreamDefinition
+from krpc_telemetry.processor_builder import TelemetryProcessorBuilder
+from krpc_telemetry.telemetry.processor import TelemetryProcessor
+from krpc_telemetry.telemetry.render_pool import RenderPool
+from krpc_telemetry.telemetry.strategy import TelemetryStrategy
+
+
+# Which vessels to track. kRPC gives vessels no identifier that survives a reload of the game: vessel is a Vessel
+# object of the connection, for a program that picked it and for the session only, name and name_pattern (fnmatch,
+# case sensitive) survive renames made by staging only if the pattern covers the new names. active tracks whatever
+# vessel is being flown.
+class VesselSelector(NamedTuple):
+    name: str | None = None
+    name_pattern: str | None = None
+    vessel: Vessel | None = None
+    active: bool = False
+
+    def matches(self, vessel: Vessel, name: str, active: bool) -> bool:
+        if self.active and active:
+            return True
+        if self.vessel is not None and vessel == self.vessel:
+            return True
+        if self.name is not None and name == self.name:
+            return True
+        return self.name_pattern is not None and fnmatchcase(name, self.name_pattern)
+
+
+# A vessel that matched a selector at least once. The processor keeps its history after the vessel is gone, the
+# collection is None while the vessel isn't tracked anymore.
+class TrackedVessel:
+    def __init__(self, key: str, name: str, vessel: Vessel, processor: TelemetryProcessor):
+        self.key = key
+        self.name = name
+        self.vessel = vessel
+        self.processor = processor
+        self.collection: KrpcTelemetryStreamCollection | None = None
+        self.active = False
+
+    @property
+    def tracking(self) -> bool:
+        return self.collection is not None
+
+
+# Telemetry of several vessels over one kRPC connection, a processor per vessel built from the same configuration.
+# The factories of all the vessels share a stream pool, a stream asked by two of them is added to the server once.
+# A single thread collects every tracked vessel each interval and, every discover_secs, looks for the vessels that
+# started or stopped matching the selectors: new vessels after staging or undocking, the vessel switched to, the
+# ones destroyed or recovered. Adding a vessel costs its streams, not a thread.
+class MultiVesselTelemetry:
+    def __init__(self, conn: Client, config: Any, selectors: List[VesselSelector], interval_secs: float = 1,
+                 discover_secs: float = 5, default_rate: float | None = None,
+                 rates: Dict[str, float] | None = None,
+                 adaptive_rates: Dict[str, Dict[str, Any]] | None = None,
+                 streams: Dict[str, StreamDefinition] | None = None):
+        self._conn = conn
+        self._config = config
+        self._selectors = selectors
+        self._interval_secs = interval_secs
+        self._discover_secs = discover_secs
+        self._default_rate = default_rate if default_rate is not None else 1 / interval_secs
+        self._rates = rates
+        self._adaptive_rates = adaptive_rates
+        self._streams = streams
+        self._pool = KrpcStreamPool(conn)
+        # strategies and telemetry types every vessel processor will have, without a recorder to start
+        self._template = TelemetryProcessorBuilder.build_processor(dict(config, recorder=None, metrics=None,
+                                                                        render_pool=None))
+        # the workers render the figures of every vessel, a pool each would be a process per vessel. Started and
+        # stopped here, the processors only use it
+        self._render_pool = RenderPool(**config["render_pool"]) if config.get("render_pool") is not None else None
+        # replaced, never changed, when vessels are added: readers use the dictionary they got without locking
+        self._vessels: Dict[str, TrackedVessel] = dict()
+        self._run_thread = False
+        self._collection_thread = None
+
+    @property
+    def vessels(self) -> Dict[str, TrackedVessel]:
+        return self._vessels
+
+    @property
+    def strategies(self) -> List[TelemetryStrategy]:
+        return self._template.strategies
+
+    @property
+    def active_key(self) -> str | None:
+        return next((tracked.key for tracked in self._vessels.values() if tracked.active), None)
+
+    @property
+    def pool(self) -> KrpcStreamPool:
+        return self._pool
+
+    def get_processor(self, key: str) -> TelemetryProcessor | None:
+        tracked = self._vessels.get(key)
+        return tracked.processor if tracked is not None else None
+
+    def start(self) -> None:
+        if self._run_thread:
+            return
+        self._run_thread = True
+        if self._render_pool is not None:
+            self._render_pool.start()
+        self.discover()
+        self._collection_thread = threading.Thread(target=self._collection_thread_function)
+        self._collection_thread.start()
+
+    def stop(self) -> None:
+        if not self._run_thread:
+            return
+        self._run_thread = False
+        self._collection_thread.join()
+        for tracked in self._vessels.values():
+            self._release(tracked)
+            tracked.processor.stop_outputs()
+        if self._render_pool is not None:
+            self._render_pool.stop()
+
+    def discover(self) -> None:
+        space_center = self._conn.space_center
+        try:
+            active_vessel = space_center.active_vessel
+        except ValueError:
+            # no vessel flown, in the space center or the tracking station
+            active_vessel = None
+        matched = dict()
+        for vessel in space_center.vessels:
+            try:
+                name = vessel.name
+            except RPCError:
+                # gone between the list and the call
+                continue
+            if any(selector.matches(vessel, name, vessel == active_vessel) for selector in self._selectors):
+                matched[vessel] = name
+
+        vessels = dict(self._vessels)
+        known = {tracked.vessel: tracked for tracked in vessels.values()}
+        for tracked in vessels.values():
+            tracked.active = tracked.vessel == active_vessel
+            if tracked.tracking and tracked.vessel not in matched:
+                print("Vessel %s is not tracked anymore" % tracked.name)
+                self._release(tracked)
+        for vessel, name in matched.items():
+            tracked = known.get(vessel)
+            if tracked is None:
+                key = self._unique_key(name, vessels)
+                tracked = TrackedVessel(key, name, vessel, self._build_processor(key))
+                tracked.active = vessel == active_vessel
+                tracked.processor.start_outputs()
+                vessels[tracked.key] = tracked
+                print("Tracking vessel %s as %s" % (name, tracked.key))
+            if not tracked.tracking:
+                tracked.collection = self._create_collection(tracked)
+        self._vessels = vessels
+
+    def collect(self) -> None:
+        # one pass over the tracked vessels, a vessel whose streams have no value yet or that just got destroyed is
+        # skipped until the next pass or the next discovery
+        for tracked in list(self._vessels.values()):
+            collection = tracked.collection
+            if collection is None:
+                continue
+            try:
+                data = collection.collect_data()
+            except (StreamError, RPCError):
+                continue
+            tracked.processor.process_telemetry_data(data)
+
+    def _collection_thread_function(self):
+        next_collect = monotonic()
+        next_discover = next_collect + self._discover_secs
+        while self._run_thread:
+            delay = next_collect - monotonic()
+            if delay > 0:
+                sleep(min(delay, 1))
+                continue
+            next_collect = max(next_collect + self._interval_secs, monotonic())
+            if monotonic() >= next_discover:
+                next_discover = monotonic() + self._discover_secs
+                try:
+                    self.discover()
+                except RPCError as error:
+                    print("Vessel discovery failed: %s" % error)
+            self.collect()
+
+        print("Vessel collection thread stopped")
+
+    def _build_processor(self, key: str) -> TelemetryProcessor:
+        config = dict(self._config, render_pool=None)
+        if config.get("recorder") is not None:
+            # the recordings of every vessel go to their own directory
+            config = copy.deepcopy(config)
+            config["recorder"]["path"] = os.path.join(config["recorder"]["path"], key)
+        result = TelemetryProcessorBuilder.build_processor(config)
+        if self._render_pool is not None:
+            result.set_render_pool(self._render_pool, owned=False)
+        return result
+
+    def _create_collection(self, tracked: TrackedVessel) -> KrpcTelemetryStreamCollection:
+        factory = KrpcTelemetryStreamFactory(tracked.vessel, self._pool, self._default_rate, self._rates,
+                                             self._adaptive_rates, self._streams)
+        result = init_streams_from_telemetry_processor(tracked.processor, factory, self._interval_secs)
+        # the streams of a vessel found while collecting the others can't hold the thread, the first passes skip it
+        # until its streams have a value
+        result.start_telemetries(wait_secs=0)
+        return result
+
+    def _release(self, tracked: TrackedVessel) -> None:
+        if tracked.collection is not None:
+            tracked.collection.destroy_telemetries()
+            tracked.collection = None
+
+    @staticmethod
+    def _unique_key(name: str, vessels: Dict[str, TrackedVessel]) -> str:
+        # staging gives every piece of a rocket the same name
+        key = _slug(name)
+        suffix = 2
+        while key in vessels:
+            key = "%s-%d" % (_slug(name), suffix)
+            suffix += 1
+        return key
+
+
+def create_selectors(vessels_config: List[Dict[str, Any]]) -> List[VesselSelector]:
+    return [VesselSelector(**selector) for selector in vessels_config]
+
+
+def _slug(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-") or "vessel"
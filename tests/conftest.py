@@ -0,0 +1,42 @@
+from typing import Dict, Any
+
+import pytest
+
+from benchmarks.fake_krpc import FakeKrpcConnection
+from krpc_telemetry.krpc_streams import KrpcTelemetryStreamFactory, init_streams_from_telemetry_processor
+from krpc_telemetry.processor_builder import TelemetryProcessorBuilder
+
+BUILT_IN_TELEMETRY = ["orbital_velocity", "surface_velocity", "orbit_apo_peri", "gforce", "atm_pressure",
+                      "aero_force", "center_mass"]
+
+
+@pytest.fixture
+def telemetry_config() -> Dict[str, Any]:
+    # every built-in strategy with its default options
+    return {"telemetry": [{"name": name} for name in BUILT_IN_TELEMETRY]}
+
+
+@pytest.fixture
+def fake_connection() -> FakeKrpcConnection:
+    return FakeKrpcConnection()
+
+
+@pytest.fixture
+def synthetic_flight(fake_connection):
+    # builds a processor from a configuration and feeds it samples of the fake vessel through the real streams, one
+    # a second. The outputs of the processors are stopped after the test, the recorder thread would keep pytest alive
+    processors = []
+
+    def fly(config: Dict[str, Any], samples: int):
+        processor = TelemetryProcessorBuilder.build_processor(config)
+        processors.append(processor)
+        factory = KrpcTelemetryStreamFactory(fake_connection.vessel, fake_connection, 1)
+        collection = init_streams_from_telemetry_processor(processor, factory)
+        for _ in range(samples):
+            fake_connection.tick(1)
+            processor.process_telemetry_data(collection.collect_data())
+        return processor
+
+    yield fly
+    for processor in processors:
+        processor.stop_outputs()
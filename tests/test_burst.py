@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+
+from krpc_telemetry.processor_builder import TelemetryProcessorBuilder
+from krpc_telemetry.telemetry.burst import BurstCapture, ThresholdTrigger, JumpTrigger, MetWindowTrigger, \
+    create_trigger
+
+
+def _processor(rollup=None, downsampling=None, pre_secs=4, post_secs=2, start=32, **options):
+    telemetry = dict(name="mass_graph", channels=["mass"], collect_every_secs=5, **options)
+    if rollup is not None:
+        telemetry["rollup"] = rollup
+    if downsampling is not None:
+        telemetry["downsampling"] = downsampling
+    return TelemetryProcessorBuilder.build_processor(dict(
+        telemetry=[telemetry],
+        burst=dict(pre_secs=pre_secs, post_secs=post_secs,
+                   triggers=[dict(type="met_window", start=start, end=start)])
+    ))
+
+
+def _run(processor, mets):
+    for met in mets:
+        processor.process_telemetry_data({"met": float(met), "mass": float(met) * 2})
+
+
+def test_threshold_trigger_fires_once_outside():
+    trigger = ThresholdTrigger("mass", above=10)
+    assert [trigger.fired(met, {"mass": value}) for met, value in enumerate([5, 11, 12, 9, 15])] == \
+           [False, True, False, False, True]
+
+
+def test_jump_trigger():
+    trigger = JumpTrigger("mass", delta=3)
+    assert [trigger.fired(met, {"mass": value}) for met, value in enumerate([0, 1, 5, 6, 2])] == \
+           [False, False, True, False, True]
+
+
+def test_create_trigger():
+    assert isinstance(create_trigger("met_window", start=1, end=2), MetWindowTrigger)
+    with pytest.raises(ValueError):
+        create_trigger("threshold", channel="mass")
+
+
+def test_capture_returns_the_pre_trigger_samples():
+    capture = BurstCapture([MetWindowTrigger(10, 10)], pre_secs=3, post_secs=2)
+    results = [capture.update(float(met), {}) for met in range(15)]
+    assert [met for met, _ in results[10]] == [6, 7, 8, 9]
+    assert not capture.active
+    assert all(not result for position, result in enumerate(results) if position != 10)
+    assert capture.bursts == 1
+
+
+def test_burst_stores_every_sample_around_the_trigger():
+    processor = _processor()
+    _run(processor, range(60))
+    index = processor.strategies[0].storage.view().index
+    # every 5 s, the 4 s before the trigger at 32 and the 2 s after it at full rate
+    np.testing.assert_array_equal(index, [0, 5, 10, 15, 20, 25, 27, 28, 29, 30, 31, 32, 33, 34, 35, 40, 45, 50, 55])
+
+
+def test_burst_samples_reach_the_rollup_buckets():
+    processor = _processor(rollup=dict(raw_secs=1000, tiers=[dict(bucket_secs=10), dict(bucket_secs=20)]))
+    _run(processor, range(80))
+    strategy = processor.strategies[0]
+    view = strategy.storage.view()
+    for tier in strategy.rollup.tiers:
+        buckets = tier.storage.view()
+        assert len(buckets)
+        for start, mean, minimum, maximum, last in zip(buckets.index, buckets.values["mass"],
+                                                       buckets.values["mass_min"], buckets.values["mass_max"],
+                                                       buckets.values["mass_last"]):
+            inside = view.values["mass"][(view.index >= start) & (view.index < start + tier.bucket_secs)]
+            assert mean == pytest.approx(inside.mean())
+            assert (minimum, maximum, last) == (inside.min(), inside.max(), inside[-1])
+
+
+def test_burst_changes_the_rollup_revision():
+    processor = _processor(rollup=dict(raw_secs=1000, tiers=[dict(bucket_secs=10)]))
+    _run(processor, range(32))
+    revision = processor.strategies[0].rollup.snapshot().revision
+    _run(processor, range(32, 40))
+    # 28 and 29 changed the stored 20-29 bucket
+    assert processor.strategies[0].rollup.snapshot().revision > revision
+
+
+def test_burst_samples_reach_the_downsampler():
+    processor = _processor(downsampling=dict(max_points=8, full_resolution_secs=5))
+    _run(processor, range(200))
+    snapshot = processor.strategies[0].snapshot()
+    x, _ = snapshot.downsampled.series(snapshot.view)["mass"]
+    assert np.all(np.diff(x) > 0)
+    assert x[-1] == 195
+
+
+@pytest.mark.parametrize("compression", [None, dict(block_size=8)])
+def test_burst_larger_than_max_samples(compression):
+    options = dict(max_samples=20)
+    if compression is not None:
+        options["compression"] = compression
+    processor = _processor(pre_secs=5, post_secs=1, **options)
+    # 50 Hz: 250 pre-trigger samples, more than twice max_samples
+    _run(processor, np.arange(0, 40, 0.02).round(2))
+    storage = processor.strategies[0].storage
+    index = storage.view().index
+    assert 20 <= len(storage) < 20 + 8
+    assert np.all(np.diff(index) > 0)
+    # the newest samples are kept: the end of the burst at 33, then the ones collected every 5 s
+    assert 33 in index
+    assert index[-1] == 39.5
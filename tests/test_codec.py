@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from krpc_telemetry.telemetry.codec import encode_column, decode_column, MODE_RAW, MODE_XOR, MODE_SCALED
+
+
+def _round_trip(values: np.ndarray) -> np.ndarray:
+    result = decode_column(encode_column(values))
+    # bit for bit, NaN payloads and the sign of zero included
+    np.testing.assert_array_equal(result.view(np.uint64), values.view(np.uint64))
+    return result
+
+
+def _mode(values: np.ndarray) -> int:
+    return encode_column(values)[0]
+
+
+def test_scaled_met():
+    met = np.round(1000 + np.arange(4096) * 0.2, 1)
+    assert _mode(met) == MODE_SCALED
+    _round_trip(met)
+    # a steady period is a zero byte per sample, delta-of-delta
+    assert len(encode_column(met)) < len(met) + 32
+
+
+def test_scaled_with_exceptions():
+    values = np.round(np.linspace(-50, 50, 1000), 3)
+    values[[3, 500, 999]] = [np.nan, np.inf, -np.inf]
+    values[10] = -0.0
+    assert _mode(values) == MODE_SCALED
+    _round_trip(values)
+
+
+def test_scaled_large_integers_fall_back():
+    values = np.arange(100, dtype=np.float64) + 2.0 ** 60
+    assert _mode(values) != MODE_SCALED
+    _round_trip(values)
+
+
+@pytest.mark.parametrize("value", [0.0, 3.0, 12345.678, -1e-6])
+def test_constant_column(value):
+    values = np.full(1024, value)
+    assert _mode(values) == MODE_SCALED
+    _round_trip(values)
+    assert len(encode_column(values)) < 1100
+
+
+def test_xor_held_values():
+    # not decimals, but every value repeats: one byte per repetition
+    values = np.repeat(np.random.default_rng(1).normal(size=64), 16)
+    assert _mode(values) == MODE_XOR
+    _round_trip(values)
+    assert len(encode_column(values)) < values.nbytes // 2
+
+
+def test_xor_mostly_non_finite():
+    # too many exceptions for the scaled mode
+    values = np.full(256, np.nan)
+    values[::16] = np.arange(16)
+    assert _mode(values) == MODE_XOR
+    _round_trip(values)
+
+
+def test_raw_fallback_for_noise():
+    values = np.random.default_rng(0).normal(size=1000)
+    assert _mode(values) == MODE_RAW
+    _round_trip(values)
+    assert len(encode_column(values)) == values.nbytes + 5
+
+
+def test_raw_keeps_nan_and_infinities():
+    values = np.random.default_rng(2).normal(size=200)
+    values[[0, 50, 199]] = [np.nan, np.inf, -np.inf]
+    assert _mode(values) == MODE_RAW
+    _round_trip(values)
+
+
+@pytest.mark.parametrize("values", [np.empty(0), np.array([1.5]), np.array([np.nan]), np.array([-0.0])])
+def test_tiny_columns(values):
+    _round_trip(values)
+
+
+def test_decoded_column_is_writable_copy():
+    values = np.random.default_rng(3).normal(size=10)
+    result = decode_column(encode_column(values))
+    result[0] = 0
+    assert result.flags.writeable
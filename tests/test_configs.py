@@ -0,0 +1,66 @@
+import json
+import math
+import os
+
+import pytest
+
+from benchmarks.fake_krpc import FakeKrpcConnection
+from krpc_telemetry.krpc_streams import create_stream_definitions, STREAMS
+from krpc_telemetry.processor_builder import TelemetryProcessorBuilder
+from krpc_telemetry.telemetry import TelemetryType
+from krpc_telemetry.vessels import MultiVesselTelemetry, create_selectors
+
+CONFIGS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "configs")
+
+
+def _load(name: str):
+    with open(os.path.join(CONFIGS, name)) as file:
+        return json.load(file)
+
+
+@pytest.mark.parametrize("name", sorted(name for name in os.listdir(CONFIGS) if name.endswith(".json")))
+def test_example_config_builds(name):
+    config = _load(name)
+    processor = TelemetryProcessorBuilder.build_processor(config)
+    streams = create_stream_definitions(config.get("collection", dict()).get("streams", dict()))
+    # every channel the strategies, derived channels and triggers read has a stream
+    assert all(name in streams or STREAMS.get(name) is not None for name in processor.get_telemetry_types())
+
+
+def test_full_config_processes_samples():
+    processor = TelemetryProcessorBuilder.build_processor(dict(_load("fullconfig.json"), recorder=None,
+                                                               render_pool=None))
+    for met in range(120):
+        data = {telemetry_type: float(met) for telemetry_type in TelemetryType}
+        data[TelemetryType.MET] = float(met)
+        data[TelemetryType.AERODYNAMIC_FORCE] = (1.0, 2.0, 2.0)
+        data[TelemetryType.CENTER_OF_MASS] = (0.0, 0.0, 0.0)
+        data["liquid_fuel"] = 100.0 - met
+        data["throttle"] = 1.0
+        processor.process_telemetry_data(data)
+    engines = next(strategy for strategy in processor.strategies if strategy.name == "engines")
+    view = engines.storage.view()
+    assert set(view.columns) == {"throttle", "liquid_fuel", "twr"}
+    assert view.values["twr"][-1] == pytest.approx(0.10197)
+    ascent = next(strategy for strategy in processor.strategies if strategy.name == "ascent")
+    assert ascent.storage.view().values["drag"][-1] == 3
+    assert math.isclose(ascent.storage.view().values["altitude_rate"][-1], 1)
+    # the MET window of the burst stored every sample from 58 to 95 of the 2 s engines strategy
+    assert len(engines.storage) > 120 // 2
+    assert processor.burst_capture.bursts >= 1
+
+
+def test_vessels_config():
+    config = _load("vesselsconfig.json")
+    vessels_config = dict(config["vessels"])
+    connection = FakeKrpcConnection()
+    connection.add_vessel("Relay 1")
+    connection.add_vessel("Debris")
+    tracker = MultiVesselTelemetry(connection, dict(config, recorder=None, render_pool=None),
+                                   create_selectors(vessels_config.pop("track")), **vessels_config)
+    tracker.discover()
+    try:
+        assert sorted(tracker.vessels) == ["fake-vessel", "relay-1"]
+    finally:
+        for tracked in tracker.vessels.values():
+            tracked.processor.stop_outputs()
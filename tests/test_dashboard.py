@@ -0,0 +1,43 @@
+import json
+
+from krpc_telemetry.dashboard import init_dashboard
+from krpc_telemetry.processor_builder import TelemetryProcessorBuilder
+
+
+def _processor():
+    return TelemetryProcessorBuilder.build_processor(dict(telemetry=[
+        dict(name="mass_graph", channels=["mass"]),
+        dict(name="fuel_graph", channels=["liquid_fuel"], collect_every_secs=10),
+    ]))
+
+
+def _tick(client, app, versions, tick):
+    output, callback = next((output, callback) for output, callback in app.callback_map.items()
+                            if callback["inputs"][0]["id"] == "interval-component")
+    response = client.post("/_dash-update-component", json={
+        "output": output,
+        "outputs": [{"id": item.component_id, "property": item.component_property} for item in callback["output"]],
+        "inputs": [{"id": "interval-component", "property": "n_intervals", "value": tick}],
+        "changedPropIds": ["interval-component.n_intervals"],
+        "state": [{"id": "graph-versions", "property": "data", "value": versions}]
+    })
+    return json.loads(response.data)["response"] if response.status_code == 200 else {}
+
+
+def test_live_callback_sends_changed_figures_only():
+    processor = _processor()
+    app = init_dashboard(processor)
+    client = app.server.test_client()
+    processor.process_telemetry_data({"met": 0.0, "mass": 1.0, "liquid_fuel": 10.0})
+
+    response = _tick(client, app, None, 0)
+    assert set(response) == {"mass_graph-graph", "fuel_graph-graph", "graph-versions"}
+    assert response["mass_graph-graph"]["figure"] == json.loads(processor.get_telemetry_plot_json("mass_graph"))
+    versions = response["graph-versions"]["data"]
+    # nothing stored since the last tick
+    assert _tick(client, app, versions, 1) == {}
+
+    processor.process_telemetry_data({"met": 1.0, "mass": 2.0, "liquid_fuel": 9.0})
+    response = _tick(client, app, versions, 2)
+    assert set(response) == {"mass_graph-graph", "graph-versions"}
+    assert response["mass_graph-graph"]["figure"]["data"][0]["y"] == [1.0, 2.0]
@@ -0,0 +1,47 @@
+import math
+
+import pytest
+
+from krpc_telemetry.telemetry import TelemetryType
+from krpc_telemetry.telemetry.derived import DerivedChannels, create_derived_channel
+
+
+def _compute(channels: DerivedChannels, met: float, **values):
+    return channels.compute({TelemetryType.MET: met, **values})
+
+
+@pytest.mark.parametrize("operation,sources", [("derivative", ["aerodynamic_force"]),
+                                               ("moving_average", ["center_of_mass"]),
+                                               ("ratio", ["aerodynamic_force", "mass"])])
+def test_vector_source_is_rejected(operation, sources):
+    with pytest.raises(ValueError, match="aerodynamic_force_x|center_of_mass_x"):
+        create_derived_channel("derived", operation, sources)
+
+
+def test_vector_component_and_magnitude():
+    channels = DerivedChannels([create_derived_channel("drag", "magnitude", ["aerodynamic_force"]),
+                                create_derived_channel("drag_x", "moving_average", ["aerodynamic_force_x"],
+                                                       window=2)])
+    assert channels.get_telemetry_types() == {TelemetryType.AERODYNAMIC_FORCE}
+    result = _compute(channels, 0, aerodynamic_force=(3.0, 4.0, 0.0))
+    assert result["drag"] == 5
+    assert result["drag_x"] == 3
+
+
+def test_derivative_restarts_when_met_goes_back():
+    channels = DerivedChannels([create_derived_channel("rate", "derivative", ["altitude"], window=5)])
+    for met in range(10):
+        rate = _compute(channels, met, altitude=2.0 * met)["rate"]
+    assert rate == pytest.approx(2)
+    # a quickload at MET 3, the window only has samples of the new timeline
+    assert math.isnan(_compute(channels, 3, altitude=100.0)["rate"])
+    assert _compute(channels, 4, altitude=99.0)["rate"] == pytest.approx(-1)
+
+
+def test_moving_average_skips_missing_values():
+    channels = DerivedChannels([create_derived_channel("average", "moving_average", ["altitude"], window=3,
+                                                       scale=2)])
+    values = [_compute(channels, met, altitude=altitude)["average"]
+              for met, altitude in enumerate([1.0, None, 3.0, math.nan, 5.0, 7.0])]
+    assert values[0] == 2 and values[2] == 4 and values[4] == 6 and values[5] == 10
+    assert math.isnan(values[1]) and math.isnan(values[3])
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+from krpc_telemetry.telemetry.downsampling import SeriesDownsampler, lttb, min_max
+from krpc_telemetry.telemetry.storage import ColumnarStorage
+
+
+def _lttb_reference(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    # the textbook algorithm, the averages of the next bucket computed in the loop
+    size = len(x)
+    y = np.nan_to_num(y)
+    every = (size - 2) / (threshold - 2)
+    result = [0]
+    for bucket in range(threshold - 2):
+        average_start = int((bucket + 1) * every) + 1
+        average_end = min(int((bucket + 2) * every) + 1, size)
+        average_x = x[average_start:average_end].mean()
+        average_y = y[average_start:average_end].mean()
+        range_start = int(bucket * every) + 1
+        range_end = int((bucket + 1) * every) + 1
+        selected = result[-1]
+        areas = np.abs((x[selected] - average_x) * (y[range_start:range_end] - y[selected]) -
+                       (x[selected] - x[range_start:range_end]) * (average_y - y[selected]))
+        result.append(range_start + int(np.argmax(areas)))
+    return np.array(result + [size - 1])
+
+
+@pytest.mark.parametrize("size,threshold", [(10, 3), (100, 7), (1000, 100), (1001, 1000), (5000, 333)])
+def test_lttb_matches_the_reference(size, threshold):
+    rng = np.random.default_rng(size)
+    x = np.cumsum(rng.uniform(0.5, 1.5, size))
+    y = rng.normal(size=size).cumsum()
+    y[rng.random(size) < 0.05] = np.nan
+    np.testing.assert_array_equal(lttb(x, y, threshold), _lttb_reference(x, y, threshold))
+
+
+def test_lttb_and_min_max_keep_short_series():
+    x = np.arange(10.0)
+    np.testing.assert_array_equal(lttb(x, x, 10), np.arange(10))
+    np.testing.assert_array_equal(min_max(x, x, 5), np.arange(10))
+
+
+def test_min_max_keeps_the_extremes_of_every_bucket():
+    rng = np.random.default_rng(0)
+    y = rng.normal(size=1000)
+    y[[10, 500]] = np.nan
+    selected = min_max(np.arange(1000.0), y, 50)
+    assert np.all(np.diff(selected) > 0)
+    for start in range(0, 1000, 20):
+        bucket = selected[(selected >= start) & (selected < start + 20)]
+        assert set(bucket) == {start + np.nanargmin(y[start:start + 20]), start + np.nanargmax(y[start:start + 20])}
+
+
+def _downsample(algorithm: str, samples: int, max_points: int = 256, full_resolution_secs: float = 50):
+    storage = ColumnarStorage()
+    downsampler = SeriesDownsampler(algorithm, max_points=max_points, full_resolution_secs=full_resolution_secs)
+    rng = np.random.default_rng(1)
+    values = rng.normal(size=samples).cumsum()
+    folded = []
+    for met, value in enumerate(values):
+        storage.append(float(met), {"speed": float(value)})
+        downsampler.update(storage)
+        folded.append(downsampler.snapshot().folded_met)
+    return storage, downsampler, values, folded
+
+
+@pytest.mark.parametrize("algorithm", ["lttb", "min_max"])
+def test_folded_series_stays_within_the_budget(algorithm):
+    storage, downsampler, values, folded = _downsample(algorithm, 20000)
+    x, y = downsampler.series(storage.view())["speed"]
+    assert np.all(np.diff(x) > 0)
+    np.testing.assert_array_equal(y, values[x.astype(np.int64)])
+    if algorithm == "lttb":
+        assert x[0] == 0
+    # the newest samples are all there, the folded ones take at most max_points
+    np.testing.assert_array_equal(x[-50:], np.arange(19950, 20000))
+    assert len(downsampler.snapshot().x["speed"]) <= 256
+    # several buckets are folded at once, not one every sample
+    assert len(set(folded)) < 20000 // 16
+
+
+def test_min_max_folding_keeps_the_extremes():
+    storage, downsampler, values, _ = _downsample("min_max", 5000)
+    x, y = downsampler.series(storage.view())["speed"]
+    assert y.min() == values.min() and y.max() == values.max()
+
+
+def test_new_column_restarts_the_folding():
+    storage, downsampler, _, _ = _downsample("lttb", 2000)
+    revision = downsampler.revision
+    storage.append(2000.0, {"speed": 1.0, "altitude": 2.0})
+    downsampler.update(storage)
+    assert downsampler.revision > revision
+    # folded again from the first sample, the new column too
+    assert set(downsampler.snapshot().x) == {"speed", "altitude"}
+    assert downsampler.snapshot().x["altitude"][0] == 0
@@ -0,0 +1,84 @@
+import csv
+import io
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from krpc_telemetry.http_api import TelemetryHttpApi
+from krpc_telemetry.processor_builder import TelemetryProcessorBuilder
+from krpc_telemetry.telemetry.export import EXPORT_CONTENT_TYPES, export_chunks
+
+
+@pytest.fixture(params=[None, dict(block_size=64)], ids=["raw", "compressed"])
+def processor(request):
+    options = dict() if request.param is None else dict(compression=request.param)
+    processor = TelemetryProcessorBuilder.build_processor(dict(telemetry=[
+        dict(name="mass_graph", channels=["mass", "liquid_fuel"], **options)
+    ]))
+    for met in range(1000):
+        processor.process_telemetry_data({"met": float(met), "mass": np.sin(met / 10), "liquid_fuel": 1000.0 - met})
+    return processor
+
+
+def _concatenate(chunks):
+    chunks = list(chunks)
+    return (np.concatenate([index for index, _ in chunks]),
+            {name: np.concatenate([columns[name] for _, columns in chunks]) for name in chunks[0][1]})
+
+
+def test_range_query(processor):
+    view = processor.query("mass_graph", start_met=100.5, end_met=300, columns=["liquid_fuel"])
+    np.testing.assert_array_equal(view.index, np.arange(101, 301))
+    assert view.columns == ["liquid_fuel"]
+    np.testing.assert_array_equal(view.values["liquid_fuel"], 1000 - np.arange(101, 301))
+    assert len(processor.query("mass_graph", max_points=100, algorithm="lttb")) <= 100
+    assert processor.query("unknown") is None
+    with pytest.raises(ValueError):
+        processor.query("mass_graph", columns=["thrust"])
+
+
+def test_chunks_cover_the_range(processor):
+    chunks = list(processor.query_chunks("mass_graph", start_met=10, end_met=900, rows=100))
+    assert len(chunks) >= 9 and all(len(index) <= 100 for index, _ in chunks)
+    index, columns = _concatenate(chunks)
+    view = processor.query("mass_graph", start_met=10, end_met=900)
+    np.testing.assert_array_equal(index, view.index)
+    np.testing.assert_array_equal(columns["mass"], view.values["mass"])
+    # an empty range still has the columns
+    index, columns = _concatenate(processor.query_chunks("mass_graph", start_met=2000))
+    assert len(index) == 0 and list(columns) == ["mass", "liquid_fuel"]
+
+
+@pytest.mark.parametrize("format", ["csv", "arrow", "parquet"])
+def test_export_formats(processor, format):
+    data = b"".join(export_chunks(processor.query_chunks("mass_graph", start_met=500, rows=128), format))
+    if format == "csv":
+        rows = list(csv.reader(io.StringIO(data.decode())))
+        assert rows[0] == ["met", "mass", "liquid_fuel"]
+        table = {name: np.array([float(row[position]) for row in rows[1:]]) for position, name in enumerate(rows[0])}
+    else:
+        read = pa.ipc.open_stream(data).read_all() if format == "arrow" else pq.read_table(io.BytesIO(data))
+        assert read.column_names == ["met", "mass", "liquid_fuel"]
+        table = {name: read.column(name).to_numpy() for name in read.column_names}
+    np.testing.assert_array_equal(table["met"], np.arange(500, 1000))
+    # every float is written exactly
+    np.testing.assert_array_equal(table["mass"], np.sin(np.arange(500, 1000) / 10))
+
+
+def test_export_is_streamed(processor):
+    parts = list(export_chunks(processor.query_chunks("mass_graph", rows=100), "arrow"))
+    assert len(parts) > 5
+
+
+def test_http_export(synthetic_flight, telemetry_config):
+    processor = synthetic_flight(telemetry_config, 120)
+    api = TelemetryHttpApi(processor)
+    response = api.handle("/telemetry/orbital_velocity/export.parquet", dict(start_met="60", columns="orbital_speed"))
+    assert response.status == 200 and response.content_type == EXPORT_CONTENT_TYPES["parquet"]
+    table = pq.read_table(io.BytesIO(b"".join(response.body)))
+    assert table.column_names == ["met", "orbital_speed"] and table.num_rows == 61
+    assert api.handle("/telemetry/orbital_velocity/export.csv", dict(start_met="soon")).status == 400
+    assert api.handle("/telemetry/orbital_velocity/export.xml", dict()).status == 400
+    assert api.handle("/telemetry/unknown/export.csv", dict()).status == 404
@@ -0,0 +1,73 @@
+import math
+
+import pytest
+
+from krpc_telemetry.telemetry.filters import SampleFilter
+
+
+def _stored(sample_filter: SampleFilter, samples) -> list:
+    return [met for met, values in samples for met, _ in sample_filter.filter(met, values)]
+
+
+def test_deadband_drops_small_changes():
+    sample_filter = SampleFilter({"mass": 5}, heartbeat_secs=None)
+    stored = _stored(sample_filter, [(float(met), {"mass": float(met)}) for met in range(20)])
+    # 0, then the change over 5 with the plateau sample held before it
+    assert stored == [0, 5, 6, 11, 12, 17, 18]
+    assert sample_filter.dropped_samples == 20 - len(stored)
+
+
+def test_zero_deadband_stores_any_change():
+    sample_filter = SampleFilter({"mass": 0}, heartbeat_secs=None)
+    values = [1, 1, 1, 2, 2, 3]
+    stored = _stored(sample_filter, [(float(met), {"mass": float(value)}) for met, value in enumerate(values)])
+    assert stored == [0, 2, 3, 4, 5]
+
+
+def test_heartbeat_stores_a_flat_line():
+    sample_filter = SampleFilter({"mass": 5}, heartbeat_secs=10)
+    stored = _stored(sample_filter, [(float(met), {"mass": 1.0}) for met in range(35)])
+    assert stored == [0, 10, 20, 30]
+
+
+def test_column_without_deadband_follows_the_others():
+    sample_filter = SampleFilter({"mass": 5}, heartbeat_secs=None)
+    samples = [(float(met), {"mass": float(met), "thrust": float(met % 2)}) for met in range(10)]
+    # thrust changes on every sample, only mass moving over its deadband stores one
+    assert _stored(sample_filter, samples) == [0, 5, 6]
+    assert sample_filter.filter(10.0, {"mass": 6.0, "thrust": 1.0}) == []
+
+
+def test_nan_changes_are_stored():
+    sample_filter = SampleFilter({"mass": 5}, heartbeat_secs=None)
+    stored = _stored(sample_filter, [(0.0, {"mass": 1.0}), (1.0, {"mass": math.nan}), (2.0, {"mass": math.nan}),
+                                     (3.0, {"mass": 1.0})])
+    assert stored == [0, 1, 2, 3]
+
+
+def test_vector_components_use_the_telemetry_deadband():
+    sample_filter = SampleFilter({"center_of_mass": 1}, heartbeat_secs=None)
+    values = {"center_of_mass_x": 0.0, "center_of_mass_y": 0.0, "center_of_mass_z": 0.0}
+    stored = _stored(sample_filter, [(0.0, values), (1.0, dict(values, center_of_mass_y=0.5)),
+                                     (2.0, dict(values, center_of_mass_z=2.0))])
+    assert stored == [0, 1, 2]
+    assert sample_filter.dropped_samples == 0
+
+
+def test_met_going_back_starts_over():
+    sample_filter = SampleFilter({"mass": 5}, heartbeat_secs=None)
+    _stored(sample_filter, [(float(met), {"mass": 1.0}) for met in range(10, 20)])
+    assert sample_filter.filter(3.0, {"mass": 1.0}) == [(3.0, {"mass": 1.0})]
+
+
+def test_stored_sample_replaces_the_dropped_one():
+    sample_filter = SampleFilter({"mass": 5}, heartbeat_secs=None)
+    _stored(sample_filter, [(0.0, {"mass": 0.0}), (1.0, {"mass": 1.0})])
+    sample_filter.stored(2.0, {"mass": 2.0})
+    # the dropped sample at 1 is older than the stored one, only the change is stored
+    assert sample_filter.filter(3.0, {"mass": 10.0}) == [(3.0, {"mass": 10.0})]
+
+
+def test_negative_deadband():
+    with pytest.raises(ValueError):
+        SampleFilter({"mass": -1})
@@ -0,0 +1,31 @@
+import json
+import os
+import subprocess
+import sys
+
+# a fresh interpreter: the other tests already imported everything in this one
+HEADLESS_SCRIPT = """
+import json, sys
+from krpc_telemetry.http_api import TelemetryHttpApi
+from krpc_telemetry.processor_builder import TelemetryProcessorBuilder
+processor = TelemetryProcessorBuilder.build_processor(json.loads(sys.argv[1]))
+api = TelemetryHttpApi(processor)
+for met in range(10):
+    processor.process_telemetry_data({"met": float(met), "mass": 10.0 - met})
+assert api.handle("/telemetry/mass_graph/data.json", {}).status == 200
+assert b"".join(api.handle("/telemetry/mass_graph/export.csv", {}).body).startswith(b"met,mass")
+loaded = [sorted(name for name in ("dash", "pandas", "plotly", "pyarrow") if name in sys.modules)]
+assert api.handle("/telemetry/mass_graph/figure.json", {}).status == 200
+loaded.append(sorted(name for name in ("dash", "pandas", "plotly") if name in sys.modules))
+print(json.dumps(loaded))
+"""
+
+
+def test_headless_api_defers_the_plotting_imports():
+    config = {"telemetry": [{"name": "mass_graph", "channels": ["mass"]}], "metrics": {}}
+    output = subprocess.run([sys.executable, "-c", HEADLESS_SCRIPT, json.dumps(config)], check=True,
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.dirname(__file__))).stdout
+    before_figure, after_figure = json.loads(output)
+    assert before_figure == []
+    # a figure is still available, plotting imports pandas and plotly on the first one
+    assert after_figure == ["pandas", "plotly"]
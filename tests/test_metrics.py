@@ -0,0 +1,59 @@
+import threading
+
+from krpc_telemetry.telemetry.metrics import MetricsRegistry
+
+
+def test_render():
+    metrics = MetricsRegistry()
+    metrics.observe("collect_seconds", 0.5, strategy="gforce")
+    metrics.observe("collect_seconds", 1.5, strategy="gforce")
+    metrics.increment("samples")
+    metrics.add_collector(lambda: [("history_bytes", {"strategy": "gforce"}, 1024)])
+    lines = metrics.render().splitlines()
+    assert lines == [
+        "# TYPE krpc_telemetry_collect_seconds summary",
+        'krpc_telemetry_collect_seconds_count{strategy="gforce"} 2',
+        'krpc_telemetry_collect_seconds_sum{strategy="gforce"} 2.0',
+        "# TYPE krpc_telemetry_collect_seconds_max gauge",
+        'krpc_telemetry_collect_seconds_max{strategy="gforce"} 1.5',
+        "# TYPE krpc_telemetry_samples counter",
+        "krpc_telemetry_samples 1",
+        "# TYPE krpc_telemetry_history_bytes gauge",
+        'krpc_telemetry_history_bytes{strategy="gforce"} 1024',
+    ]
+
+
+def test_summary_since_the_previous_one():
+    metrics = MetricsRegistry()
+    metrics.observe("tick_seconds", 0.002)
+    assert metrics.summary() == "Metrics: tick_seconds 2.00ms x1"
+    metrics.observe("tick_seconds", 0.004)
+    metrics.observe("tick_seconds", 0.006)
+    assert metrics.summary() == "Metrics: tick_seconds 5.00ms x2"
+
+
+def test_concurrent_writers():
+    metrics = MetricsRegistry()
+    threads = 8
+    observations = 20000
+    barrier = threading.Barrier(threads + 1)
+
+    def write(position: int) -> None:
+        barrier.wait()
+        for _ in range(observations):
+            metrics.observe("request_seconds", 1.0, route="/metrics")
+            metrics.increment("requests", thread=str(position % 2))
+
+    workers = [threading.Thread(target=write, args=(position,)) for position in range(threads)]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    while any(worker.is_alive() for worker in workers):
+        metrics.render()
+    for worker in workers:
+        worker.join()
+
+    rendered = metrics.render()
+    assert 'krpc_telemetry_request_seconds_count{route="/metrics"} %d' % (threads * observations) in rendered
+    assert 'krpc_telemetry_request_seconds_sum{route="/metrics"} %s' % float(threads * observations) in rendered
+    assert 'krpc_telemetry_requests{thread="0"} %d' % (threads // 2 * observations) in rendered
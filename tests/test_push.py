@@ -0,0 +1,97 @@
+import http.client
+import json
+
+import pytest
+
+from krpc_telemetry.http_api import TelemetryHttpApi, serve_http_api
+from krpc_telemetry.processor_builder import TelemetryProcessorBuilder
+from krpc_telemetry.push import BroadcastHub, RESET_MESSAGE, STREAM_PATH
+
+
+@pytest.fixture
+def processor():
+    return TelemetryProcessorBuilder.build_processor(dict(telemetry=[dict(name="mass_graph", channels=["mass"])]))
+
+
+def _run(processor, mets):
+    for met in mets:
+        processor.process_telemetry_data({"met": float(met), "mass": 100.0 - met})
+
+
+def _event(message: bytes):
+    lines = dict(line.split(": ", 1) for line in message.decode().strip().split("\n"))
+    return lines["event"], json.loads(lines["data"])
+
+
+def test_clients_get_the_same_deltas(processor):
+    hub = BroadcastHub(processor)
+    first, second = hub.subscribe(), hub.subscribe()
+    assert first.get(0) == RESET_MESSAGE and second.get(0) == RESET_MESSAGE
+    _run(processor, range(3))
+    # the first tick resets the graph, the next ones only carry the new samples
+    hub.publish(processor.snapshot())
+    assert _event(first.get(0))[1]["graphs"] == {"mass_graph": {"reset": True}}
+    second.get(0)
+    _run(processor, range(3, 5))
+    hub.publish(processor.snapshot())
+    message = first.get(0)
+    assert message == second.get(0)
+    event, data = _event(message)
+    assert event == "telemetry" and data["met"] == 4
+    assert data["graphs"]["mass_graph"]["x"] == [3, 4]
+    assert data["graphs"]["mass_graph"]["y"] == [[97, 96]]
+    # nothing new, nothing sent
+    hub.publish(processor.snapshot())
+    assert first.get(0) is None
+
+
+def test_downsampled_graph_is_reset_past_its_point_budget():
+    processor = TelemetryProcessorBuilder.build_processor(dict(telemetry=[
+        dict(name="mass_graph", channels=["mass"], downsampling=dict(max_points=8, full_resolution_secs=1000))
+    ]))
+    hub = BroadcastHub(processor)
+    client = hub.subscribe()
+    client.get(0)
+    graphs = []
+    for met in range(0, 20, 2):
+        _run(processor, [met, met + 1])
+        hub.publish(processor.snapshot())
+        graphs.append(_event(client.get(0))[1]["graphs"]["mass_graph"])
+    # extended until more than max_points were sent, the client then fetches a decimated figure again
+    resets = [graph.get("reset", False) for graph in graphs]
+    assert resets == [True, False, False, False, False, False, True, False, False, False]
+    assert graphs[1]["x"] == [2, 3]
+
+
+def test_slow_client_resumes_from_a_reset(processor):
+    hub = BroadcastHub(processor, client_queue_size=2)
+    slow, fast = hub.subscribe(), hub.subscribe()
+    fast.get(0)
+    for met in range(5):
+        _run(processor, [met])
+        hub.publish(processor.snapshot())
+        assert fast.get(0) is not None
+    # the deltas it missed are replaced by one reset, it fetches the figures again and follows the next ticks
+    messages = []
+    while (message := slow.get(0)) is not None:
+        messages.append(message)
+    assert messages[0] == RESET_MESSAGE and len(messages) < 5
+    assert _event(messages[-1])[1]["graphs"]["mass_graph"]["x"] == [4]
+    assert slow.coalesced >= 1 and fast.coalesced == 0
+
+
+def test_event_stream_over_http(processor):
+    hub = BroadcastHub(processor)
+    server = serve_http_api(TelemetryHttpApi(processor), port=0, hub=hub)
+    try:
+        connection = http.client.HTTPConnection("localhost", server.server_address[1], timeout=5)
+        connection.request("GET", STREAM_PATH)
+        response = connection.getresponse()
+        assert response.status == 200 and response.getheader("Content-Type") == "text/event-stream"
+        assert response.read(len(RESET_MESSAGE)) == RESET_MESSAGE
+        _run(processor, range(3))
+        hub.publish(processor.snapshot())
+        assert b"event: telemetry" in response.readline() + response.readline()
+        connection.close()
+    finally:
+        server.shutdown()
@@ -0,0 +1,62 @@
+import json
+
+import numpy as np
+import pytest
+
+from krpc_telemetry.processor_builder import TelemetryProcessorBuilder
+from krpc_telemetry.telemetry.export import export_chunks
+from krpc_telemetry.telemetry.render_pool import RenderPool
+
+
+@pytest.fixture(scope="module")
+def render_pool():
+    pool = RenderPool(workers=1)
+    pool.start()
+    yield pool
+    pool.stop()
+
+
+def _processor(**options):
+    return TelemetryProcessorBuilder.build_processor(dict(
+        telemetry=[dict(name="mass_graph", channels=["mass", "liquid_fuel"], **options)],
+        burst=dict(pre_secs=3, post_secs=1, triggers=[dict(type="met_window", start=150, end=150)])
+    ))
+
+
+def _run(processor, mets):
+    for met in mets:
+        processor.process_telemetry_data({"met": float(met), "mass": np.sin(met / 10), "liquid_fuel": 100.0 - met})
+
+
+def _assert_same_figure(render_pool, processor):
+    strategy = processor.strategies[0]
+    snapshot = processor.snapshot().strategies[strategy.name]
+    assert json.loads(render_pool.render_json(strategy, snapshot)) == \
+           json.loads(strategy.get_telemetry_plot_json(snapshot))
+
+
+@pytest.mark.parametrize("options", [
+    dict(),
+    dict(max_samples=50),
+    dict(compression=dict(block_size=16)),
+    dict(max_samples=40, compression=dict(block_size=16)),
+    dict(downsampling=dict(max_points=20)),
+], ids=["growable", "ring", "compressed", "compressed_ring", "downsampled"])
+def test_worker_figure_matches_the_strategy(render_pool, options):
+    processor = _processor(collect_every_secs=2, **options)
+    # the history is mirrored sample by sample, then over a burst merging older samples
+    for start in range(0, 200, 7):
+        _run(processor, np.arange(start, start + 7, 0.5))
+        _assert_same_figure(render_pool, processor)
+
+
+def test_worker_export_matches(render_pool):
+    processor = _processor(compression=dict(block_size=16))
+    _run(processor, range(300))
+    view = processor.query("mass_graph", 20.5, 250)
+    for export_format in ("csv", "parquet"):
+        assert b"".join(render_pool.export(view, export_format)) == \
+               b"".join(export_chunks(view.chunks(), export_format))
+    whole = processor.query("mass_graph")
+    assert whole.split()[0]
+    assert b"".join(render_pool.export(whole, "csv")) == b"".join(export_chunks(whole.chunks(), "csv"))
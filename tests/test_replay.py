@@ -0,0 +1,25 @@
+import pytest
+
+from krpc_telemetry.replay import ReplayTelemetryStreamCollection
+from krpc_telemetry.telemetry import TelemetryType
+from krpc_telemetry.telemetry.recorder import FlightRecorder
+
+
+@pytest.mark.parametrize("format", ["arrow", "parquet"])
+def test_recording_replays_the_vectors(tmp_path, format):
+    recorder = FlightRecorder(str(tmp_path), format, batch_size=4)
+    recorder.start()
+    samples = [{TelemetryType.MET: float(met), TelemetryType.MASS: 100.0 - met,
+                TelemetryType.AERODYNAMIC_FORCE: (float(met), 2.0, 3.0), "throttle": 1.0} for met in range(10)]
+    for sample in samples:
+        recorder.record(sample)
+    recorder.stop()
+
+    replay = ReplayTelemetryStreamCollection(str(tmp_path), speed=0)
+    assert replay.get_telemetry_types() == {TelemetryType.MET, TelemetryType.MASS, TelemetryType.AERODYNAMIC_FORCE,
+                                            "throttle"}
+    replay.start_telemetries()
+    replayed = []
+    while not replay.finished:
+        replayed.append(replay.collect_data())
+    assert replayed == samples
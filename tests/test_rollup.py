@@ -0,0 +1,140 @@
+import numpy as np
+import pytest
+
+from krpc_telemetry.telemetry.filters import SampleFilter
+from krpc_telemetry.telemetry.rollup import TelemetryRollup
+from krpc_telemetry.telemetry.storage import ColumnarStorage
+from krpc_telemetry.telemetry.strategy import ChannelsTelemetryStrategy
+
+
+def _strategy(raw_secs: float = 30, tiers=None, deadband: float | None = None) -> ChannelsTelemetryStrategy:
+    strategy = ChannelsTelemetryStrategy("test", "Test", ["mass"])
+    strategy.set_rollup(TelemetryRollup(raw_secs=raw_secs, tiers=tiers or [dict(bucket_secs=10)]))
+    if deadband is not None:
+        strategy.sample_filter = SampleFilter({"mass": deadband})
+    return strategy
+
+
+def _buckets(strategy: ChannelsTelemetryStrategy, tier: int = 0):
+    return strategy.rollup.tiers[tier].storage.view()
+
+
+def test_buckets_of_every_sample():
+    strategy = _strategy()
+    for met in range(100):
+        strategy.collect_data(float(met), {"mass": float(met)})
+    buckets = _buckets(strategy)
+    np.testing.assert_array_equal(buckets.index, np.arange(0, 90, 10))
+    np.testing.assert_array_equal(buckets.values["mass"], np.arange(0, 90, 10) + 4.5)
+    np.testing.assert_array_equal(buckets.values["mass_min"], np.arange(0, 90, 10))
+    np.testing.assert_array_equal(buckets.values["mass_max"], np.arange(9, 99, 10))
+    np.testing.assert_array_equal(buckets.values["mass_last"], np.arange(9, 99, 10))
+
+
+def test_coarser_tier_merges_finer_buckets():
+    strategy = _strategy(tiers=[dict(bucket_secs=10), dict(bucket_secs=30)])
+    for met in range(100):
+        strategy.collect_data(float(met), {"mass": float(met)})
+    coarse = _buckets(strategy, 1)
+    # 60-89 is stored once the 90-99 bucket of the finer tier closes
+    np.testing.assert_array_equal(coarse.index, [0, 30])
+    np.testing.assert_array_equal(coarse.values["mass"], [14.5, 44.5])
+    np.testing.assert_array_equal(coarse.values["mass_max"], [29, 59])
+    strategy.collect_data(100.0, {"mass": 100.0})
+    np.testing.assert_array_equal(_buckets(strategy, 1).index, [0, 30, 60])
+
+
+def test_sample_filter_closes_every_bucket():
+    strategy = _strategy(deadband=5)
+    for met in range(100):
+        strategy.collect_data(float(met), {"mass": float(met)})
+    assert strategy.sample_filter.dropped_samples > 50
+    np.testing.assert_array_equal(_buckets(strategy).index, np.arange(0, 90, 10))
+
+
+def test_sample_filter_buckets_match_stored_samples():
+    strategy = _strategy(raw_secs=1000, deadband=5)
+    for met in range(100):
+        strategy.collect_data(float(met), {"mass": float(met)})
+    index = strategy.storage.view().index
+    values = strategy.storage.view().values["mass"]
+    buckets = _buckets(strategy)
+    for start, mean, last in zip(buckets.index, buckets.values["mass"], buckets.values["mass_last"]):
+        inside = (index >= start) & (index < start + 10)
+        assert mean == pytest.approx(values[inside].mean())
+        assert last == values[inside][-1]
+
+
+def test_sample_filter_plateau_sample_is_folded():
+    # the filter stores the held plateau sample together with the change, both reach the rollup
+    strategy = _strategy(raw_secs=1000, deadband=5)
+    for met in range(40):
+        strategy.collect_data(float(met), {"mass": 0.0 if met < 15 else 100.0 if met < 30 else 200.0})
+    buckets = _buckets(strategy)
+    np.testing.assert_array_equal(buckets.index, [0, 10, 20])
+    # 10..19: the plateau sample at 14 and the change at 15
+    assert buckets.values["mass_min"][1] == 0
+    assert buckets.values["mass_max"][1] == 100
+    assert buckets.values["mass"][1] == 50
+
+
+def test_dropped_samples_do_not_update_the_rollup():
+    strategy = _strategy(deadband=5)
+    for met in range(30):
+        strategy.collect_data(float(met), {"mass": 1.0})
+    # the first sample only, stored in the open bucket: nothing closed, nothing folded twice
+    assert len(strategy.storage) == 1
+    assert len(_buckets(strategy)) == 0
+    strategy.collect_data(30.0, {"mass": 1.0 + 10})
+    buckets = _buckets(strategy)
+    np.testing.assert_array_equal(buckets.index, [0, 20])
+    np.testing.assert_array_equal(buckets.values["mass"], [1.0, 1.0])
+
+
+def test_met_going_back_resets_the_tiers():
+    storage = ColumnarStorage()
+    rollup = TelemetryRollup(tiers=[dict(bucket_secs=10)])
+    for mets, mass in [(range(50), 1.0), (range(20, 45), 2.0)]:
+        for met in mets:
+            storage.append(float(met), {"mass": mass})
+            rollup.update(storage)
+    buckets = rollup.tiers[0].storage.view()
+    np.testing.assert_array_equal(buckets.index, [20, 30])
+    np.testing.assert_array_equal(buckets.values["mass"], [2.0, 2.0])
+    assert rollup.snapshot().first_met == 20
+
+
+def test_old_history_is_plotted_from_a_tier():
+    strategy = _strategy(raw_secs=30)
+    for met in range(200):
+        strategy.collect_data(float(met), {"mass": float(met)})
+    snapshot = strategy.snapshot()
+    assert snapshot.rollup.plot_tier == 0
+    x, y = strategy.get_plot_input(snapshot)["mass"]
+    assert x[0] == 0
+    assert np.all(np.diff(x) > 0)
+    assert x[-1] == 199
+
+
+def test_folded_buckets_match_the_samples():
+    strategy = ChannelsTelemetryStrategy("test", "Test", ["mass", "speed"])
+    strategy.set_rollup(TelemetryRollup(raw_secs=1000, tiers=[dict(bucket_secs=10), dict(bucket_secs=20)]))
+    rng = np.random.default_rng(1)
+    # several samples a bucket, gaps over whole buckets and a column missing from some samples
+    met = np.sort(np.concatenate([rng.choice(40, 30, replace=False), 70 + rng.choice(30, 20, replace=False)]))
+    met = met.astype(float)
+    mass = rng.normal(size=len(met))
+    speed = np.where(rng.random(len(met)) < 0.3, np.nan, rng.normal(size=len(met)))
+    for sample in zip(met, mass, speed):
+        strategy.collect_data(float(sample[0]), {"mass": float(sample[1]), "speed": float(sample[2])})
+    for tier, bucket_secs in enumerate((10, 20)):
+        buckets = _buckets(strategy, tier)
+        starts = np.unique(met[met < 90 if bucket_secs == 10 else met < 80] // bucket_secs) * bucket_secs
+        np.testing.assert_array_equal(buckets.index, starts)
+        for position, start in enumerate(starts):
+            in_bucket = (met >= start) & (met < start + bucket_secs)
+            for name, values in (("mass", mass[in_bucket]), ("speed", speed[in_bucket])):
+                assert buckets.values[name][position] == pytest.approx(np.nanmean(values))
+                assert buckets.values[f"{name}_min"][position] == np.nanmin(values)
+                assert buckets.values[f"{name}_max"][position] == np.nanmax(values)
+                assert buckets.values[f"{name}_last"][position] == values[~np.isnan(values)][-1]
@@ -0,0 +1,188 @@
+import numpy as np
+import pytest
+
+from krpc_telemetry.telemetry.storage import ColumnarStorage
+
+
+def _fill(storage: ColumnarStorage, mets) -> None:
+    for met in mets:
+        storage.append(float(met), {"altitude": met * 10.0, "speed": met / 4})
+
+
+def _assert_samples(storage: ColumnarStorage, mets) -> None:
+    mets = np.asarray(mets, dtype=np.float64)
+    view = storage.view()
+    assert len(view) == len(storage) == len(mets)
+    np.testing.assert_array_equal(view.index, mets)
+    np.testing.assert_array_equal(view.values["altitude"], mets * 10.0)
+    np.testing.assert_array_equal(view.values["speed"], mets / 4)
+
+
+def test_growable_append():
+    storage = ColumnarStorage(initial_capacity=4)
+    _fill(storage, range(100))
+    _assert_samples(storage, range(100))
+
+
+def test_missing_values_are_nan():
+    storage = ColumnarStorage()
+    storage.append(0, {"altitude": 1.0})
+    storage.append(1, {"speed": 2.0})
+    view = storage.view()
+    np.testing.assert_array_equal(view.values["altitude"], [1.0, np.nan])
+    np.testing.assert_array_equal(view.values["speed"], [np.nan, 2.0])
+
+
+def test_view_is_not_changed_by_later_appends():
+    storage = ColumnarStorage(max_samples=8, block_size=4)
+    _fill(storage, range(10))
+    view = storage.view()
+    index = view.index.copy()
+    _fill(storage, range(10, 100))
+    np.testing.assert_array_equal(view.index, index)
+    assert len(view) == len(index)
+
+
+def test_compression_keeps_every_sample():
+    storage = ColumnarStorage(block_size=64)
+    _fill(storage, np.arange(1000) * 0.5)
+    assert storage.view()._blocks
+    _assert_samples(storage, np.arange(1000) * 0.5)
+
+
+def test_compression_max_samples():
+    storage = ColumnarStorage(max_samples=200, block_size=64)
+    _fill(storage, range(1000))
+    # whole blocks are dropped: at least max_samples are kept, less than one block more
+    view = storage.view()
+    assert 200 <= len(view) < 200 + 64
+    np.testing.assert_array_equal(view.index, np.arange(1000 - len(view), 1000))
+    _assert_samples(storage, range(1000 - len(view), 1000))
+
+
+def test_compression_max_age():
+    storage = ColumnarStorage(max_age_secs=100, block_size=32)
+    _fill(storage, range(1000))
+    view = storage.view()
+    assert view.first_met <= 999 - 100
+    assert view.first_met > 999 - 100 - 32
+    _assert_samples(storage, range(int(view.first_met), 1000))
+
+
+def test_compression_set_after_samples():
+    storage = ColumnarStorage()
+    _fill(storage, range(50))
+    storage.set_compression(16)
+    _fill(storage, range(50, 200))
+    assert storage.view()._blocks
+    _assert_samples(storage, range(200))
+
+
+def test_compressed_range_reads():
+    storage = ColumnarStorage(block_size=100)
+    _fill(storage, range(1000))
+    view = storage.view()
+    index, values = view.since(950.0)
+    np.testing.assert_array_equal(index, np.arange(951, 1000))
+    between = view.between(120, 180)
+    np.testing.assert_array_equal(between.index, np.arange(120, 181))
+    np.testing.assert_array_equal(between.values["altitude"], np.arange(120, 181) * 10.0)
+    chunks = list(view.chunks(250, 520, rows=100))
+    np.testing.assert_array_equal(np.concatenate([index for index, _ in chunks]), np.arange(250, 521))
+    assert all(len(index) <= 100 for index, _ in chunks)
+
+
+def test_merge_older_samples():
+    storage = ColumnarStorage()
+    _fill(storage, range(0, 20, 2))
+    storage.merge([(float(met), {"altitude": met * 10.0, "speed": met / 4}) for met in range(1, 20, 2)])
+    _assert_samples(storage, range(20))
+    assert storage.rewrites == 1
+
+
+def test_merge_newer_samples_appends():
+    storage = ColumnarStorage()
+    _fill(storage, range(10))
+    storage.merge([(float(met), {"altitude": met * 10.0, "speed": met / 4}) for met in range(10, 15)])
+    _assert_samples(storage, range(15))
+    assert storage.rewrites == 0
+
+
+def test_merge_skips_stored_mets():
+    storage = ColumnarStorage()
+    _fill(storage, range(10))
+    storage.merge([(5.0, {"altitude": -1.0, "speed": -1.0}), (5.5, {"altitude": 55.0, "speed": 5.5 / 4})])
+    _assert_samples(storage, [0, 1, 2, 3, 4, 5, 5.5, 6, 7, 8, 9])
+
+
+def test_merge_overlapping_compressed_blocks():
+    storage = ColumnarStorage(block_size=16)
+    _fill(storage, range(0, 200, 2))
+    view = storage.view()
+    assert view._blocks
+    sealed_met = view._blocks[-1].last_met
+    # the older samples overlap the sealed blocks: those are skipped, the others merged
+    storage.merge([(float(met), {"altitude": met * 10.0, "speed": met / 4}) for met in range(1, 200, 2)])
+    expected = sorted([*range(0, 200, 2), *(met for met in range(1, 200, 2) if met > sealed_met)])
+    _assert_samples(storage, expected)
+    # the blocks of the view taken before the merge are still there
+    assert len(view) == 100
+
+
+def test_merge_keeps_ring_retention():
+    storage = ColumnarStorage(max_samples=20)
+    _fill(storage, range(0, 40, 2))
+    storage.merge([(float(met), {"altitude": met * 10.0, "speed": met / 4}) for met in range(21, 40, 2)])
+    _assert_samples(storage, range(20, 40))
+
+
+def test_invalid_settings():
+    with pytest.raises(ValueError):
+        ColumnarStorage(max_samples=0)
+    with pytest.raises(ValueError):
+        ColumnarStorage(max_age_secs=-1)
+    with pytest.raises(ValueError):
+        ColumnarStorage(block_size=0)
+
+
+def test_merge_replace():
+    storage = ColumnarStorage()
+    _fill(storage, range(10))
+    merged = storage.merge([(3.0, {"altitude": -3.0, "speed": -1.0}), (3.5, {"altitude": 35.0, "speed": 3.5 / 4})],
+                           replace=True)
+    assert [met for met, _ in merged] == [3.0, 3.5]
+    view = storage.view()
+    np.testing.assert_array_equal(view.index, [0, 1, 2, 3, 3.5, 4, 5, 6, 7, 8, 9])
+    assert view.values["altitude"][3] == -3.0
+    assert view.values["speed"][4] == 3.5 / 4
+
+
+@pytest.mark.parametrize("block_size", [None, 16])
+def test_merge_more_than_max_samples(block_size):
+    storage = ColumnarStorage(max_samples=100, block_size=block_size)
+    _fill(storage, range(1000, 1010))
+    merged = storage.merge([(float(met), {"altitude": met * 10.0, "speed": met / 4}) for met in range(750, 1000)])
+    # the oldest merged samples are dropped, and not reported as stored
+    _assert_samples(storage, range(910, 1010))
+    assert [met for met, _ in merged] == list(range(910, 1000))
+    _fill(storage, range(1050, 1500))
+    _assert_samples(storage, range(1500 - len(storage), 1500))
+
+
+def test_merge_applies_the_retention_of_blocks():
+    storage = ColumnarStorage(max_samples=100, block_size=16)
+    _fill(storage, range(0, 300, 2))
+    storage.merge([(float(met), {"altitude": met * 10.0, "speed": met / 4}) for met in range(281, 300, 2)])
+    assert 100 <= len(storage) < 100 + 16
+    storage.merge([(float(met), {"altitude": met * 10.0, "speed": met / 4}) for met in range(300, 600)])
+    _assert_samples(storage, range(600 - len(storage), 600))
+
+
+def test_compression_keeps_one_block_uncompressed():
+    storage = ColumnarStorage(block_size=64)
+    _fill(storage, range(1000))
+    view = storage.view()
+    assert len(view._index) < 64
+    assert all(block.count == 64 for block in view._blocks)
+    # the arrays only have room for the block being filled
+    assert storage.nbytes <= 3 * 64 * 8 + sum(block.nbytes for block in view._blocks)
@@ -0,0 +1,56 @@
+from benchmarks.fake_krpc import FakeKrpcConnection
+from krpc_telemetry.vessels import MultiVesselTelemetry, VesselSelector, create_selectors
+
+
+def test_selectors():
+    connection = FakeKrpcConnection()
+    relay = connection.add_vessel("Relay 1")
+    vessel = connection.space_center.active_vessel
+    assert VesselSelector(active=True).matches(vessel, vessel.name, True)
+    assert not VesselSelector(active=True).matches(relay, relay.name, False)
+    assert VesselSelector(vessel=relay).matches(relay, relay.name, False)
+    assert not VesselSelector(vessel=relay).matches(vessel, vessel.name, True)
+    assert VesselSelector(name="Relay 1").matches(relay, relay.name, False)
+    assert VesselSelector(name_pattern="Relay *").matches(relay, relay.name, False)
+    assert not VesselSelector(name_pattern="relay *").matches(relay, relay.name, False)
+    assert create_selectors([dict(active=True), dict(name="Relay 1")]) == \
+           [VesselSelector(active=True), VesselSelector(name="Relay 1")]
+
+
+def test_every_matching_vessel_is_tracked(fake_connection, telemetry_config):
+    connection = fake_connection
+    connection.add_vessel("Relay")
+    connection.add_vessel("Relay")
+    connection.add_vessel("Probe")
+    tracker = MultiVesselTelemetry(connection, telemetry_config, [VesselSelector(active=True),
+                                                                  VesselSelector(name="Relay")])
+    tracker.discover()
+    try:
+        assert sorted(tracker.vessels) == ["fake-vessel", "relay", "relay-2"]
+        assert tracker.active_key == "fake-vessel"
+        for _ in range(3):
+            connection.tick(1)
+            tracker.collect()
+        assert all(len(tracker.get_processor(key).strategies[0].storage) for key in tracker.vessels)
+    finally:
+        for tracked in tracker.vessels.values():
+            tracked.processor.stop_outputs()
+
+
+def test_shared_render_pool_is_owned_by_the_tracker(fake_connection, telemetry_config):
+    connection = fake_connection
+    connection.add_vessel("Relay")
+    tracker = MultiVesselTelemetry(connection, dict(telemetry_config, render_pool=dict(workers=1)),
+                                   [VesselSelector(name_pattern="*")])
+    tracker.start()
+    try:
+        pools = {tracked.processor.render_pool for tracked in tracker.vessels.values()}
+        assert len(tracker.vessels) == 2 and len(pools) == 1
+        pool = pools.pop()
+        assert pool.started
+        # a vessel going away stops its outputs, not the pool the others use
+        next(iter(tracker.vessels.values())).processor.stop_outputs()
+        assert pool.started
+    finally:
+        tracker.stop()
+    assert not pool.started